@@ -0,0 +1,453 @@
+import asyncio
+import datetime
+import uuid
+
+import asyncpg
+from psycopg2.extensions import parse_dsn
+
+import db_utils
+from db_pool import load_config
+from query_trace import traced_async
+from db_utils import (
+    LOAN_DAYS, BOOKS_QUERY, STUDENTS_QUERY, UNPAID_FINES_QUERY,
+    book_id_cache, student_id_cache, encode_page_token, decode_page_token,
+    invalidate_books, invalidate_students,
+)
+
+# Async counterparts of the db_utils functions for the kiosk service. They return
+# rows as lists of tuples (db_utils.fetch_books/fetch_students give read-only
+# records that index the same way), (success, message) pairs and ids as strings,
+# and share its id lookup caches (and invalidate its catalog cache on writes),
+# but run on their own asyncpg pool.
+_pool = None
+_pool_lock = None
+
+
+def _lock():
+    # Created on first use so it belongs to the running event loop, not to import time.
+    global _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    return _pool_lock
+
+
+def _connect_kwargs(dsn):
+    """Translate a libpq key=value DSN (as used by db_pool) into asyncpg.connect arguments."""
+    if dsn.startswith(("postgres://", "postgresql://")):
+        return {"dsn": dsn}
+    params = parse_dsn(dsn)
+    if "dbname" in params:
+        params["database"] = params.pop("dbname")
+    if "port" in params:
+        params["port"] = int(params["port"])
+    return params
+
+
+async def _init_connection(connection):
+    # Return uuids as strings, like psycopg2 does, so results and cache keys match db_utils.
+    await connection.set_type_codec("uuid", encoder=str, decoder=str, schema="pg_catalog", format="text")
+
+
+async def _create_pool(overrides):
+    config = load_config()
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    server_settings = {}
+    if config["statement_timeout_ms"]:
+        server_settings["statement_timeout"] = str(int(config["statement_timeout_ms"]))
+    return await asyncpg.create_pool(
+        min_size=config["minconn"],
+        max_size=config["maxconn"],
+        server_settings=server_settings,
+        init=_init_connection,
+        **_connect_kwargs(config["dsn"]),
+    )
+
+
+async def init_pool(**overrides):
+    """(Re)create the asyncpg pool; keyword arguments override the db_pool environment config."""
+    global _pool
+    async with _lock():
+        if _pool is not None:
+            await _pool.close()
+        _pool = await _create_pool(overrides)
+    return _pool
+
+
+async def get_pool():
+    """Return the shared asyncpg pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        async with _lock():
+            # Concurrent first callers wait here; only the first one creates the pool.
+            if _pool is None:
+                _pool = await _create_pool({})
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    async with _lock():
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    if _pool is None:
+        return {}
+    return {
+        "minconn": _pool.get_min_size(),
+        "maxconn": _pool.get_max_size(),
+        "size": _pool.get_size(),
+        "idle": _pool.get_idle_size(),
+    }
+
+
+async def fetch_all(query, *args):
+    pool = await get_pool()
+    rows = await traced_async(pool.fetch, query, *args)
+    return [tuple(row) for row in rows]
+
+
+async def execute_query(query, *args):
+    """Execute any statement; errors are printed, like db_utils.execute_query."""
+    try:
+        pool = await get_pool()
+        await traced_async(pool.execute, query, *args)
+    except asyncpg.PostgresError as e:
+        print(f"Error executing query: {e}")
+
+
+async def fetch_value(query, *args):
+    """Run a statement and return the first column of its first row; errors are printed and give None."""
+    try:
+        pool = await get_pool()
+        return await traced_async(pool.fetchval, query, *args)
+    except asyncpg.PostgresError as e:
+        print(f"Error executing query: {e}")
+        return None
+
+
+async def _resolve_id(cache, query, key):
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    pool = await get_pool()
+    value = await traced_async(pool.fetchval, query, key)
+    if value is not None:
+        cache.put(key, value)
+    return value
+
+
+async def resolve_book_id(title):
+    return await _resolve_id(book_id_cache, "SELECT book_id FROM Books WHERE title = $1 ORDER BY book_id LIMIT 1", title)
+
+
+async def resolve_student_id(name):
+    return await _resolve_id(student_id_cache, "SELECT student_id FROM Students WHERE name = $1 ORDER BY student_id LIMIT 1", name)
+
+
+async def fetch_books():
+    """Retrieve the list of books from the database."""
+    try:
+        return await fetch_all(BOOKS_QUERY)
+    except asyncpg.PostgresError as e:
+        print(f"Error fetching books: {e}")
+        return []
+
+
+async def fetch_students():
+    """Retrieve the list of students from the database."""
+    try:
+        return await fetch_all(STUDENTS_QUERY)
+    except asyncpg.PostgresError as e:
+        print(f"Error fetching students: {e}")
+        return []
+
+
+async def load_books_and_students():
+    """Fetch books and students concurrently on two pooled connections."""
+    return await asyncio.gather(fetch_books(), fetch_students())
+
+
+async def _fetch_keyset_page(table, columns, sort_column, id_column, page_token, page_size, with_total):
+    """Async version of db_utils._fetch_keyset_page; page tokens are interchangeable."""
+    key, direction = decode_page_token(page_token) if page_token else (None, "after")
+    select_list = ", ".join(columns)
+    if key is None:
+        query = f"SELECT {select_list} FROM {table} ORDER BY {sort_column}, {id_column} LIMIT $1"
+        args = (page_size + 1,)
+    elif direction == "after":
+        query = f"""
+            SELECT {select_list} FROM {table}
+            WHERE ({sort_column}, {id_column}) > ($1, $2)
+            ORDER BY {sort_column}, {id_column} LIMIT $3
+        """
+        args = (key[0], key[1], page_size + 1)
+    else:
+        query = f"""
+            SELECT {select_list} FROM {table}
+            WHERE ({sort_column}, {id_column}) < ($1, $2)
+            ORDER BY {sort_column} DESC, {id_column} DESC LIMIT $3
+        """
+        args = (key[0], key[1], page_size + 1)
+
+    if with_total:
+        rows, total = await asyncio.gather(
+            fetch_all(query, *args),
+            traced_async((await get_pool()).fetchval, f"SELECT count(*) FROM {table}"),
+        )
+    else:
+        rows, total = await fetch_all(query, *args), None
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == "before":
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = key is not None, has_more
+
+    sort_index = columns.index(sort_column)
+    id_index = columns.index(id_column)
+    next_token = prev_token = None
+    if rows and has_next:
+        next_token = encode_page_token((rows[-1][sort_index], rows[-1][id_index]), "after")
+    if rows and has_prev:
+        prev_token = encode_page_token((rows[0][sort_index], rows[0][id_index]), "before")
+    return {"rows": rows, "next_token": next_token, "prev_token": prev_token, "total": total}
+
+
+async def fetch_books_page(page_token=None, page_size=10, with_total=False):
+    columns = ("book_id", "title", "author", "copies_available", "category")
+    return await _fetch_keyset_page("Books", columns, "title", "book_id", page_token, page_size, with_total)
+
+
+async def fetch_students_page(page_token=None, page_size=10, with_total=False):
+    columns = ("student_id", "name", "email", "phone", "department")
+    return await _fetch_keyset_page("Students", columns, "name", "student_id", page_token, page_size, with_total)
+
+
+async def insert_book(title, author, isbn, copies, category='Other'):
+    """Insert a new book into the database and return its book_id (None if the insert failed)."""
+    book_id = await fetch_value("""
+        INSERT INTO Books (book_id, title, author, isbn, copies_available, category)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING book_id
+    """, str(uuid.uuid4()), title, author, db_utils.compact_isbn(isbn), copies, category)
+    invalidate_books()
+    return None if book_id is None else str(book_id)
+
+
+async def update_book(book_id, new_title, new_author, new_copies, new_category):
+    try:
+        uuid.UUID(str(book_id), version=4)
+    except ValueError:
+        raise ValueError("Invalid UUID for book_id")
+    await execute_query(
+        "UPDATE Books SET title = $1, author = $2, copies_available = $3, category = $4 WHERE book_id = $5",
+        new_title, new_author, new_copies, new_category, str(book_id))
+    book_id_cache.invalidate_value(str(book_id))
+    invalidate_books()
+
+
+async def update_book_inventory(book_title, new_inventory):
+    """Update the inventory of a book based on its title."""
+    await execute_query("UPDATE Books SET copies_available = $1 WHERE title = $2", new_inventory, book_title)
+    invalidate_books()
+
+
+async def delete_book(title):
+    """Delete a book from the database based on its title."""
+    await execute_query("DELETE FROM Books WHERE title = $1", title)
+    book_id_cache.invalidate(title)
+    invalidate_books()
+
+
+async def fetch_filtered_books(query):
+    """Retrieve books based on the provided query."""
+    try:
+        return await fetch_all(query)
+    except asyncpg.PostgresError as e:
+        print(f"Error fetching filtered books: {e}")
+        return []
+
+
+async def insert_student(name, email, phone, department):
+    """Insert a new student into the database and return its student_id (None if the insert failed)."""
+    student_id = await fetch_value("""
+        INSERT INTO Students (student_id, name, email, phone, department)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING student_id
+    """, str(uuid.uuid4()), name, email, phone, department)
+    invalidate_students()
+    return None if student_id is None else str(student_id)
+
+
+async def update_student(student_id, name, email, phone, department):
+    """Update student information in the database."""
+    await execute_query("""
+        UPDATE Students
+        SET name = $1, email = $2, phone = $3, department = $4
+        WHERE student_id = $5
+    """, name, email, phone, department, str(student_id))
+    student_id_cache.invalidate_value(str(student_id))
+    invalidate_students()
+
+
+async def delete_student(name):
+    """Delete a student from the database based on their name."""
+    await execute_query("DELETE FROM Students WHERE name = $1", name)
+    student_id_cache.invalidate(name)
+    invalidate_students()
+
+
+async def fetch_filtered_students(query):
+    """Retrieve students based on name or department."""
+    pattern = f"%{query}%"
+    try:
+        return await fetch_all("""
+            SELECT student_id, name, email, phone, department
+            FROM Students
+            WHERE name ILIKE $1 OR department ILIKE $1
+        """, pattern)
+    except asyncpg.PostgresError as e:
+        print(f"Error fetching filtered students: {e}")
+        return []
+
+
+async def check_book_availability(title):
+    """Check if a book is available based on its title."""
+    try:
+        pool = await get_pool()
+        copies = await traced_async(pool.fetchval, "SELECT copies_available FROM Books WHERE title = $1", title)
+        return bool(copies and copies > 0)
+    except asyncpg.PostgresError as e:
+        print(f"Error checking book availability: {e}")
+        return False
+
+
+LEND_BOOK_SQL = """
+    WITH taken AS (
+        UPDATE Books
+        SET copies_available = copies_available - 1
+        WHERE book_id = $1 AND copies_available > 0
+        RETURNING book_id
+    ), borrow AS (
+        INSERT INTO Borrows (borrow_id, book_id, student_id, borrow_date, return_date)
+        SELECT $3, taken.book_id, $2, $4, $5
+        FROM taken
+        RETURNING borrow_id
+    )
+    SELECT EXISTS (SELECT 1 FROM borrow)
+"""
+
+RETURN_BOOK_SQL = """
+    WITH returned AS (
+        UPDATE Borrows br
+        SET actual_return_date = $1::date,
+            fine = LEAST(
+                GREATEST($1::date - br.return_date - $5::integer, 0)
+                * COALESCE(($7::jsonb ->> (SELECT category FROM Books WHERE book_id = br.book_id))::numeric, $2::numeric),
+                $6::numeric)
+        WHERE br.actual_return_date IS NULL AND br.borrow_id = (
+            SELECT borrow_id
+            FROM Borrows
+            WHERE book_id = $3 AND student_id = $4
+              AND actual_return_date IS NULL
+            ORDER BY borrow_date
+            LIMIT 1
+        )
+        RETURNING br.book_id, br.fine
+    ), restocked AS (
+        UPDATE Books b
+        SET copies_available = b.copies_available + 1
+        FROM returned
+        WHERE b.book_id = returned.book_id
+    )
+    SELECT (SELECT fine FROM returned)
+"""
+
+
+async def lend_book(book_title, student_name):
+    """Lend a book to a student in one statement (see db_utils.lend_book)."""
+    today = datetime.date.today()
+    return_date = today + datetime.timedelta(days=LOAN_DAYS)
+    try:
+        book_id, student_id = await asyncio.gather(resolve_book_id(book_title), resolve_student_id(student_name))
+        if not book_id:
+            return False, "Book not found."
+        if not student_id:
+            return False, "Student not found."
+        pool = await get_pool()
+        lent = await traced_async(pool.fetchval, LEND_BOOK_SQL, book_id, student_id, str(uuid.uuid4()), today, return_date)
+    except asyncpg.PostgresError as e:
+        print(f"Error lending book: {e}")
+        return False, f"An error occurred: {e}"
+
+    if not lent:
+        book_id_cache.invalidate(book_title)
+        return False, "Book is not available."
+    invalidate_books()
+    return True, f"Book lent successfully! Return by {return_date}."
+
+
+async def return_book(book_title, student_name):
+    """Return a book and calculate the fine if delayed (see db_utils.return_book)."""
+    try:
+        book_id, student_id = await asyncio.gather(resolve_book_id(book_title), resolve_student_id(student_name))
+        if not book_id:
+            return False, "Book not found."
+        if not student_id:
+            return False, "Student not found."
+        pool = await get_pool()
+        policy = db_utils.fine_policy.sql_params()
+        fine = await traced_async(
+            pool.fetchval,
+            RETURN_BOOK_SQL, datetime.date.today(), policy["fine_per_day"], book_id, student_id,
+            policy["grace_days"], policy["max_fine"], policy["category_rates"],
+        )
+    except asyncpg.PostgresError as e:
+        print(f"Error returning book: {e}")
+        return False, f"An error occurred: {e}"
+
+    if fine is None:
+        return False, "No active borrow record found."
+    invalidate_books()
+    return True, f"Book returned successfully! Fine: {fine}."
+
+
+async def fetch_unpaid_fines():
+    """Display a list of unpaid fines."""
+    try:
+        return await fetch_all(UNPAID_FINES_QUERY)
+    except asyncpg.PostgresError as e:
+        print(f"Error fetching unpaid fines: {e}")
+        return []
+
+
+async def pay_fine(student_name, book_title):
+    """Pay fine and update the fine payment status."""
+    try:
+        book_id, student_id = await asyncio.gather(resolve_book_id(book_title), resolve_student_id(student_name))
+        if not book_id:
+            return False, "Book not found."
+        if not student_id:
+            return False, "Student not found."
+        pool = await get_pool()
+        await traced_async(pool.execute, """
+            UPDATE Borrows
+            SET paid = TRUE
+            WHERE student_id = $1 AND book_id = $2 AND paid = FALSE
+        """, student_id, book_id)
+        return True, "Fine paid successfully."
+    except asyncpg.PostgresError as e:
+        print(f"Error paying fine: {e}")
+        return False, f"An error occurred: {e}"
+
+
+async def insert_borrow(book_id, student_id, borrow_date, return_date):
+    await execute_query("""
+        INSERT INTO Borrows (borrow_id, book_id, student_id, borrow_date, return_date)
+        VALUES ($1, $2, $3, $4, $5)
+    """, str(uuid.uuid4()), str(book_id), str(student_id), borrow_date, return_date)
@@ -0,0 +1,197 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import psycopg2
+import psycopg2.extensions
+from faker import Faker
+
+import db_pool
+import db_utils
+import migrations
+from insert_data import generate_students, generate_books, copy_chunk, STUDENT_COLUMNS, BOOK_COLUMNS
+
+# Rows seeded per scale factor; scale 10 means 10x these counts.
+BASE_STUDENTS = 1000
+BASE_BOOKS = 500
+
+def recreate_database(admin_dsn, name):
+    """Drop and recreate the throwaway benchmark database."""
+    connection = psycopg2.connect(admin_dsn)
+    connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{name}"')
+            cursor.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        connection.close()
+
+
+def bench_dsn(admin_dsn, name):
+    params = psycopg2.extensions.parse_dsn(admin_dsn)
+    params["dbname"] = name
+    return " ".join(f"{key}={value}" for key, value in params.items())
+
+
+def seed(scale, seed_value):
+    """Migrate the schema and load scale * BASE rows with the insert_data generators."""
+    faker = Faker()
+    faker.seed_instance(seed_value)
+    rng = random.Random(seed_value)
+    students = generate_students(BASE_STUDENTS * scale, faker, rng)
+    books = generate_books(BASE_BOOKS * scale, faker, rng, isbn_start=0)
+    migrations.migrate()
+    with db_pool.get_connection() as connection:
+        for table, columns, rows in (("Students", STUDENT_COLUMNS, students), ("Books", BOOK_COLUMNS, books)):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            copy_chunk(connection, table, columns, buffer.getvalue())
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        connection.commit()
+    return students, books
+
+
+def measure(fn, args_list, warmup):
+    """Call fn once per args tuple and return latency percentiles and throughput."""
+    for args in args_list[:warmup]:
+        fn(*args)
+    timings = []
+    started = time.perf_counter()
+    for args in args_list[warmup:]:
+        call_started = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(round(p / 100 * (len(timings) - 1))))] * 1000
+
+    return {
+        "calls": len(timings),
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": timings[-1] * 1000,
+        "ops_per_sec": len(timings) / elapsed if elapsed else 0.0,
+    }
+
+
+def keyset_walk(fetch_page, pages, page_size):
+    """Fetch `pages` consecutive keyset pages starting from the first."""
+    token = None
+    for _ in range(pages):
+        page = fetch_page(token, page_size)
+        token = page["next_token"]
+        if token is None:
+            break
+
+
+def fetch_books_cold():
+    """fetch_books with the catalog cache dropped first, so every call reads Books."""
+    db_utils.invalidate_books()
+    return db_utils.fetch_books()
+
+
+def run_cases(students, books, iterations, warmup, rng):
+    names = [student[1] for student in students]
+    titles = [book[1] for book in books if book[4] > 0]
+    departments = sorted({student[4] for student in students})
+    total = iterations + warmup
+    deep_page = max(1, len(books) // 10 // 2)
+    pairs = [(rng.choice(titles), rng.choice(names)) for _ in range(total)]
+
+    cases = {}
+    cases["fetch_books"] = measure(fetch_books_cold, [()] * max(5, total // 20), min(warmup, 2))
+    cases["fetch_books_cached"] = measure(db_utils.fetch_books, [()] * total, warmup)
+    cases["fetch_filtered_students"] = measure(
+        db_utils.fetch_filtered_students,
+        [(rng.choice(departments + [name.split()[0] for name in names[:50]]),) for _ in range(total)], warmup)
+    cases["fetch_books_paginated_deep"] = measure(db_utils.fetch_books_paginated, [(deep_page, 10)] * total, warmup)
+    cases["fetch_students_paginated_deep"] = measure(db_utils.fetch_students_paginated, [(deep_page, 10)] * total, warmup)
+    cases["fetch_books_page_walk"] = measure(keyset_walk, [(db_utils.fetch_books_page, 10, 10)] * max(5, total // 10), min(warmup, 2))
+    cases["fetch_students_page_walk"] = measure(keyset_walk, [(db_utils.fetch_students_page, 10, 10)] * max(5, total // 10), min(warmup, 2))
+    cases["lend_book"] = measure(db_utils.lend_book, pairs, warmup)
+    cases["return_book"] = measure(db_utils.return_book, pairs, warmup)
+    cases["pay_fine"] = measure(db_utils.pay_fine, [(name, title) for title, name in pairs], warmup)
+    return cases
+
+
+def compare(current, baseline, threshold):
+    """Print per-case p50/p95 changes against a saved baseline; return True if any regressed."""
+    regressed = False
+    for scale, cases in current["results"].items():
+        for case, stats in cases.items():
+            base = baseline.get("results", {}).get(scale, {}).get(case)
+            if not base:
+                continue
+            for metric in ("p50_ms", "p95_ms"):
+                change = (stats[metric] - base[metric]) / base[metric] * 100 if base[metric] else 0.0
+                flag = ""
+                if change > threshold:
+                    flag = "  REGRESSION"
+                    regressed = True
+                print(f"scale {scale:>4} {case:<32} {metric}: {base[metric]:9.3f} -> {stats[metric]:9.3f} ms ({change:+.1f}%){flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the db_utils hot paths against a throwaway database.")
+    parser.add_argument("--admin-dsn", default="dbname=postgres user=postgres host=localhost port=5432",
+                        help="DSN with rights to create the scratch database")
+    parser.add_argument("--database", default="library_bench", help="scratch database name (dropped and recreated)")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10], help="scale factors to seed")
+    parser.add_argument("--iterations", type=int, default=200, help="measured calls per case")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured warmup calls per case")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for data and workload")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+    for scale in args.scales:
+        recreate_database(args.admin_dsn, args.database)
+        db_pool.init_pool(dsn=bench_dsn(args.admin_dsn, args.database))
+        db_utils.book_id_cache.clear()
+        db_utils.student_id_cache.clear()
+        students, books = seed(scale, args.seed)
+        print(f"scale {scale}: seeded {len(students):,} students and {len(books):,} books", file=sys.stderr)
+        cases = run_cases(students, books, args.iterations, args.warmup, random.Random(args.seed))
+        report["results"][str(scale)] = cases
+        for case, stats in cases.items():
+            print(f"scale {scale:>4} {case:<32} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+                  f"p99 {stats['p99_ms']:8.3f} ms  {stats['ops_per_sec']:9.1f} ops/s")
+        db_pool.close_pool()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
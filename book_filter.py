@@ -0,0 +1,124 @@
+import bisect
+import sys
+import threading
+from array import array
+
+# Columns of a catalog row, as returned by db_utils.catalog_books().
+BOOK_ID, TITLE, AUTHOR, COPIES, CATEGORY = range(5)
+
+
+class BookIndex:
+    """The book catalog held in memory with precomputed filter indexes.
+
+    store is the catalog ColumnView ordered by title (db_utils.catalog_books()).
+    Each category and each stock state maps to an array of the ascending row
+    positions it covers, so a category/stock filter is a lookup plus at most
+    one intersection, and its result is already in title order. Text
+    narrowing searches one lowercased string of every title and author.
+    Other sort orders are computed once per column on first use.
+    """
+
+    def __init__(self, store):
+        self.rows = store
+        codes, values = store.enum("category")
+        by_code = [array("I") for _ in values]
+        for position, code in enumerate(codes):
+            by_code[code].append(position)
+        self.categories = dict(zip(values, by_code))
+        self.in_stock = array("I")
+        self.out_of_stock = array("I")
+        for position, copies in enumerate(store.ints("copies_available")):
+            (self.in_stock if copies > 0 else self.out_of_stock).append(position)
+        # NUL cannot occur in PostgreSQL text, so "title\0author" keeps a
+        # needle from matching across the title/author boundary (like the
+        # SQL fallback's title ILIKE ... OR author ILIKE ...).
+        pieces = [
+            f"{title or ''}\0{author or ''}".lower()
+            for title, author in zip(store.texts("title"), store.texts("author"))
+        ]
+        # Row p's text is _text[_starts[p]:_starts[p + 1] - 1]; the last entry is a sentinel.
+        self._starts = array("Q", [0])
+        for piece in pieces:
+            self._starts.append(self._starts[-1] + len(piece) + 1)
+        self._text = "\0".join(pieces)
+        self._ranks = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _candidates(self, category, in_stock):
+        lists = []
+        if category is not None:
+            lists.append(self.categories.get(category, ()))
+        if in_stock is not None:
+            lists.append(self.in_stock if in_stock else self.out_of_stock)
+        if not lists:
+            return None
+        lists.sort(key=len)
+        if len(lists) == 1:
+            return lists[0]
+        other = set(lists[1])
+        return [position for position in lists[0] if position in other]
+
+    def _row_text(self, position):
+        return self._text[self._starts[position]:self._starts[position + 1] - 1]
+
+    def _text_matches(self, needle):
+        """Ascending positions of the rows whose title/author contains needle."""
+        matches = []
+        found = self._text.find(needle)
+        while found >= 0:
+            position = bisect.bisect_right(self._starts, found) - 1
+            matches.append(position)
+            found = self._text.find(needle, self._starts[position + 1])
+        return matches
+
+    def _rank(self, column):
+        """Position -> rank of the row when sorted by column (built once per column)."""
+        with self._lock:
+            rank = self._ranks.get(column)
+            if rank is None:
+                name = self.rows.names[column]
+                order = sorted(range(len(self.rows)), key=lambda position: (
+                    self.rows.value(name, position) is None, self.rows.value(name, position)))
+                rank = array("I", bytes(4 * len(order)))
+                for number, position in enumerate(order):
+                    rank[position] = number
+                self._ranks[column] = rank
+            return rank
+
+    def filter(self, category=None, in_stock=None, text=None, sort_column=TITLE, descending=False):
+        """Return the catalog rows (record views) matching every given filter.
+
+        category is an exact category name, in_stock True/False selects books
+        with/without available copies and text keeps rows whose title or
+        author contains it (case-insensitive). None means "no filter".
+        """
+        positions = self._candidates(category, in_stock)
+        needle = (text or "").strip().lower().replace("\0", "")
+        if needle:
+            if positions is not None and len(positions) * 8 < len(self.rows):
+                positions = [position for position in positions if needle in self._row_text(position)]
+            else:
+                matches = self._text_matches(needle)
+                if positions is not None:
+                    allowed = set(positions)
+                    matches = [position for position in matches if position in allowed]
+                positions = matches
+        if positions is None:
+            positions = range(len(self.rows))
+        if sort_column != TITLE:
+            positions = sorted(positions, key=self._rank(sort_column).__getitem__)
+        if descending:
+            positions = reversed(positions)
+        rows = self.rows
+        return [rows.record(rows, position) for position in positions]
+
+    def memory_footprint(self):
+        """Bytes held by the filter indexes (the rows themselves are in the ColumnStore)."""
+        size = sys.getsizeof(self._text) + sys.getsizeof(self._starts)
+        size += sys.getsizeof(self.in_stock) + sys.getsizeof(self.out_of_stock)
+        size += sum(sys.getsizeof(positions) for positions in self.categories.values())
+        size += sum(sys.getsizeof(rank) for rank in self._ranks.values())
+        return size
@@ -0,0 +1,266 @@
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+
+from db_pool import get_connection
+from db_utils import book_id_cache, compact_isbn, invalidate_books
+
+CATALOG_COLUMNS = ("title", "author", "isbn", "copies_available", "category")
+
+# Rows of one chunk are COPYed here and merged into Books with one upsert;
+# the table empties itself at the end of every chunk's transaction.
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS catalog_import (
+        line bigint,
+        title varchar,
+        author varchar,
+        isbn varchar,
+        copies_available integer,
+        category varchar
+    ) ON COMMIT DELETE ROWS
+"""
+
+# DISTINCT ON keeps the last occurrence of an ISBN within a chunk (one row
+# cannot be upserted twice by the same statement), and rows that would not
+# change are left alone so they are not rewritten.
+UPSERT_SQL = """
+    WITH upserted AS (
+        INSERT INTO Books (book_id, title, author, isbn, copies_available, category)
+        SELECT DISTINCT ON (isbn) gen_random_uuid(), title, author, isbn, copies_available, category
+        FROM catalog_import
+        ORDER BY isbn, line DESC
+        ON CONFLICT (isbn) DO UPDATE
+        SET title = EXCLUDED.title,
+            author = EXCLUDED.author,
+            copies_available = EXCLUDED.copies_available,
+            category = EXCLUDED.category
+        WHERE (Books.title, Books.author, Books.copies_available, Books.category)
+              IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.author, EXCLUDED.copies_available, EXCLUDED.category)
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+
+# Per-row change notifications are skipped while library.bulk_load is on
+# (migration 7); listeners get one RELOAD per chunk instead.
+RELOAD_NOTIFY_SQL = """SELECT pg_notify('library_changes', '{"table": "books", "op": "RELOAD"}')"""
+
+EXPORT_QUERY = "SELECT title, author, isbn, copies_available, category FROM Books ORDER BY isbn"
+
+# COPY's csv format only quotes fields containing the QUOTE or DELIMITER
+# characters; JSON text never contains raw control characters, so with
+# these two the JSON documents come out exactly as the server built them.
+EXPORT_SQL = {
+    "csv": f"COPY ({EXPORT_QUERY}) TO STDOUT WITH (FORMAT csv, HEADER)",
+    "jsonl": f"COPY (SELECT row_to_json(b)::text FROM ({EXPORT_QUERY}) b) TO STDOUT "
+             "WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')",
+}
+
+_ISBN = re.compile(r"^(\d{9}[\dX]|\d{13})$")
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass csv or jsonl explicitly")
+
+
+def read_records(stream, fmt):
+    """Yield (line_number, record dict) from a CSV file with a header row or a JSON Lines file."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, e
+
+
+def normalize_isbn(isbn):
+    """Return an ISBN-10 or ISBN-13 as bare digits (check digit X upper-cased), or None if it is invalid.
+
+    Hyphens and spaces are dropped (db_utils.compact_isbn, the form Books.isbn
+    holds) so differently formatted feeds upsert the same row.
+    """
+    digits = compact_isbn(isbn)
+    if not _ISBN.match(digits):
+        return None
+    if len(digits) == 13:
+        valid = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10 == 0
+    else:
+        valid = sum((10 - i) * (10 if d == "X" else int(d)) for i, d in enumerate(digits)) % 11 == 0
+    return digits if valid else None
+
+
+def validate_record(record):
+    """Return the record as a catalog row tuple, or raise ValueError saying what is wrong with it."""
+    if isinstance(record, Exception):
+        raise ValueError(f"invalid JSON: {record}")
+    if not isinstance(record, dict):
+        raise ValueError("expected an object")
+
+    def text(name):
+        value = record.get(name)
+        value = "" if value is None else str(value).strip()
+        return value or None
+
+    title = text("title")
+    isbn = text("isbn")
+    if not title:
+        raise ValueError("title is required")
+    if not isbn:
+        raise ValueError("isbn is required")
+    normalized = normalize_isbn(isbn)
+    if not normalized:
+        raise ValueError(f"invalid isbn {isbn!r}")
+    copies = text("copies_available") or "0"
+    try:
+        copies = int(copies)
+    except ValueError:
+        raise ValueError(f"copies_available must be a whole number, got {copies!r}") from None
+    if copies < 0:
+        raise ValueError("copies_available cannot be negative")
+    return title, text("author"), normalized, copies, text("category")
+
+
+def iter_chunks(records, chunk_size, on_reject):
+    """Validate records and yield them as CSV text chunks of up to chunk_size rows for COPY."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for line_number, record in records:
+        try:
+            row = validate_record(record)
+        except ValueError as e:
+            on_reject(line_number, str(e))
+            continue
+        writer.writerow((line_number,) + row)
+        count += 1
+        if count == chunk_size:
+            yield count, buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if count:
+        yield count, buffer.getvalue()
+
+
+def load_chunk(connection, csv_text):
+    """COPY one validated chunk into the staging table and upsert it into Books; returns (inserted, updated)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        cursor.execute("SET LOCAL library.bulk_load = 'on'")
+        cursor.copy_expert(
+            f"COPY catalog_import (line, {', '.join(CATALOG_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            io.StringIO(csv_text),
+        )
+        cursor.execute(UPSERT_SQL)
+        inserted, updated = cursor.fetchone()
+        cursor.execute(RELOAD_NOTIFY_SQL)
+    connection.commit()
+    return inserted, updated
+
+
+def import_catalog(path, fmt=None, chunk_size=50_000, rejects=None):
+    """Stream a CSV or JSON Lines catalog into Books, upserting on ISBN.
+
+    Records are validated and loaded chunk_size at a time, each chunk in its
+    own transaction, so memory stays flat and a failure only loses the chunk
+    it happened in. Invalid records are skipped; with rejects set they are
+    written there as CSV (line, reason). path "-" reads standard input.
+    Returns {"read", "inserted", "updated", "unchanged", "rejected"}.
+    """
+    fmt = detect_format(path, fmt) if path != "-" else (fmt or "csv")
+    stats = {"read": 0, "inserted": 0, "updated": 0, "unchanged": 0, "rejected": 0}
+    rejects_file = open(rejects, "w", newline="", encoding="utf-8") if rejects else None
+    rejects_writer = csv.writer(rejects_file) if rejects_file else None
+
+    def on_reject(line_number, reason):
+        stats["rejected"] += 1
+        if rejects_writer:
+            rejects_writer.writerow((line_number, reason))
+
+    source = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+    started = time.perf_counter()
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(STAGING_TABLE_SQL)
+            connection.commit()
+            for count, csv_text in iter_chunks(read_records(source, fmt), chunk_size, on_reject):
+                inserted, updated = load_chunk(connection, csv_text)
+                stats["read"] += count
+                stats["inserted"] += inserted
+                stats["updated"] += updated
+                stats["unchanged"] += count - inserted - updated
+                elapsed = time.perf_counter() - started
+                print(f"Books: {stats['read']:,} rows ({stats['read'] / elapsed:,.0f} rows/sec)", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if rejects_file:
+            rejects_file.close()
+        # Titles may have changed or been added under this process's caches.
+        book_id_cache.clear()
+        invalidate_books()
+    return stats
+
+
+def export_catalog(path, fmt=None):
+    """Write every book to a CSV (with header) or JSON Lines file with COPY TO; returns the row count.
+
+    The server formats the rows and they are written to the file as they
+    arrive. path "-" writes to standard output.
+    """
+    fmt = detect_format(path, fmt) if path != "-" else (fmt or "csv")
+    target = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = 0")
+                cursor.copy_expert(EXPORT_SQL[fmt], target)
+                return cursor.rowcount
+    finally:
+        if target is not sys.stdout:
+            target.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export the book catalog as CSV or JSON Lines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="upsert books from a file, keyed on ISBN")
+    importer.add_argument("path", help="catalog file, or - for standard input")
+    importer.add_argument("--format", choices=["csv", "jsonl"], default=None, help="default: from the file extension")
+    importer.add_argument("--chunk-size", type=int, default=50_000, help="rows validated and loaded per transaction")
+    importer.add_argument("--rejects", default=None, help="write rejected lines and reasons to this CSV file")
+    exporter = commands.add_parser("export", help="write every book to a file")
+    exporter.add_argument("path", help="output file, or - for standard output")
+    exporter.add_argument("--format", choices=["csv", "jsonl"], default=None, help="default: from the file extension")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        stats = import_catalog(args.path, args.format, args.chunk_size, args.rejects)
+        print(f"Read {stats['read']:,} books: {stats['inserted']:,} inserted, {stats['updated']:,} updated, "
+              f"{stats['unchanged']:,} unchanged, {stats['rejected']:,} rejected.", file=sys.stderr)
+        return 1 if stats["rejected"] else 0
+    count = export_catalog(args.path, args.format)
+    print(f"Exported {count:,} books.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+import json
+import select
+import time
+
+import psycopg2
+import psycopg2.extensions
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import migrations
+from db_pool import load_config
+
+CHANNEL = "library_changes"
+
+
+def install_triggers():
+    """Create the notify function and triggers on Books, Students and Borrows (migration 5)."""
+    migrations.migrate()
+
+
+def parse_notification(payload):
+    """Decode a notification payload into a change dict, or None if it is malformed."""
+    try:
+        change = json.loads(payload)
+    except ValueError:
+        print(f"Ignoring malformed change notification: {payload!r}")
+        return None
+    return change if isinstance(change, dict) and "table" in change else None
+
+
+class ChangeListener(QThread):
+    """Background thread that LISTENs for row changes and emits them in small batches.
+
+    The listener holds its own autocommit connection (not a pooled one) since
+    LISTEN keeps it busy for the lifetime of the thread. Notifications that
+    arrive within `batch_window` seconds of each other are emitted together.
+    """
+
+    changes_received = pyqtSignal(list)
+
+    def __init__(self, batch_window=0.2, parent=None):
+        super().__init__(parent)
+        self.batch_window = batch_window
+        self._running = True
+
+    def stop(self):
+        self._running = False
+
+    def _connect(self):
+        connection = psycopg2.connect(load_config()["dsn"])
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return connection
+
+    def run(self):
+        backoff = 1
+        while self._running:
+            connection = None
+            try:
+                connection = self._connect()
+                backoff = 1
+                self._listen(connection)
+            except psycopg2.Error as e:
+                print(f"Change listener error: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _listen(self, connection):
+        pending = []
+        deadline = None
+        while self._running:
+            timeout = 1.0 if deadline is None else max(0.0, deadline - time.monotonic())
+            if select.select([connection], [], [], timeout)[0]:
+                connection.poll()
+                while connection.notifies:
+                    change = parse_notification(connection.notifies.pop(0).payload)
+                    if change:
+                        pending.append(change)
+                if pending and deadline is None:
+                    deadline = time.monotonic() + self.batch_window
+            if pending and deadline is not None and time.monotonic() >= deadline:
+                self.changes_received.emit(pending)
+                pending = []
+                deadline = None
+
+
+if __name__ == "__main__":
+    install_triggers()
+    print("Change notification triggers installed.")
@@ -1,19 +1,42 @@
 import sys
-import datetime
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton,
+    QApplication, QWidget, QVBoxLayout, QTableView, QHeaderView, QPushButton,
     QLineEdit, QHBoxLayout, QMessageBox, QLabel, QComboBox, QTabWidget, QInputDialog
 )
 from PyQt5.QtCore import pyqtSignal
-from db_utils import fetch_books, insert_book, update_book, delete_book, fetch_filtered_books, insert_loan, fetch_students, insert_student, update_student, delete_student, fetch_filtered_students
+from db_utils import fetch_books_page, fetch_books_by_ids, fetch_students_by_ids, lend_book, insert_book, update_book, delete_book, book_index, filter_books, fetch_students_page, insert_student, update_student, delete_student
+from table_models import LazyTableModel, ButtonDelegate, ChangeCoalescer
+from change_feed import ChangeListener
+from db_worker import DbRunner, BusyIndicator
+from search import search_books, search_students
+import reports
 from faker import Faker
-from db_utils import validate_uuid
-import uuid
+from db_utils import validate_uuid, invalidate_books, invalidate_students, collation_key
 from uuid import UUID
-from db_utils import get_student_uuid
-from db_utils import convert_to_uuid
 fake = Faker()
 
+def make_table_view(model, parent=None):
+    """Create a QTableView with fixed row heights so only visible rows are laid out."""
+    table = QTableView(parent)
+    table.setModel(model)
+    table.setSelectionBehavior(QTableView.SelectRows)
+    table.setSelectionMode(QTableView.SingleSelection)
+    table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    table.verticalHeader().setDefaultSectionSize(28)
+    return table
+
+def load_collation(runner, model):
+    """Look up the database collation off the GUI thread and hand it to the model."""
+    runner.run(
+        collation_key,
+        on_result=model.set_collate,
+        on_error=lambda message: print(f"Error reading the database collation: {message}"),
+    )
+
+def cell_text(model, row, col):
+    """Return the stripped display text of a model cell."""
+    return (model.index(row, col).data() or "").strip()
+
 class LibraryManager(QWidget):
     data_updated = pyqtSignal()
 
@@ -32,11 +55,43 @@ class LibraryManager(QWidget):
         self.student_manager = StudentManager(self)
         self.tabs.addTab(self.student_manager, "Students")
 
+        # Create the Reports tab
+        self.report_manager = ReportManager(self)
+        self.tabs.addTab(self.report_manager, "Reports")
+
         layout = QVBoxLayout()
         layout.addWidget(self.tabs)
 
         self.setLayout(layout)
 
+        # تغییرات ردیف‌ها (از همه کلاینت‌ها) فقط همان ردیف‌ها را در جدول‌ها به‌روز می‌کنند
+        self.change_listener = ChangeListener()
+        self.change_listener.changes_received.connect(self.on_changes)
+        self.change_listener.start()
+
+    def on_changes(self, changes):
+        tables = {change.get("table") for change in changes}
+        if "books" in tables:
+            invalidate_books()
+        if "students" in tables:
+            invalidate_students()
+        for change in changes:
+            if change.get("op") == "RELOAD":
+                # بارگذاری انبوه (catalog_io، fine_engine) به جای هر ردیف یک اعلان کلی می‌فرستد
+                if change.get("table") == "books":
+                    self.book_manager.coalescer.request_reload()
+                elif change.get("table") == "students":
+                    self.student_manager.coalescer.request_reload()
+            elif change.get("table") == "books":
+                self.book_manager.coalescer.add([change.get("book_id")])
+            elif change.get("table") == "students":
+                self.student_manager.coalescer.add([change.get("student_id")])
+
+    def closeEvent(self, event):
+        self.change_listener.stop()
+        self.change_listener.wait()
+        super().closeEvent(event)
+
 class BookManager(QWidget):
     data_updated = pyqtSignal()
 
@@ -44,8 +99,27 @@ class BookManager(QWidget):
         super().__init__(parent)
         self.setWindowTitle("Library Book Manager")
 
-        self.table = QTableWidget(0, 6)
-        self.table.setHorizontalHeaderLabels(["Title", "Author", "Copies Available", "Category", "Actions", "Borrow"])
+        # همه درخواست‌های دیتابیس در ThreadPool اجرا می‌شوند تا رابط کاربری قفل نشود
+        self.runner = DbRunner(self)
+        self.runner.error.connect(self.on_db_error)
+        self.busy_indicator = BusyIndicator(self.runner, self)
+
+        # ردیف‌ها به صورت تکه‌تکه از دیتابیس خوانده می‌شوند: (book_id, title, author, copies_available, category)
+        self.model = LazyTableModel(
+            fetch_books_page,
+            ["Title", "Author", "Copies Available", "Category", "Actions", "Borrow"],
+            [1, 2, 3, 4],
+            {4: "Edit", 5: "Borrow"},
+            parent=self,
+            runner=self.runner,
+            sort_columns=[1, 0],
+        )
+        load_collation(self.runner, self.model)
+        self.table = make_table_view(self.model, self)
+        self.action_delegate = ButtonDelegate(self)
+        self.action_delegate.clicked.connect(self.on_action_clicked)
+        self.table.setItemDelegateForColumn(4, self.action_delegate)
+        self.table.setItemDelegateForColumn(5, self.action_delegate)
 
         self.title_input = QLineEdit(self)
         self.author_input = QLineEdit(self)
@@ -63,6 +137,13 @@ class BookManager(QWidget):
         self.stock_filter.addItem("In Stock")
         self.stock_filter.addItem("Out of Stock")
 
+        self.search_input = QLineEdit(self)
+        self.search_input.setPlaceholderText("Search by title, author or ISBN")
+        self.search_button = QPushButton("Search")
+        self.search_button.clicked.connect(self.search_books)
+        self.search_input.returnPressed.connect(self.search_books)
+        self.search_input.textChanged.connect(self.filter_books)
+
         self.add_button = QPushButton("Add Book")
         self.update_button = QPushButton("Update Book List")
         self.delete_button = QPushButton("Delete Selected Book")
@@ -86,120 +167,88 @@ class BookManager(QWidget):
         layout.addWidget(self.category_filter)
         layout.addWidget(QLabel("Stock Filter:"))
         layout.addWidget(self.stock_filter)
+        layout.addWidget(QLabel("Search:"))
+        layout.addWidget(self.search_input)
+        layout.addWidget(self.search_button)
         layout.addWidget(self.update_button)
         layout.addWidget(self.delete_button)
+        layout.addWidget(self.busy_indicator)
         layout.addWidget(self.table)
 
         self.setLayout(layout)
 
-        self.data_updated.connect(self.load_data)
+        # چند تغییر پشت سر هم در یک به‌روزرسانی جمع می‌شوند
+        self.coalescer = ChangeCoalescer(parent=self)
+        self.coalescer.changed.connect(self.refresh_rows)
+        self.coalescer.reload_requested.connect(self.load_data)
+        self.data_updated.connect(self.coalescer.request_reload)
         self.load_data()
 
     def load_data(self):
-        books = fetch_books()
-        self.table.setRowCount(0)
-
-        for row, book in enumerate(books):
-            self.table.insertRow(row)
-            for col, data in enumerate(book[:] ):
-                self.table.setItem(row, col, QTableWidgetItem(str(data)))
-
-            edit_button = QPushButton("Edit")
-            edit_button.clicked.connect(self.create_edit_callback(row, book[0]))
-            self.table.setCellWidget(row, 4, edit_button)
+        self.model.reload()
+        self.warm_index()
 
-            borrow_button = QPushButton("Borrow")
-            borrow_button.clicked.connect(self.create_borrow_callback(book[0]))
-            self.table.setCellWidget(row, 5, borrow_button)
+    def warm_index(self):
+        """کاتالوگ در پس‌زمینه در حافظه بارگذاری می‌شود تا فیلترها محلی اجرا شوند"""
+        self.runner.run(book_index, key="book_index")
 
-    def create_edit_callback(self, row, book_id):
-        return lambda: self.edit_book(row, book_id)
+    def on_db_error(self, message):
+        QMessageBox.critical(self, "Database Error", f"An error occurred: {message}")
 
-    def create_borrow_callback(self, book_id):
-        return lambda: self.borrow_book(book_id)
+    def after_change(self, message, book_ids=None):
+        if book_ids is None:
+            self.data_updated.emit()
+        else:
+            self.coalescer.add(book_ids)
+        QMessageBox.information(self, "Success", message)
+
+    def refresh_rows(self, book_ids):
+        """فقط ردیف‌های تغییرکرده دوباره خوانده و در جدول جایگزین می‌شوند"""
+        self.runner.run(fetch_books_by_ids, sorted(book_ids), on_result=lambda rows: self.model.apply_changes(book_ids, rows))
+        self.warm_index()
+
+    def on_action_clicked(self, index):
+        self.table.setCurrentIndex(index)
+        book_id = self.model.row_data(index.row())[0]
+        if index.column() == 4:
+            self.edit_book(index.row(), book_id)
+        else:
+            self.borrow_book(book_id)
 
     def edit_book(self, row, book_id):
         """ویرایش اطلاعات کتاب انتخاب‌شده"""
-        title_item = self.table.item(row, 0)
-        author_item = self.table.item(row, 1)
-        year_item = self.table.item(row, 2)
-        genre_item = self.table.item(row, 3)
-        
-        if not all([title_item, author_item, year_item, genre_item]):
-            QMessageBox.warning(self, "Error", "Some cells are missing data.")
-            return
-
-        title = title_item.text().strip()
-        author = author_item.text().strip()
-        year = year_item.text().strip()
-        genre = genre_item.text().strip()
-
-        if title and author and year and genre:
-            try:
-                # تبدیل book_id به UUID
-                book_id = convert_to_uuid(book_id)  # تبدیل رشته book_id به UUID
-                
-                # به روز رسانی کتاب با استفاده از UUID
-                update_book(book_id, title, author, int(year), genre)
-                self.data_updated.emit()
-                QMessageBox.information(self, "Success", "Book updated successfully!")
-            except ValueError as ve:
-                # در صورت بروز خطا در تبدیل UUID
-                QMessageBox.critical(self, "UUID Error", f"Invalid UUID for book_id: {ve}")
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", f"An error occurred: {e}")
+        title, author, year, genre = (cell_text(self.model, row, col) for col in range(4))
+
+        if title and author and year.isdigit() and genre:
+            # به روز رسانی کتاب با استفاده از UUID
+            self.runner.run(
+                update_book, str(book_id), title, author, int(year), genre,
+                on_result=lambda _: self.after_change("Book updated successfully!", [book_id]),
+            )
         else:
             QMessageBox.warning(self, "Input Error", "Please ensure all fields are filled in correctly.")
 
-
-    def update_book(book_id, new_title, new_author, new_copies, new_category):
-        """به‌روزرسانی اطلاعات کتاب"""
-        try:
-            # فرض می‌کنیم که book_id یک UUID است
-            # تبدیل book_id به رشته و انجام تغییرات روی آن
-            book_id_str = str(book_id)  # تبدیل به رشته
-            modified_book_id_str = book_id_str.replace("-", "")  # انجام تغییر (مثلاً حذف خط تیره‌ها)
-            
-            # تبدیل دوباره به UUID
-            modified_book_id = uuid.UUID(modified_book_id_str)
-            
-            # حالا از modified_book_id برای انجام عملیات پایگاه داده استفاده می‌کنیم
-            query = """
-                UPDATE Books
-                SET title = %s, author = %s, copies_available = %s, category = %s
-                WHERE book_id = %s
-            """
-            params = (new_title, new_author, new_copies, new_category, modified_book_id)
-            execute_query(query, params)
-            
-        except ValueError as e:
-            print(f"Error: {e}")
-            
     def borrow_book(self, book_id):
-        current_row = self.table.currentRow()
-        copies_available_item = self.table.item(current_row, 2)
-        copies_available = int(copies_available_item.text())
+        current_row = self.table.currentIndex().row()
+        copies_available = int(cell_text(self.model, current_row, 2))
 
         if copies_available > 0:
             student_name = self.get_student_name()
             if student_name is None:
                 return 
 
-            borrow_date = datetime.date.today()
-            due_date = borrow_date + datetime.timedelta(days=14)
-
-            try:
-                student_id = get_student_uuid(student_name)
-                insert_loan(book_id, student_id, borrow_date, due_date)
-                new_copies = copies_available - 1
-                update_book(book_id, new_copies)
-                QMessageBox.information(self, "Success", f"Book borrowed successfully! Return by {due_date}.")
-                self.data_updated.emit()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"An error occurred: {e}")
+            title = cell_text(self.model, current_row, 0)
+            self.runner.run(lend_book, title, student_name, on_result=lambda result: self.on_lend_result(result, book_id))
         else:
             QMessageBox.warning(self, "Out of Stock", "This book is currently out of stock.")
 
+    def on_lend_result(self, result, book_id):
+        success, message = result
+        if success:
+            self.after_change(message, [book_id])
+        else:
+            QMessageBox.critical(self, "Error", message)
+
     def get_student_name(self):
         student_name, ok = QInputDialog.getText(self, "Enter Student Name", "Please enter the student's name:")
         if ok and student_name.strip():
@@ -217,54 +266,51 @@ class BookManager(QWidget):
         isbn = fake.isbn13()
 
         if title and author and copies.isdigit() and int(copies) > 0:
-            insert_book(title, author, isbn, int(copies), category)
-            self.data_updated.emit()
-            QMessageBox.information(self, "Success", "Book added successfully!")
+            self.runner.run(
+                insert_book, title, author, isbn, int(copies), category,
+                on_result=lambda book_id: self.after_change("Book added successfully!", [book_id]),
+            )
         else:
             QMessageBox.warning(self, "Input Error", "Please enter valid data.")
 
     def delete_book(self):
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
         if current_row >= 0:
-            title = self.table.item(current_row, 0).text()
-            delete_book(title)
-            self.data_updated.emit()
-            QMessageBox.information(self, "Success", "Book deleted successfully!")
+            title = cell_text(self.model, current_row, 0)
+            book_ids = self.model.find_keys(1, title)
+            self.runner.run(delete_book, title, on_result=lambda _: self.after_change("Book deleted successfully!", book_ids))
         else:
             QMessageBox.warning(self, "Selection Error", "Please select a book to delete.")
 
     def filter_books(self):
         category = self.category_filter.currentText()
         stock_status = self.stock_filter.currentText()
+        category = None if category == "All Categories" else category
+        in_stock = {"In Stock": True, "Out of Stock": False}.get(stock_status)
+        text = self.search_input.text().strip() or None
 
-        query = "SELECT title, author, copies_available, category FROM Books WHERE 1=1"
-        
-        if category != "All Categories":
-            query += f" AND category = '{category}'"
-        
-        if stock_status == "In Stock":
-            query += " AND copies_available > 0"
-        elif stock_status == "Out of Stock":
-            query += " AND copies_available = 0"
-        
-        books = fetch_filtered_books(query)
-        self.load_filtered_data(books)
-
-    def load_filtered_data(self, books):
-        self.table.setRowCount(0)
+        if category is None and in_stock is None and text is None:
+            self.runner.cancel("filter")
+            self.load_data()
+            return
 
-        for row, book in enumerate(books):
-            self.table.insertRow(row)
-            for col, data in enumerate(book[:] ):
-                self.table.setItem(row, col, QTableWidgetItem(str(data)))
+        # با کاتالوگ بارگذاری‌شده فیلتر در همین رشته اجرا می‌شود؛ در غیر این صورت کوئری پارامتری
+        index = book_index(load=False)
+        if index is not None:
+            self.runner.cancel("filter")
+            self.load_filtered_data(index.filter(category, in_stock, text))
+        else:
+            self.runner.run(filter_books, category, in_stock, text, on_result=self.load_filtered_data, key="filter")
 
-            edit_button = QPushButton("Edit")
-            edit_button.clicked.connect(lambda checked, b_id=book['book_id']: self.edit_book(row_index, b_id))
-            self.table.setCellWidget(row, 4, edit_button)
+    def search_books(self):
+        query = self.search_input.text().strip()
+        if not query:
+            self.load_data()
+            return
+        self.runner.run(search_books, query, 200, on_result=self.load_filtered_data, key="filter")
 
-            borrow_button = QPushButton("Borrow")
-            borrow_button.clicked.connect(lambda checked, book_id=book[0]: self.borrow_book(book_id))
-            self.table.setCellWidget(row, 5, borrow_button)
+    def load_filtered_data(self, books):
+        self.model.set_rows(books)
 
 class StudentManager(QWidget):
     data_updated = pyqtSignal()
@@ -273,8 +319,25 @@ class StudentManager(QWidget):
         super().__init__(parent)
         self.setWindowTitle("Student Manager")
 
-        self.table = QTableWidget(0, 5)
-        self.table.setHorizontalHeaderLabels(["Name", "Email", "Phone", "Department", "Actions"])
+        self.runner = DbRunner(self)
+        self.runner.error.connect(self.on_db_error)
+        self.busy_indicator = BusyIndicator(self.runner, self)
+
+        # (student_id, name, email, phone, department)
+        self.model = LazyTableModel(
+            fetch_students_page,
+            ["Name", "Email", "Phone", "Department", "Actions"],
+            [1, 2, 3, 4],
+            {4: "Edit"},
+            parent=self,
+            runner=self.runner,
+            sort_columns=[1, 0],
+        )
+        load_collation(self.runner, self.model)
+        self.table = make_table_view(self.model, self)
+        self.action_delegate = ButtonDelegate(self)
+        self.action_delegate.clicked.connect(self.on_action_clicked)
+        self.table.setItemDelegateForColumn(4, self.action_delegate)
 
         self.name_input = QLineEdit(self)
         self.email_input = QLineEdit(self)
@@ -282,9 +345,10 @@ class StudentManager(QWidget):
         self.department_input = QLineEdit(self)
 
         self.search_input = QLineEdit(self)
-        self.search_input.setPlaceholderText("Search by name, or department")
+        self.search_input.setPlaceholderText("Search by name, email or department")
         self.search_button = QPushButton("Search")
         self.search_button.clicked.connect(self.search_students)
+        self.search_input.returnPressed.connect(self.search_students)
 
         self.add_button = QPushButton("Add Student")
         self.update_button = QPushButton("Update Student List")
@@ -311,26 +375,38 @@ class StudentManager(QWidget):
 
         layout.addWidget(self.update_button)
         layout.addWidget(self.delete_button)
+        layout.addWidget(self.busy_indicator)
         layout.addWidget(self.table)
 
         self.setLayout(layout)
 
-        self.data_updated.connect(self.load_data)
+        # چند تغییر پشت سر هم در یک به‌روزرسانی جمع می‌شوند
+        self.coalescer = ChangeCoalescer(parent=self)
+        self.coalescer.changed.connect(self.refresh_rows)
+        self.coalescer.reload_requested.connect(self.load_data)
+        self.data_updated.connect(self.coalescer.request_reload)
 
         self.load_data()
 
     def load_data(self):
-        students = fetch_students()
-        self.table.setRowCount(0)
+        self.model.reload()
+
+    def on_db_error(self, message):
+        QMessageBox.critical(self, "Database Error", f"An error occurred: {message}")
 
-        for row, student in enumerate(students):
-            self.table.insertRow(row)
-            for col, data in enumerate(student[1:]):
-                self.table.setItem(row, col, QTableWidgetItem(str(data)))
+    def after_change(self, message, student_ids=None):
+        if student_ids is None:
+            self.data_updated.emit()
+        else:
+            self.coalescer.add(student_ids)
+        QMessageBox.information(self, "Success", message)
 
-            edit_button = QPushButton("Edit")
-            edit_button.clicked.connect(lambda checked, r=row, student_id=student[0]: self.edit_student(r, student_id))
-            self.table.setCellWidget(row, 4, edit_button)
+    def refresh_rows(self, student_ids):
+        self.runner.run(fetch_students_by_ids, sorted(student_ids), on_result=lambda rows: self.model.apply_changes(student_ids, rows))
+
+    def on_action_clicked(self, index):
+        self.table.setCurrentIndex(index)
+        self.edit_student(index.row(), self.model.row_data(index.row())[0])
 
     def add_student(self):
         name = self.name_input.text().strip()
@@ -339,57 +415,101 @@ class StudentManager(QWidget):
         department = self.department_input.text().strip()
 
         if name and email and phone and department:
-            insert_student(name, email, phone, department)
-            self.data_updated.emit()
-            QMessageBox.information(self, "Success", "Student added successfully!")
+            self.runner.run(
+                insert_student, name, email, phone, department,
+                on_result=lambda student_id: self.after_change("Student added successfully!", [student_id]),
+            )
         else:
             QMessageBox.warning(self, "Input Error", "Please enter valid data.")
 
     def edit_student(self, row, student_id):
         """ویرایش اطلاعات دانشجوی انتخاب‌شده"""
-        name_item = self.table.item(row, 0)
-        email_item = self.table.item(row, 1)
-        phone_item = self.table.item(row, 2)
-        department_item = self.table.item(row, 3)
-        
-        if not all([name_item, email_item, phone_item, department_item]):
-            QMessageBox.warning(self, "Error", "Some cells are missing data.")
-            return
-
-        name = name_item.text().strip()
-        email = email_item.text().strip()
-        phone = phone_item.text().strip()
-        department = department_item.text().strip()
+        name, email, phone, department = (cell_text(self.model, row, col) for col in range(4))
 
         if name and email and phone and department:
-            try:
-                update_student(student_id, name, email, phone, department)
-                self.data_updated.emit()
-                QMessageBox.information(self, "Success", "Student updated successfully!")
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", f"An error occurred: {e}")
+            self.runner.run(
+                update_student, student_id, name, email, phone, department,
+                on_result=lambda _: self.after_change("Student updated successfully!", [student_id]),
+            )
         else:
             QMessageBox.warning(self, "Input Error", "Please ensure all fields are filled in correctly.")
 
 
     def delete_student(self):
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
         if current_row >= 0:
-            student_name = self.table.item(current_row, 0).text()
-            delete_student(student_name)
-            self.data_updated.emit()
-            QMessageBox.information(self, "Success", "Student deleted successfully!")
+            student_name = cell_text(self.model, current_row, 0)
+            student_ids = self.model.find_keys(1, student_name)
+            self.runner.run(delete_student, student_name, on_result=lambda _: self.after_change("Student deleted successfully!", student_ids))
         else:
             QMessageBox.warning(self, "Selection Error", "Please select a student to delete.")
 
     def search_students(self):
         query = self.search_input.text().strip()
-        students = fetch_filtered_students(query)
-        self.table.setRowCount(0)
-        for row, student in enumerate(students):
-            self.table.insertRow(row)
-            for col, data in enumerate(student[1:]):
-                self.table.setItem(row, col, QTableWidgetItem(str(data)))
+        if not query:
+            self.load_data()
+            return
+        self.runner.run(search_students, query, 200, on_result=self.model.set_rows, key="search")
+
+
+class ReportManager(QWidget):
+    # (label, report function, headers, row columns shown)
+    REPORTS = [
+        ("Top 5 Borrowed Books per Category", reports.top_borrowed_by_category,
+         ["Category", "Title", "Author", "Loans"], [0, 1, 2, 3]),
+        ("Students with Overdue Books", reports.overdue_students,
+         ["Name", "Email", "Overdue Books", "Oldest Due Date"], [1, 2, 3, 4]),
+        ("Unpaid Fines per Student", reports.unpaid_fines_by_student,
+         ["Name", "Email", "Unpaid Total", "Unpaid Loans"], [1, 2, 3, 4]),
+        ("Circulation in the Last 30 Days", reports.daily_circulation,
+         ["Day", "Borrowed", "Returned"], [0, 1, 2]),
+        ("Returns in the Last 30 Days", reports.recent_returns,
+         ["Title", "Author", "Borrowed", "Returned"], [0, 1, 2, 3]),
+    ]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Reports")
+
+        self.runner = DbRunner(self)
+        self.runner.error.connect(self.on_db_error)
+        self.busy_indicator = BusyIndicator(self.runner, self)
+
+        self.report_selector = QComboBox(self)
+        for label, *_ in self.REPORTS:
+            self.report_selector.addItem(label)
+        self.report_selector.currentIndexChanged.connect(self.load_data)
+
+        self.refresh_button = QPushButton("Refresh")
+        self.refresh_button.clicked.connect(self.load_data)
+
+        self.table = make_table_view(None, self)
+        self.table.setEditTriggers(QTableView.NoEditTriggers)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Report:"))
+        layout.addWidget(self.report_selector)
+        layout.addWidget(self.refresh_button)
+        layout.addWidget(self.busy_indicator)
+        layout.addWidget(self.table)
+
+        self.setLayout(layout)
+
+        self.load_data()
+
+    def load_data(self):
+        """گزارش انتخاب‌شده از جدول‌های خلاصه خوانده می‌شود"""
+        _, report, headers, columns = self.REPORTS[self.report_selector.currentIndex()]
+        previous = self.table.model()
+        # مدل ثابت و فقط‌خواندنی: ردیف‌ها فقط از set_rows می‌آیند
+        model = LazyTableModel(None, headers, columns, parent=self, editable=False)
+        self.table.setModel(model)
+        if previous is not None:
+            previous.deleteLater()
+        self.runner.run(report, on_result=model.set_rows, key="report")
+
+    def on_db_error(self, message):
+        QMessageBox.critical(self, "Database Error", f"An error occurred: {message}")
 
 
 def main():
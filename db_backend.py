@@ -0,0 +1,443 @@
+import datetime
+import decimal
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+
+import query_trace
+
+try:
+    import psycopg2
+    from psycopg2.extras import execute_values as _pg_execute_values
+except ImportError:  # SQLite-only installs
+    psycopg2 = None
+
+# Catch this instead of psycopg2.DatabaseError so the same except clause works on every backend.
+DatabaseError = (sqlite3.DatabaseError,) + ((psycopg2.DatabaseError,) if psycopg2 else ())
+
+DEFAULT_SQLITE_PATH = "library.db"
+
+
+def load_backend_config():
+    """Read the backend choice from LIBRARY_DB_BACKEND and LIBRARY_SQLITE_PATH."""
+    return {
+        "backend": os.environ.get("LIBRARY_DB_BACKEND", "postgresql").strip().lower(),
+        "sqlite_path": os.environ.get("LIBRARY_SQLITE_PATH", DEFAULT_SQLITE_PATH),
+    }
+
+
+class PostgresBackend:
+    """db_utils on the shared psycopg2 pool from db_pool; SQL runs unchanged."""
+
+    name = "postgresql"
+
+    def __init__(self):
+        if psycopg2 is None:
+            raise RuntimeError("The postgresql backend needs psycopg2; install it or set LIBRARY_DB_BACKEND=sqlite.")
+        self._collation = None
+
+    @contextmanager
+    def connection(self):
+        from db_pool import get_connection
+        with get_connection() as connection:
+            yield connection
+
+    def statements(self, name, query):
+        return [query]
+
+    def execute_named(self, cursor, name, query, params):
+        """Run a hot statement as a server-side prepared statement (see prepared.py)."""
+        from prepared import registry
+        return registry.execute(cursor, name, query, params)
+
+    def execute_values(self, cursor, query, rows, template=None, page_size=100, fetch=False):
+        return _pg_execute_values(cursor, query, rows, template=template, page_size=page_size, fetch=fetch)
+
+    def stream_cursor(self, connection, itersize):
+        """Server-side (named) cursor that pulls itersize rows per round trip."""
+        cursor = connection.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cursor.itersize = itersize
+        return cursor
+
+    def collation(self):
+        """The database's default collation, e.g. "en_US.UTF-8" (looked up once)."""
+        if self._collation is None:
+            with self.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT datcollate FROM pg_database WHERE datname = current_database()")
+                    self._collation = cursor.fetchone()[0]
+        return self._collation
+
+    def close(self):
+        from db_pool import close_pool
+        close_pool()
+
+
+# --- SQLite ----------------------------------------------------------------
+
+# Same tables and hot-path indexes as migrations 1-3 and 8, in SQLite's dialect.
+SQLITE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS Books (
+    book_id text PRIMARY KEY,
+    title text NOT NULL,
+    author text,
+    isbn text UNIQUE,
+    copies_available integer NOT NULL DEFAULT 0 CHECK (copies_available >= 0),
+    category text
+);
+CREATE TABLE IF NOT EXISTS Students (
+    student_id text PRIMARY KEY,
+    name text NOT NULL,
+    email text,
+    phone text,
+    department text
+);
+CREATE TABLE IF NOT EXISTS Borrows (
+    borrow_id text PRIMARY KEY,
+    book_id text NOT NULL REFERENCES Books (book_id) ON DELETE CASCADE,
+    student_id text NOT NULL REFERENCES Students (student_id) ON DELETE CASCADE,
+    borrow_date date NOT NULL,
+    return_date date NOT NULL,
+    actual_return_date date,
+    fine numeric NOT NULL DEFAULT 0 CHECK (fine >= 0),
+    paid boolean NOT NULL DEFAULT FALSE
+);
+CREATE TABLE IF NOT EXISTS Loans (
+    loan_id text PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+    book_id text NOT NULL REFERENCES Books (book_id) ON DELETE CASCADE,
+    student_id text NOT NULL REFERENCES Students (student_id) ON DELETE CASCADE,
+    date_borrowed date NOT NULL,
+    due_date date NOT NULL,
+    return_date date
+);
+CREATE TABLE IF NOT EXISTS Fines (
+    fine_id text PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+    loan_id text NOT NULL REFERENCES Loans (loan_id) ON DELETE CASCADE,
+    amount numeric NOT NULL DEFAULT 0,
+    paid boolean NOT NULL DEFAULT FALSE
+);
+CREATE INDEX IF NOT EXISTS books_title_idx ON Books (title, book_id);
+CREATE INDEX IF NOT EXISTS books_category_idx ON Books (category);
+CREATE INDEX IF NOT EXISTS students_name_idx ON Students (name, student_id);
+CREATE INDEX IF NOT EXISTS borrows_open_idx ON Borrows (book_id, student_id, borrow_date)
+    WHERE actual_return_date IS NULL;
+CREATE INDEX IF NOT EXISTS borrows_unpaid_idx ON Borrows (student_id, book_id) WHERE paid = FALSE;
+CREATE INDEX IF NOT EXISTS borrows_overdue_idx ON Borrows (return_date) WHERE actual_return_date IS NULL;
+CREATE INDEX IF NOT EXISTS borrows_open_student_idx ON Borrows (student_id, return_date)
+    WHERE actual_return_date IS NULL;
+"""
+
+# Statements PostgreSQL runs as one data-modifying CTE. SQLite has no
+# writable CTEs, so they become short statement lists that db_utils runs in
+# one BEGIN IMMEDIATE transaction (SQLite's single writer makes that as
+# race-free as the row lock). The last statement's first row is the result.
+SQLITE_STATEMENTS = {
+    "lend_book": [
+        """INSERT INTO Borrows (borrow_id, book_id, student_id, borrow_date, return_date)
+           SELECT :borrow_id, book_id, :student_id, :borrow_date, :return_date
+           FROM Books WHERE book_id = :book_id AND copies_available > 0""",
+        """UPDATE Books SET copies_available = copies_available - 1
+           WHERE book_id = :book_id AND EXISTS (SELECT 1 FROM Borrows WHERE borrow_id = :borrow_id)""",
+        "SELECT EXISTS (SELECT 1 FROM Borrows WHERE borrow_id = :borrow_id)",
+    ],
+    "return_book": [
+        """UPDATE Books SET copies_available = copies_available + 1
+           WHERE book_id = :book_id AND EXISTS (
+               SELECT 1 FROM Borrows
+               WHERE book_id = :book_id AND student_id = :student_id AND actual_return_date IS NULL)""",
+        """UPDATE Borrows
+           SET actual_return_date = :today,
+               fine = MIN(
+                   MAX(CAST(julianday(:today) - julianday(return_date) AS INTEGER) - :grace_days, 0)
+                   * COALESCE(json_extract(:category_rates, '$."' || (
+                         SELECT category FROM Books WHERE Books.book_id = Borrows.book_id) || '"'),
+                       :fine_per_day),
+                   COALESCE(:max_fine, 9e999))
+           WHERE borrow_id = (
+               SELECT borrow_id FROM Borrows
+               WHERE book_id = :book_id AND student_id = :student_id AND actual_return_date IS NULL
+               ORDER BY borrow_date
+               LIMIT 1)
+           RETURNING fine""",
+    ],
+}
+
+# Maximum bound variables per SQLite statement.
+SQLITE_MAX_VARIABLES = 32766
+
+_PLACEHOLDERS = re.compile(r"%\((\w+)\)s|%s|%%")
+_CASTS = re.compile(r"::\w+(?:\[\])?")
+_ILIKE = re.compile(r"\bILIKE\b", re.IGNORECASE)
+_ANY = re.compile(r"=\s*ANY\s*\(\s*(\?|:\w+)\s*\)", re.IGNORECASE)
+_GREATEST = re.compile(r"\bGREATEST\s*\(", re.IGNORECASE)
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE(?:\s+OF\s+\w+)?", re.IGNORECASE)
+_DISTINCT_ON = re.compile(
+    r"\bSELECT\s+DISTINCT\s+ON\s*\((\w+)\)\s*(.*?)\s+FROM\s+(.*?)(?:\s+ORDER\s+BY\s+(.*?))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL)
+_VALUES_ALIAS = re.compile(r"\(\s*(VALUES\s.*?)\)\s+AS\s+(\w+)\s*\(([^)]*)\)", re.IGNORECASE | re.DOTALL)
+_UPDATE_ALIAS = re.compile(r"\bUPDATE\s+(\w+)\s+(?!SET\b)(\w+)\s+SET\b", re.IGNORECASE)
+_WRITE = re.compile(r"\s*(?:INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def _placeholder(match):
+    if match.group(1):
+        return f":{match.group(1)}"
+    return "?" if match.group(0) == "%s" else "%"
+
+
+def _distinct_on(match):
+    # Keep the first row of each group in ORDER BY order, as DISTINCT ON does.
+    column, select_list, rest, order = match.groups()
+    order = order or column
+    return (f"SELECT {select_list} FROM (SELECT {select_list}, row_number() OVER "
+            f"(PARTITION BY {column} ORDER BY {order}) AS distinct_on_rank FROM {rest}) "
+            f"WHERE distinct_on_rank = 1 ORDER BY {order}")
+
+
+def _values_alias(match):
+    columns = [column.strip() for column in match.group(3).split(",")]
+    select_list = ", ".join(f"column{i} AS {column}" for i, column in enumerate(columns, 1))
+    return f"(SELECT {select_list} FROM ({match.group(1)})) AS {match.group(2)}"
+
+
+@lru_cache(maxsize=512)
+def translate_sqlite(query):
+    """Rewrite a PostgreSQL/psycopg2 statement into SQLite's dialect.
+
+    Covers what db_utils uses: %s/%(name)s placeholders, casts, ILIKE,
+    = ANY(array), GREATEST, FOR UPDATE, DISTINCT ON, aliased VALUES lists
+    and aliased UPDATE targets.
+    """
+    sql = _PLACEHOLDERS.sub(_placeholder, query)
+    sql = _CASTS.sub("", sql)
+    sql = _ILIKE.sub("LIKE", sql)
+    sql = _ANY.sub(r"IN (SELECT value FROM json_each(\1))", sql)
+    sql = _GREATEST.sub("MAX(", sql)
+    sql = _FOR_UPDATE.sub("", sql)
+    sql = _VALUES_ALIAS.sub(_values_alias, sql)
+    sql = _UPDATE_ALIAS.sub(r"UPDATE \1 AS \2 SET", sql)
+    sql = _DISTINCT_ON.sub(_distinct_on, sql)
+    return sql
+
+
+def _adapt(value):
+    if isinstance(value, (list, tuple, set)):
+        return json.dumps([str(item) if isinstance(item, uuid.UUID) else item for item in value], default=str)
+    return value
+
+
+def _adapt_params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {key: _adapt(value) for key, value in params.items()}
+    return tuple(_adapt(value) for value in params)
+
+
+sqlite3.register_adapter(uuid.UUID, str)
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_adapter(datetime.datetime, datetime.datetime.isoformat)
+sqlite3.register_adapter(decimal.Decimal, str)
+sqlite3.register_converter("date", lambda value: datetime.date.fromisoformat(value.decode()))
+sqlite3.register_converter("boolean", lambda value: value not in (b"0", b""))
+
+
+class SqliteCursor:
+    """DB-API cursor wrapper that translates each statement and works as a context manager."""
+
+    def __init__(self, connection, cursor):
+        self._connection = connection
+        self._cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, query, params=None):
+        sql = translate_sqlite(query)
+        self._connection._begin(sql, "FOR UPDATE" in query.upper())
+        query_trace.traced_call(self._cursor, self._cursor.execute, sql, _adapt_params(params))
+        return self
+
+    def executemany(self, query, params_list):
+        sql = translate_sqlite(query)
+        self._connection._begin(sql, False)
+        query_trace.traced_call(self._cursor, self._cursor.executemany, sql,
+                                [_adapt_params(params) for params in params_list])
+        return self
+
+
+class SqliteConnection:
+    """psycopg2-like connection over sqlite3: implicit transactions, commit/rollback, autocommit."""
+
+    def __init__(self, database, uri=False, timeout=5.0):
+        self._raw = sqlite3.connect(database, uri=uri, timeout=timeout, isolation_level=None,
+                                    detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._raw.execute("PRAGMA foreign_keys = ON")
+        self.autocommit = False
+
+    def cursor(self, name=None):
+        return SqliteCursor(self, self._raw.cursor())
+
+    def _begin(self, sql, for_update):
+        # Writes (and reads that psycopg2 code would lock with FOR UPDATE)
+        # take the write lock up front so a transaction never has to
+        # upgrade a read lock and fail with SQLITE_BUSY half way through.
+        if self.autocommit or self._raw.in_transaction:
+            return
+        self._raw.execute("BEGIN IMMEDIATE" if for_update or _WRITE.match(sql) else "BEGIN")
+
+    def commit(self):
+        if self._raw.in_transaction:
+            self._raw.execute("COMMIT")
+
+    def rollback(self):
+        if self._raw.in_transaction:
+            self._raw.execute("ROLLBACK")
+
+    def close(self):
+        self._raw.close()
+
+
+class SqliteBackend:
+    """db_utils on an in-process SQLite file, one connection per thread.
+
+    ":memory:" gives a private shared-cache database that lives as long as
+    the backend, which is what test suites want.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._uri = path == ":memory:"
+        self._database = f"file:library_{uuid.uuid4().hex}?mode=memory&cache=shared" if self._uri else path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        # Keeps an in-memory database alive and creates the schema once.
+        self._keeper = SqliteConnection(self._database, self._uri, timeout)
+        if not self._uri:
+            self._keeper._raw.execute("PRAGMA journal_mode = WAL")
+        self._keeper._raw.executescript(SQLITE_SCHEMA_SQL)
+
+    def _thread_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = SqliteConnection(self._database, self._uri, self.timeout)
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Lend this thread's connection; the outermost borrower's exit rolls back anything uncommitted."""
+        connection = self._thread_connection()
+        self._local.depth += 1
+        try:
+            yield connection
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                connection.autocommit = False
+                connection.rollback()
+
+    def statements(self, name, query):
+        return SQLITE_STATEMENTS.get(name, [query])
+
+    def execute_named(self, cursor, name, query, params):
+        """sqlite3 already keeps compiled statements in a per-connection cache."""
+        return cursor.execute(query, params)
+
+    def execute_values(self, cursor, query, rows, template=None, page_size=100, fetch=False):
+        """Expand the single VALUES %s placeholder like psycopg2.extras.execute_values."""
+        if not rows:
+            return [] if fetch else None
+        width = len(rows[0])
+        template = template or "(" + ", ".join(["%s"] * width) + ")"
+        page_size = max(1, min(page_size or len(rows), SQLITE_MAX_VARIABLES // width))
+        results = []
+        for start in range(0, len(rows), page_size):
+            page = rows[start:start + page_size]
+            values = ", ".join([template] * len(page))
+            cursor.execute(query.replace("%s", values), [value for row in page for value in row])
+            if fetch:
+                results.extend(cursor.fetchall())
+        return results if fetch else None
+
+    def stream_cursor(self, connection, itersize):
+        """SQLite cursors already step through rows lazily; itersize sets fetchmany's batch."""
+        cursor = connection.cursor()
+        cursor.arraysize = itersize
+        return cursor
+
+    def collation(self):
+        """SQLite's default BINARY collation is code point order, like PostgreSQL's "C"."""
+        return "C"
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._keeper.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name=None, **options):
+    """Build a backend ("postgresql" or "sqlite"); unset options come from load_backend_config()."""
+    config = load_backend_config()
+    name = (name or config["backend"]).lower()
+    if name in ("postgresql", "postgres"):
+        return PostgresBackend()
+    if name == "sqlite":
+        options.setdefault("path", config["sqlite_path"])
+        return SqliteBackend(**options)
+    raise ValueError(f"Unknown database backend: {name!r}")
+
+
+def init_backend(name=None, **options):
+    """(Re)select the backend db_utils uses, e.g. init_backend("sqlite", path=":memory:")."""
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = create_backend(name, **options)
+    return _backend
+
+
+def get_backend():
+    """Return the active backend, creating it from the environment on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def close_backend():
+    """Close the active backend; the next get_backend() call builds a fresh one."""
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
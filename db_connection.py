@@ -1,21 +1,11 @@
 import sys
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QListWidget
 from PyQt5.QtCore import Qt
-import psycopg2
-
-def create_connection():
-    try:
-        connection = psycopg2.connect(
-            dbname="library_db",  
-            user="postgres",     
-            password="2275483n", 
-            host="localhost",    
-            port="5432"           
-        )
-        return connection
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
+from db_utils import catalog_books
+from db_worker import DbRunner, BusyIndicator
+
+def query_titles():
+    return [(title, author) for _, title, author, _, _ in catalog_books()]
 
 class LibraryApp(QWidget):
     def __init__(self):
@@ -36,19 +26,19 @@ class LibraryApp(QWidget):
         self.load_books_button.clicked.connect(self.load_books)
         layout.addWidget(self.load_books_button)
 
+        self.runner = DbRunner(self)
+        self.runner.error.connect(lambda message: print(f"Error: {message}"))
+        layout.addWidget(BusyIndicator(self.runner, self))
+
         self.setLayout(layout)
 
     def load_books(self):
-        connection = create_connection()
-        if connection:
-            cursor = connection.cursor()
-            cursor.execute("SELECT title, author FROM Books")
-            books = cursor.fetchall()
-            self.book_list.clear()
-            for book in books:
-                self.book_list.addItem(f"{book[0]} by {book[1]}")
-            cursor.close()
-            connection.close()
+        self.runner.run(query_titles, on_result=self.show_books, key="books")
+
+    def show_books(self, books):
+        self.book_list.clear()
+        for book in books:
+            self.book_list.addItem(f"{book[0]} by {book[1]}")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
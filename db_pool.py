@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+from query_trace import TracingCursor
+
+DEFAULT_DSN = "dbname=library_db user=postgres password=2275483n host=localhost port=5432"
+
+
+def _env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+def load_config():
+    """Build the pool configuration from LIBRARY_DB_* environment variables."""
+    return {
+        "dsn": os.environ.get("LIBRARY_DB_DSN", DEFAULT_DSN),
+        "minconn": _env_int("LIBRARY_DB_POOL_MIN", 1),
+        "maxconn": _env_int("LIBRARY_DB_POOL_MAX", 10),
+        "statement_timeout_ms": _env_int("LIBRARY_DB_STATEMENT_TIMEOUT_MS", 5000),
+        "acquire_timeout": _env_int("LIBRARY_DB_POOL_TIMEOUT", 30),
+    }
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool that blocks while exhausted and keeps usage stats."""
+
+    def __init__(self, dsn, minconn=1, maxconn=10, statement_timeout_ms=5000, acquire_timeout=30):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.statement_timeout_ms = statement_timeout_ms
+        self.acquire_timeout = acquire_timeout
+
+        # Every cursor on a pooled connection reports to query_trace.
+        connect_kwargs = {"cursor_factory": TracingCursor}
+        if statement_timeout_ms:
+            connect_kwargs["options"] = f"-c statement_timeout={int(statement_timeout_ms)}"
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, dsn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._borrowed = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_seconds = 0.0
+
+    def getconn(self):
+        """Borrow a connection, waiting up to acquire_timeout seconds for a free slot."""
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._waits += 1
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                with self._lock:
+                    self._timeouts += 1
+                raise pool.PoolError(f"Timed out after {self.acquire_timeout}s waiting for a pooled connection")
+        try:
+            connection = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._wait_seconds += time.perf_counter() - started
+            self._borrowed += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return connection
+
+    def putconn(self, connection):
+        """Return a connection, rolling back any open transaction and dropping broken ones."""
+        discard = bool(connection.closed)
+        if not discard:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        try:
+            self._pool.putconn(connection, close=discard)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                if discard:
+                    self._discarded += 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block."""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def stats(self):
+        """Return a snapshot of pool usage counters."""
+        with self._lock:
+            return {
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "in_use": self._in_use,
+                "idle": len(self._pool._pool),
+                "peak_in_use": self._peak_in_use,
+                "borrowed": self._borrowed,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "avg_acquire_ms": (self._wait_seconds / self._borrowed * 1000) if self._borrowed else 0.0,
+            }
+
+    def close(self):
+        """Close every connection held by the pool."""
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(**overrides):
+    """(Re)create the shared pool; keyword arguments override the environment config."""
+    global _pool
+    config = load_config()
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(**config)
+    return _pool
+
+
+def get_pool():
+    """Return the shared pool, creating it from the environment on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = load_config()
+                _pool = ConnectionPool(**config)
+    return _pool
+
+
+def close_pool():
+    """Close the shared pool; the next get_pool() call builds a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def get_connection():
+    """Borrow a connection from the shared pool for the duration of a with-block."""
+    with get_pool().connection() as connection:
+        yield connection
+
+
+def pool_stats():
+    """Return usage counters for the shared pool."""
+    if _pool is None:
+        return {}
+    return _pool.stats()
@@ -1,27 +1,22 @@
-import psycopg2
 import uuid
 import datetime
 from contextlib import contextmanager
 import hashlib
+import base64
+import json
+import locale
+import os
+import re
+from db_backend import DatabaseError, get_backend
+from book_filter import BookIndex
+from lookup_cache import LRUCache, VersionedCache
+from row_store import ColumnStore
 
 @contextmanager
 def create_connection():
-    """Create a connection to the PostgreSQL database using context manager."""
-    connection = None
-    try:
-        connection = psycopg2.connect(
-            dbname="library_db",
-            user="postgres",  # Replace with your username
-            password="2275483n",  # Replace with your password
-            host="localhost",
-            port="5432"
-        )
+    """Borrow a connection from the active backend (PostgreSQL pool or SQLite) using context manager."""
+    with get_backend().connection() as connection:
         yield connection
-    except psycopg2.Error as e:
-        print(f"Error creating connection: {e}")
-    finally:
-        if connection:
-            connection.close()
 
 def execute_query(query, params=None):
     """Execute any query using a connection to the database."""
@@ -30,7 +25,7 @@ def execute_query(query, params=None):
             with connection.cursor() as cursor:
                 cursor.execute(query, params or ())
                 connection.commit()
-    except psycopg2.DatabaseError as e:
+    except DatabaseError as e:
         print(f"Error executing query: {e}")
 
 def convert_to_uuid(book_id):
@@ -41,47 +36,328 @@ def convert_to_uuid(book_id):
     # ایجاد UUID از هش شده (توجه کنید که این فقط 16 بایت اول از هش SHA1 را استفاده می‌کند)
     return uuid.UUID(hashed[:32])  # فقط 32 کاراکتر اول هش برای ساخت UUID کافی است
 
-def fetch_books():
-    """Retrieve the list of books from the database."""
-    query = "SELECT title, author, copies_available, category FROM Books"
+# title -> book_id and name -> student_id, so a busy desk does not re-resolve
+# the same names on every checkout. Mutations below invalidate them.
+book_id_cache = LRUCache(maxsize=4096, ttl=300)
+student_id_cache = LRUCache(maxsize=4096, ttl=300)
+
+def _resolve_id(cache, name, query, param, key):
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    with create_connection() as connection:
+        with connection.cursor() as cursor:
+            get_backend().execute_named(cursor, name, query, {param: key})
+            result = cursor.fetchone()
+    if not result:
+        return None
+    cache.put(key, result[0])
+    return result[0]
+
+# A duplicated title/name always resolves to its lowest id, here and in the
+# bulk lookups, so single and bulk lend/return pick the same row every time.
+RESOLVE_BOOK_IDS_SQL = "SELECT DISTINCT ON (title) title, book_id FROM Books WHERE title = ANY(%s) ORDER BY title, book_id"
+RESOLVE_STUDENT_IDS_SQL = "SELECT DISTINCT ON (name) name, student_id FROM Students WHERE name = ANY(%s) ORDER BY name, student_id"
+
+def resolve_book_id(title):
+    """Return the book_id for a title (cached), or None if there is no such book."""
+    return _resolve_id(book_id_cache, "resolve_book_id",
+                       "SELECT book_id FROM Books WHERE title = %(title)s ORDER BY book_id LIMIT 1", "title", title)
+
+def resolve_student_id(name):
+    """Return the student_id for a name (cached), or None if there is no such student."""
+    return _resolve_id(student_id_cache, "resolve_student_id",
+                       "SELECT student_id FROM Students WHERE name = %(name)s ORDER BY student_id LIMIT 1", "name", name)
+
+def lookup_cache_stats():
+    """Return hit/miss counters of the id lookup caches."""
+    return {"books": book_id_cache.stats(), "students": student_id_cache.stats()}
+
+# Whole book/student lists and the views derived from them, read through
+# from the database. Every write path below bumps the "books" or "students"
+# version, so a cached list is never served after this process changed it;
+# the TTL bounds staleness from other clients.
+catalog_cache = VersionedCache(maxsize=64, ttl=60)
+
+def invalidate_books():
+    catalog_cache.bump("books")
+
+def invalidate_students():
+    catalog_cache.bump("students")
+
+def catalog_cache_stats():
+    """Return hit ratio, size and version counters of the catalog cache."""
+    return catalog_cache.stats()
+
+BOOKS_QUERY = "SELECT title, author, copies_available, category FROM Books"
+STUDENTS_QUERY = "SELECT student_id, name, email, phone, department FROM Students"
+CATALOG_BOOKS_QUERY = "SELECT book_id, title, author, copies_available, category FROM Books ORDER BY title, book_id"
+CATALOG_STUDENTS_QUERY = STUDENTS_QUERY + " ORDER BY name, student_id"
+UNPAID_FINES_QUERY = """
+    SELECT student_id, book_id, fine
+    FROM Borrows
+    WHERE fine > 0 AND paid = FALSE
+"""
+
+# Rows pulled per network round trip by the iter_* streaming functions.
+DEFAULT_ITERSIZE = 2000
+
+# Column layout of the cached catalog and roster (see row_store.ColumnStore):
+# ids as 16 bytes, text in one UTF-8 buffer per column, counts in an int
+# array and each category/department string stored once.
+CATALOG_BOOK_COLUMNS = (
+    ("book_id", "uuid"), ("title", "text"), ("author", "text"),
+    ("copies_available", "int"), ("category", "enum"),
+)
+CATALOG_STUDENT_COLUMNS = (
+    ("student_id", "uuid"), ("name", "text"), ("email", "text"),
+    ("phone", "text"), ("department", "enum"),
+)
+
+def _load_store(query, columns, record_name):
+    """Read a query into a ColumnStore DEFAULT_ITERSIZE rows at a time, never holding all rows as tuples.
+
+    Returns a read-only ColumnView, since the result is cached and shared.
+    """
+    store = ColumnStore(columns, record_name=record_name)
+    with create_connection() as connection:
+        with get_backend().stream_cursor(connection, DEFAULT_ITERSIZE) as cursor:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(DEFAULT_ITERSIZE)
+                if not rows:
+                    break
+                store.extend(rows)
+    return store.view()
+
+def collation_key():
+    """str -> sort key matching the ORDER BY of the catalog and page queries (None: plain str order).
+
+    Runs a query the first time, so GUI code calls it through a DbRunner.
+    A libc collation is mirrored with locale.strxfrm only when it is the
+    process's own LC_COLLATE; the locale is never changed here, and any
+    other collation falls back to plain str order with a warning.
+    """
+    collation = get_backend().collation()
+    if collation in ("C", "POSIX") or collation.startswith("C."):
+        return None
+    if locale.normalize(collation) == locale.normalize(locale.setlocale(locale.LC_COLLATE)):
+        return locale.strxfrm
+    print(f"Warning: database collation {collation!r} is not this process's LC_COLLATE; "
+          "new rows are placed in code point order until the next reload")
+    return None
+
+def catalog_books():
+    """Return every book as (book_id, title, author, copies_available, category) records, ordered by title (cached)."""
+    return catalog_cache.get_or_load(
+        "books", "catalog", lambda: _load_store(CATALOG_BOOKS_QUERY, CATALOG_BOOK_COLUMNS, "Book"))
+
+def catalog_students():
+    """Return every student as (student_id, name, email, phone, department) records, ordered by name (cached)."""
+    return catalog_cache.get_or_load(
+        "students", "catalog", lambda: _load_store(CATALOG_STUDENTS_QUERY, CATALOG_STUDENT_COLUMNS, "Student"))
+
+def catalog_memory_stats():
+    """Return the memory footprint of the loaded catalog, roster and book index (None if not loaded)."""
+    books = catalog_cache.peek("books", "catalog")
+    students = catalog_cache.peek("students", "catalog")
+    index = book_index(load=False)
+    return {
+        "books": books.memory_footprint() if books is not None else None,
+        "students": students.memory_footprint() if students is not None else None,
+        "book_index_bytes": index.memory_footprint() if index is not None else None,
+    }
+
+def books_by_category():
+    """Return {category: [catalog rows]} built once per catalog version."""
+    def build():
+        index = {}
+        for book in catalog_books():
+            index.setdefault(book[4], []).append(book)
+        return index
+    return catalog_cache.get_or_load("books", "by_category", build)
+
+def book_index(load=True):
+    """Return the BookIndex of the current catalog (cached).
+
+    With load=False a cache miss returns None instead of reading the catalog.
+    """
+    if not load:
+        return catalog_cache.peek("books", "index")
+    return catalog_cache.get_or_load("books", "index", lambda: BookIndex(catalog_books()))
+
+def filter_books(category=None, in_stock=None, text=None):
+    """Return catalog rows filtered by category, stock state and title/author text.
+
+    Served from the in-memory BookIndex when it is loaded; otherwise only the
+    matching rows are fetched with a parameterized query.
+    """
+    index = book_index(load=False)
+    if index is not None:
+        return index.filter(category, in_stock, text)
+    conditions = []
+    params = {}
+    if category is not None:
+        conditions.append("category = %(category)s")
+        params["category"] = category
+    if in_stock is not None:
+        conditions.append("copies_available > 0" if in_stock else "copies_available <= 0")
+    text = (text or "").strip()
+    if text:
+        conditions.append("(title ILIKE %(like)s ESCAPE '\\' OR author ILIKE %(like)s ESCAPE '\\')")
+        params["like"] = "%" + re.sub(r"([\\%_])", r"\\\1", text) + "%"
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    query = "SELECT book_id, title, author, copies_available, category FROM Books" + where + " ORDER BY title, book_id"
     try:
         with create_connection() as connection:
             with connection.cursor() as cursor:
-                cursor.execute(query)
-                books = cursor.fetchall()
-        return books
-    except psycopg2.DatabaseError as e:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+    except DatabaseError as e:
+        print(f"Error filtering books: {e}")
+        return []
+
+def fetch_books():
+    """Retrieve the books as read-only (title, author, copies_available, category) records."""
+    try:
+        return catalog_books().select("title", "author", "copies_available", "category")
+    except DatabaseError as e:
         print(f"Error fetching books: {e}")
         return []
 
 def fetch_books_paginated(page, page_size=5):
     """بازیابی داده‌های کتاب‌ها با صفحه‌بندی"""
-    connection = create_connection()
-    cursor = connection.cursor()
     offset = (page - 1) * page_size
-    cursor.execute("""
-        SELECT title, author, copies_available FROM Books
-        LIMIT %s OFFSET %s
-    """, (page_size, offset))
-    books = cursor.fetchall()
-    cursor.close()
-    connection.close()
+    with create_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT title, author, copies_available FROM Books
+                ORDER BY title, book_id
+                LIMIT %s OFFSET %s
+            """, (page_size, offset))
+            books = cursor.fetchall()
     return books
 
 def fetch_students_paginated(page, page_size=5):
     """بازیابی داده‌های دانشجویان با صفحه‌بندی"""
-    connection = create_connection()
-    cursor = connection.cursor()
     offset = (page - 1) * page_size
-    cursor.execute("""
-        SELECT name, email, phone FROM Students
-        LIMIT %s OFFSET %s
-    """, (page_size, offset))
-    students = cursor.fetchall()
-    cursor.close()
-    connection.close()
+    with create_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT name, email, phone FROM Students
+                ORDER BY name, student_id
+                LIMIT %s OFFSET %s
+            """, (page_size, offset))
+            students = cursor.fetchall()
     return students
 
+def encode_page_token(key, direction):
+    """Encode a (sort value, id) key and direction as an opaque page token."""
+    payload = json.dumps({"k": [str(part) for part in key], "d": direction})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_page_token(token):
+    """Decode a page token produced by encode_page_token."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        key, direction = payload["k"], payload["d"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid page token: {e}")
+    if direction not in ("after", "before") or len(key) != 2:
+        raise ValueError("Invalid page token.")
+    return key, direction
+
+def _fetch_keyset_page(table, columns, sort_column, id_column, page_token, page_size, with_total):
+    """Fetch one page ordered by (sort_column, id_column) using a seek predicate instead of OFFSET."""
+    key, direction = decode_page_token(page_token) if page_token else (None, "after")
+    select_list = ", ".join(columns)
+    if key is None:
+        query = f"""
+            SELECT {select_list} FROM {table}
+            ORDER BY {sort_column}, {id_column}
+            LIMIT %s
+        """
+        params = (page_size + 1,)
+    elif direction == "after":
+        query = f"""
+            SELECT {select_list} FROM {table}
+            WHERE ({sort_column}, {id_column}) > (%s, %s)
+            ORDER BY {sort_column}, {id_column}
+            LIMIT %s
+        """
+        params = (key[0], key[1], page_size + 1)
+    else:
+        query = f"""
+            SELECT {select_list} FROM {table}
+            WHERE ({sort_column}, {id_column}) < (%s, %s)
+            ORDER BY {sort_column} DESC, {id_column} DESC
+            LIMIT %s
+        """
+        params = (key[0], key[1], page_size + 1)
+
+    total = None
+    with create_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            if with_total:
+                cursor.execute(f"SELECT count(*) FROM {table}")
+                total = cursor.fetchone()[0]
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == "before":
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = key is not None, has_more
+
+    sort_index = columns.index(sort_column)
+    id_index = columns.index(id_column)
+    next_token = prev_token = None
+    if rows and has_next:
+        next_token = encode_page_token((rows[-1][sort_index], rows[-1][id_index]), "after")
+    if rows and has_prev:
+        prev_token = encode_page_token((rows[0][sort_index], rows[0][id_index]), "before")
+
+    return {"rows": rows, "next_token": next_token, "prev_token": prev_token, "total": total}
+
+BOOK_PAGE_COLUMNS = ("book_id", "title", "author", "copies_available", "category")
+STUDENT_PAGE_COLUMNS = ("student_id", "name", "email", "phone", "department")
+
+def fetch_books_page(page_token=None, page_size=10, with_total=False):
+    """Retrieve one page of books ordered by title and book_id.
+
+    Returns a dict with the page rows, opaque next/prev page tokens (None at the
+    ends) and, when with_total is set, the total number of books.
+    """
+    return _fetch_keyset_page("Books", BOOK_PAGE_COLUMNS, "title", "book_id", page_token, page_size, with_total)
+
+def fetch_students_page(page_token=None, page_size=10, with_total=False):
+    """Retrieve one page of students ordered by name and student_id (see fetch_books_page)."""
+    return _fetch_keyset_page("Students", STUDENT_PAGE_COLUMNS, "name", "student_id", page_token, page_size, with_total)
+
+def _fetch_by_ids(table, columns, id_column, ids):
+    if not ids:
+        return []
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE {id_column} = ANY(%s::uuid[])"
+    try:
+        with create_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, ([str(value) for value in ids],))
+                return cursor.fetchall()
+    except DatabaseError as e:
+        print(f"Error fetching {table} by id: {e}")
+        raise
+
+def fetch_books_by_ids(book_ids):
+    """Retrieve the current page rows for the given book ids; ids of deleted books are missing."""
+    return _fetch_by_ids("Books", BOOK_PAGE_COLUMNS, "book_id", book_ids)
+
+def fetch_students_by_ids(student_ids):
+    """Retrieve the current page rows for the given student ids; ids of deleted students are missing."""
+    return _fetch_by_ids("Students", STUDENT_PAGE_COLUMNS, "student_id", student_ids)
+
 
 def validate_uuid(book_id):
     try:
@@ -92,54 +368,51 @@ def validate_uuid(book_id):
         # در صورتی که UUID نامعتبر باشد، خطا را می‌گیرد
         return False
     
+def compact_isbn(isbn):
+    """Return an ISBN without hyphens or spaces (check digit X upper-cased), the form Books.isbn holds."""
+    return None if isbn is None else re.sub(r"[\s-]", "", str(isbn)).upper()
+
 def insert_book(title, author, isbn, copies, category='Other'):
     """Insert a new book into the database."""
     query = """
         INSERT INTO Books (book_id, title, author, isbn, copies_available, category)
         VALUES (%s, %s, %s, %s, %s, %s)
     """
-    params = (str(uuid.uuid4()), title, author, isbn, copies, category)
+    book_id = str(uuid.uuid4())
+    params = (book_id, title, author, compact_isbn(isbn), copies, category)
     execute_query(query, params)
+    invalidate_books()
+    return book_id
 
 def insert_loan(book_id, student_name, borrow_date, due_date):
     try:
-        conn = psycopg2.connect(dbname="library_db", user="postgres", password="2275483n", host="localhost")
-        cursor = conn.cursor()
-
         # پیدا کردن student_id بر اساس student_name
-        cursor.execute("SELECT student_id FROM Students WHERE name = %s", (student_name,))
-        result = cursor.fetchone()
-
-        if result:
-            student_id = result[0]
-
-            # تبدیل book_id و student_id به UUID
-            try:
-                book_id = uuid.UUID(book_id)
-                student_id = uuid.UUID(student_id)
-            except ValueError:
-                print("Invalid book ID or student ID format. Please provide valid UUIDs.")
-                return
-
-            # درج اطلاعات امانت در جدول Loans
-            cursor.execute(
-                "INSERT INTO Loans (book_id, student_id, date_borrowed, due_date) VALUES (%s, %s, %s, %s)",
-                (book_id, student_id, borrow_date, due_date)
-            )
-
-            conn.commit()
-            print("Loan inserted successfully.")
-        else:
-            print("Student not found.")
+        student_id = resolve_student_id(student_name)
+        with create_connection() as conn:
+            with conn.cursor() as cursor:
+                if student_id:
+                    # تبدیل book_id و student_id به UUID
+                    try:
+                        book_id = uuid.UUID(book_id)
+                        student_id = uuid.UUID(student_id)
+                    except ValueError:
+                        print("Invalid book ID or student ID format. Please provide valid UUIDs.")
+                        return
+
+                    # درج اطلاعات امانت در جدول Loans
+                    cursor.execute(
+                        "INSERT INTO Loans (book_id, student_id, date_borrowed, due_date) VALUES (%s, %s, %s, %s)",
+                        (book_id, student_id, borrow_date, due_date)
+                    )
+
+                    conn.commit()
+                    print("Loan inserted successfully.")
+                else:
+                    print("Student not found.")
 
     except Exception as e:
         print(f"Error inserting loan: {e}")
 
-    finally:
-        if 'conn' in locals() and conn:
-            cursor.close()
-            conn.close()
-
 def update_book(book_id, new_title, new_author, new_copies, new_category):
     # اعتبارسنجی UUID قبل از انجام عملیات
     if not validate_uuid(book_id):
@@ -148,6 +421,8 @@ def update_book(book_id, new_title, new_author, new_copies, new_category):
     query = "UPDATE Books SET title = %s, author = %s, copies_available = %s, category = %s WHERE book_id = %s"
     params = (new_title, new_author, new_copies, new_category, book_id)
     execute_query(query, params)
+    book_id_cache.invalidate_value(str(book_id))
+    invalidate_books()
 
 
 def update_book_inventory(book_title, new_inventory):
@@ -159,12 +434,15 @@ def update_book_inventory(book_title, new_inventory):
     """
     params = (new_inventory, book_title)
     execute_query(query, params)
+    invalidate_books()
 
 def delete_book(title):
     """Delete a book from the database based on its title."""
     query = "DELETE FROM Books WHERE title = %s"
     params = (title,)
     execute_query(query, params)
+    book_id_cache.invalidate(title)
+    invalidate_books()
 
 def fetch_filtered_books(query):
     """Retrieve books based on the provided query."""
@@ -174,7 +452,7 @@ def fetch_filtered_books(query):
                 cursor.execute(query)
                 filtered_books = cursor.fetchall()
         return filtered_books
-    except psycopg2.DatabaseError as e:
+    except DatabaseError as e:
         print(f"Error fetching filtered books: {e}")
         return []
 
@@ -187,15 +465,10 @@ def get_student_uuid(student_name):
         raise ValueError("Invalid student ID format. Please provide a valid student name.")
     
 def fetch_students():
-    """Retrieve the list of students from the database."""
-    query = "SELECT student_id, name, email, phone, department FROM Students"
+    """Retrieve the students as read-only (student_id, name, email, phone, department) records."""
     try:
-        with create_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                students = cursor.fetchall()
-        return students
-    except psycopg2.DatabaseError as e:
+        return catalog_students()
+    except DatabaseError as e:
         print(f"Error fetching students: {e}")
         return []
 
@@ -205,8 +478,11 @@ def insert_student(name, email, phone, department):
         INSERT INTO Students (student_id, name, email, phone, department)
         VALUES (%s, %s, %s, %s, %s)
     """
-    params = (str(uuid.uuid4()), name, email, phone, department)
+    student_id = str(uuid.uuid4())
+    params = (student_id, name, email, phone, department)
     execute_query(query, params)
+    invalidate_students()
+    return student_id
 
 def update_student(student_id, name, email, phone, department):
     """Update student information in the database."""
@@ -217,12 +493,16 @@ def update_student(student_id, name, email, phone, department):
     """
     params = (name, email, phone, department, student_id)
     execute_query(query, params)
+    student_id_cache.invalidate_value(str(student_id))
+    invalidate_students()
 
 def delete_student(name):
     """Delete a student from the database based on their name."""
     query = "DELETE FROM Students WHERE name = %s"
     params = (name,)
     execute_query(query, params)
+    student_id_cache.invalidate(name)
+    invalidate_students()
 
 def fetch_filtered_students(query):
     """Retrieve students based on name or department."""
@@ -238,187 +518,486 @@ def fetch_filtered_students(query):
                 cursor.execute(sql_query, params)
                 students = cursor.fetchall()
         return students
-    except psycopg2.DatabaseError as e:
+    except DatabaseError as e:
         print(f"Error fetching filtered students: {e}")
         return []
 
 def check_book_availability(title):
     """Check if a book is available based on its title."""
-    query = "SELECT copies_available FROM Books WHERE title = %s"
-    params = (title,)
+    query = "SELECT copies_available FROM Books WHERE title = %(title)s"
+    params = {"title": title}
     try:
         with create_connection() as connection:
             with connection.cursor() as cursor:
-                cursor.execute(query, params)
+                get_backend().execute_named(cursor, "check_book_availability", query, params)
                 result = cursor.fetchone()
                 return result and result[0] > 0
-    except psycopg2.DatabaseError as e:
+    except DatabaseError as e:
         print(f"Error checking book availability: {e}")
         return False
 
-def lend_book(book_title, student_name):
-    """Lend a book to a student."""
-    if not check_book_availability(book_title):
-        return False, "Book is not available."
+FINE_PER_DAY = 100
+LOAN_DAYS = 14
 
-    return_date = datetime.date.today() + datetime.timedelta(days=14)
+class FinePolicy:
+    """How overdue days turn into a fine.
 
-    query_book = "SELECT book_id FROM Books WHERE title = %s"
-    params_book = (book_title,)
+    rate_per_day applies to every category without an entry in category_rates.
+    The first grace_days overdue days are free, and max_fine (if set) caps the
+    fine of a single loan. The return paths below and fine_engine's nightly
+    accrual both use the active policy (fine_policy), so a return never
+    overwrites an accrued fine with a differently computed one.
+    """
+
+    def __init__(self, rate_per_day=FINE_PER_DAY, category_rates=None, grace_days=0, max_fine=None):
+        self.rate_per_day = rate_per_day
+        self.category_rates = dict(category_rates or {})
+        self.grace_days = grace_days
+        self.max_fine = max_fine
+
+    def rate_for(self, category):
+        return self.category_rates.get(category, self.rate_per_day)
+
+    def fine(self, days_late, category=None):
+        """Fine of one loan returned days_late days after its due date."""
+        fine = max(days_late - self.grace_days, 0) * self.rate_for(category)
+        if self.max_fine is not None:
+            fine = min(fine, self.max_fine)
+        return round(fine, 2)
+
+    def sql_params(self):
+        """The policy as parameters of RETURN_BOOK_SQL."""
+        return {
+            "fine_per_day": self.rate_per_day,
+            "grace_days": self.grace_days,
+            "max_fine": self.max_fine,
+            "category_rates": json.dumps(self.category_rates),
+        }
+
+def _env_number(name, default):
+    """Read a number setting from the environment; a bad value is ignored with a warning."""
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
     try:
-        with create_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(query_book, params_book)
-                book_result = cursor.fetchone()
-                if not book_result:
-                    return False, "Book not found."
-                book_id = book_result[0]
-
-                query_student = "SELECT student_id FROM Students WHERE name = %s"
-                params_student = (student_name,)
-                cursor.execute(query_student, params_student)
-                student_result = cursor.fetchone()
-                if not student_result:
-                    return False, "Student not found."
-                student_id = student_result[0]
-
-                borrow_id = str(uuid.uuid4())
-                query_borrow = """
-                    INSERT INTO Borrows (borrow_id, book_id, student_id, borrow_date, return_date)
-                    VALUES (%s, %s, %s, %s, %s)
-                """
-                params_borrow = (borrow_id, book_id, student_id, datetime.date.today(), return_date)
+        return float(value)
+    except ValueError:
+        print(f"Ignoring invalid value for {name}: {value!r}")
+        return default
 
-                query_update_book = """
-                    UPDATE Books
-                    SET copies_available = copies_available - 1
-                    WHERE book_id = %s
-                """
-                params_update_book = (book_id,)
+def load_fine_policy():
+    """Build the fine policy from LIBRARY_FINE_* environment variables.
 
-                cursor.execute(query_borrow, params_borrow)
-                cursor.execute(query_update_book, params_update_book)
-                connection.commit()
+    LIBRARY_FINE_CATEGORY_RATES is a comma-separated list of CATEGORY=RATE.
+    """
+    rates = {}
+    for item in os.environ.get("LIBRARY_FINE_CATEGORY_RATES", "").split(","):
+        category, _, rate = item.partition("=")
+        if category.strip() and rate.strip():
+            try:
+                rates[category.strip()] = float(rate)
+            except ValueError:
+                print(f"Ignoring invalid rate in LIBRARY_FINE_CATEGORY_RATES: {item.strip()!r}")
+    return FinePolicy(
+        rate_per_day=_env_number("LIBRARY_FINE_PER_DAY", FINE_PER_DAY),
+        category_rates=rates,
+        grace_days=int(_env_number("LIBRARY_FINE_GRACE_DAYS", 0)),
+        max_fine=_env_number("LIBRARY_FINE_MAX", None),
+    )
+
+fine_policy = load_fine_policy()
+
+def set_fine_policy(policy):
+    """Make policy the one used by return_book, return_books_bulk and calculate_fine."""
+    global fine_policy
+    fine_policy = policy
+
+# Each checkout is one statement: the conditional UPDATE only decrements a
+# book that still has copies (re-checked under the row lock, so concurrent
+# desks cannot lend the same last copy) and the Borrows row is only inserted
+# when that UPDATE succeeded.
+LEND_BOOK_SQL = """
+    WITH taken AS (
+        UPDATE Books
+        SET copies_available = copies_available - 1
+        WHERE book_id = %(book_id)s AND copies_available > 0
+        RETURNING book_id
+    ), borrow AS (
+        INSERT INTO Borrows (borrow_id, book_id, student_id, borrow_date, return_date)
+        SELECT %(borrow_id)s, taken.book_id, %(student_id)s, %(borrow_date)s, %(return_date)s
+        FROM taken
+        RETURNING borrow_id
+    )
+    SELECT EXISTS (SELECT 1 FROM borrow)
+"""
+
+# Closes the oldest open borrow for the pair, computes its fine in SQL and
+# puts the copy back, all in one statement.
+RETURN_BOOK_SQL = """
+    WITH returned AS (
+        UPDATE Borrows br
+        SET actual_return_date = %(today)s,
+            fine = LEAST(
+                GREATEST(%(today)s - br.return_date - %(grace_days)s, 0)
+                * COALESCE((%(category_rates)s::jsonb ->> (SELECT category FROM Books WHERE book_id = br.book_id))::numeric,
+                           %(fine_per_day)s),
+                %(max_fine)s)
+        WHERE br.actual_return_date IS NULL AND br.borrow_id = (
+            SELECT borrow_id
+            FROM Borrows
+            WHERE book_id = %(book_id)s AND student_id = %(student_id)s
+              AND actual_return_date IS NULL
+            ORDER BY borrow_date
+            LIMIT 1
+        )
+        RETURNING br.book_id, br.fine
+    ), restocked AS (
+        UPDATE Books b
+        SET copies_available = b.copies_available + 1
+        FROM returned
+        WHERE b.book_id = returned.book_id
+    )
+    SELECT (SELECT fine FROM returned)
+"""
+
+def execute_single(query, params=None, name=None):
+    """Run one self-contained statement in autocommit mode and return its first row.
+
+    A single statement is atomic on its own, so skipping BEGIN/COMMIT keeps the
+    whole call to one round trip. A named statement runs as a server-side
+    prepared statement on PostgreSQL (see prepared.py). Backends without
+    writable CTEs may replace a named statement with several (see
+    db_backend.SQLITE_STATEMENTS); those run in one transaction and the last
+    one's first row is returned.
+    """
+    statements = get_backend().statements(name, query)
+    with create_connection() as connection:
+        if len(statements) > 1:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement, params or ())
+                rows = cursor.fetchall() if cursor.description else []
+            connection.commit()
+            return rows[0] if rows else None
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                if name:
+                    get_backend().execute_named(cursor, name, query, params)
+                else:
+                    cursor.execute(query, params or ())
+                return cursor.fetchone()
+        finally:
+            connection.autocommit = False
 
-                return True, f"Book lent successfully! Return by {return_date}."
-    except psycopg2.DatabaseError as e:
+def lend_book(book_title, student_name):
+    """Lend a book to a student."""
+    today = datetime.date.today()
+    return_date = today + datetime.timedelta(days=LOAN_DAYS)
+    try:
+        book_id = resolve_book_id(book_title)
+        if not book_id:
+            return False, "Book not found."
+        student_id = resolve_student_id(student_name)
+        if not student_id:
+            return False, "Student not found."
+
+        params = {
+            "book_id": book_id,
+            "student_id": student_id,
+            "borrow_id": str(uuid.uuid4()),
+            "borrow_date": today,
+            "return_date": return_date,
+        }
+        lent, = execute_single(LEND_BOOK_SQL, params, name="lend_book")
+    except DatabaseError as e:
         print(f"Error lending book: {e}")
         return False, f"An error occurred: {e}"
 
+    if not lent:
+        # The cached id may belong to a book that was deleted elsewhere.
+        book_id_cache.invalidate(book_title)
+        return False, "Book is not available."
+    invalidate_books()
+    return True, f"Book lent successfully! Return by {return_date}."
+
 def return_book(book_title, student_name):
     """Return a book and calculate the fine if delayed."""
-    query_book = "SELECT book_id FROM Books WHERE title = %s"
-    params_book = (book_title,)
     try:
-        with create_connection() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(query_book, params_book)
-                book_result = cursor.fetchone()
-                if not book_result:
-                    return False, "Book not found."
-                book_id = book_result[0]
-
-                query_student = "SELECT student_id FROM Students WHERE name = %s"
-                params_student = (student_name,)
-                cursor.execute(query_student, params_student)
-                student_result = cursor.fetchone()
-                if not student_result:
-                    return False, "Student not found."
-                student_id = student_result[0]
-
-                query_borrow = "SELECT borrow_date, return_date FROM Borrows WHERE book_id = %s AND student_id = %s AND actual_return_date IS NULL"
-                params_borrow = (book_id, student_id)
-                cursor.execute(query_borrow, params_borrow)
-                borrow_result = cursor.fetchone()
-                if not borrow_result:
-                    return False, "No active borrow record found."
-
-                borrow_date, return_date = borrow_result
-                actual_return_date = datetime.date.today()
-
-                fine = calculate_fine(return_date, actual_return_date)
-
-                query_update_return = """
-                    UPDATE Borrows
-                    SET actual_return_date = %s, fine = %s
-                    WHERE book_id = %s AND student_id = %s AND actual_return_date IS NULL
-                """
-                params_update_return = (actual_return_date, fine, book_id, student_id)
-
-                query_update_book = """
-                    UPDATE Books
-                    SET copies_available = copies_available + 1
-                    WHERE book_id = %s
-                """
-                params_update_book = (book_id,)
-
-                cursor.execute(query_update_return, params_update_return)
-                cursor.execute(query_update_book, params_update_book)
-                connection.commit()
-
-                return True, f"Book returned successfully! Fine: {fine}."
-    except psycopg2.DatabaseError as e:
+        book_id = resolve_book_id(book_title)
+        if not book_id:
+            return False, "Book not found."
+        student_id = resolve_student_id(student_name)
+        if not student_id:
+            return False, "Student not found."
+
+        params = {
+            "book_id": book_id,
+            "student_id": student_id,
+            "today": datetime.date.today(),
+            **fine_policy.sql_params(),
+        }
+        fine, = execute_single(RETURN_BOOK_SQL, params, name="return_book") or (None,)
+    except DatabaseError as e:
         print(f"Error returning book: {e}")
         return False, f"An error occurred: {e}"
 
-def calculate_fine(return_date, actual_return_date):
-    """Calculate fine based on the return dates."""
+    if fine is None:
+        return False, "No active borrow record found."
+    invalidate_books()
+    return True, f"Book returned successfully! Fine: {fine}."
+
+def _resolve_ids_bulk(cursor, cache, query, keys):
+    """Resolve many titles/names at once: cache hits first, then one ANY() query for the rest."""
+    resolved = {}
+    missing = []
+    for key in set(keys):
+        cached = cache.get(key)
+        if cached is not None:
+            resolved[key] = cached
+        else:
+            missing.append(key)
+    if missing:
+        cursor.execute(query, (missing,))
+        for key, value in cursor.fetchall():
+            cache.put(key, value)
+            resolved[key] = value
+    return resolved
+
+def _finish_bulk(connection, results, all_or_nothing):
+    """Commit a bulk operation, or roll it all back when all_or_nothing and any item failed."""
+    if all_or_nothing and not all(success for success, _ in results):
+        connection.rollback()
+        return [
+            (False, "Batch rolled back: another item failed.") if success else (success, message)
+            for success, message in results
+        ]
+    connection.commit()
+    if any(success for success, _ in results):
+        invalidate_books()
+    return results
+
+def lend_books_bulk(pairs, all_or_nothing=False):
+    """Lend many books at once; pairs is a list of (book_title, student_name).
+
+    Ids are resolved with one set-based query, the affected Books rows are
+    locked once, all Borrows rows go in with a single multi-row INSERT and
+    copies_available is adjusted with one grouped UPDATE. Copies are handed
+    out in list order. Returns one (success, message) tuple per pair, like
+    lend_book; with all_or_nothing, any failure rolls back the whole batch.
+    """
+    if not pairs:
+        return []
+    today = datetime.date.today()
+    return_date = today + datetime.timedelta(days=LOAN_DAYS)
+    try:
+        with create_connection() as connection:
+            with connection.cursor() as cursor:
+                book_ids = _resolve_ids_bulk(
+                    cursor, book_id_cache, RESOLVE_BOOK_IDS_SQL,
+                    [title for title, _ in pairs])
+                student_ids = _resolve_ids_bulk(
+                    cursor, student_id_cache, RESOLVE_STUDENT_IDS_SQL,
+                    [name for _, name in pairs])
+
+                # قفل کردن ردیف‌های کتاب به ترتیب ثابت برای جلوگیری از بن‌بست
+                cursor.execute("""
+                    SELECT book_id, copies_available FROM Books
+                    WHERE book_id = ANY(%s::uuid[])
+                    ORDER BY book_id
+                    FOR UPDATE
+                """, (sorted(set(book_ids.values())),))
+                remaining = dict(cursor.fetchall())
+
+                results = []
+                borrows = []
+                taken = {}
+                for title, name in pairs:
+                    book_id = book_ids.get(title)
+                    student_id = student_ids.get(name)
+                    if not book_id or book_id not in remaining:
+                        results.append((False, "Book not found."))
+                    elif not student_id:
+                        results.append((False, "Student not found."))
+                    elif remaining[book_id] <= 0:
+                        results.append((False, "Book is not available."))
+                    else:
+                        remaining[book_id] -= 1
+                        taken[book_id] = taken.get(book_id, 0) + 1
+                        borrows.append((str(uuid.uuid4()), book_id, student_id, today, return_date))
+                        results.append((True, f"Book lent successfully! Return by {return_date}."))
+
+                if borrows:
+                    get_backend().execute_values(cursor, """
+                        INSERT INTO Borrows (borrow_id, book_id, student_id, borrow_date, return_date)
+                        VALUES %s
+                    """, borrows, template="(%s::uuid, %s::uuid, %s::uuid, %s, %s)", page_size=len(borrows))
+                    get_backend().execute_values(cursor, """
+                        UPDATE Books b
+                        SET copies_available = b.copies_available - v.taken
+                        FROM (VALUES %s) AS v(book_id, taken)
+                        WHERE b.book_id = v.book_id::uuid
+                    """, list(taken.items()), page_size=len(taken))
+
+                return _finish_bulk(connection, results, all_or_nothing)
+    except DatabaseError as e:
+        print(f"Error lending books: {e}")
+        return [(False, f"An error occurred: {e}")] * len(pairs)
+
+def return_books_bulk(pairs, all_or_nothing=False):
+    """Return many books at once; pairs is a list of (book_title, student_name).
+
+    Each pair closes the oldest open borrow it has left (so a pair listed
+    twice closes two borrows). Fines, Borrows updates and the restock are
+    each applied with one set-based statement. Returns one (success, message)
+    tuple per pair, like return_book.
+    """
+    if not pairs:
+        return []
+    today = datetime.date.today()
+    try:
+        with create_connection() as connection:
+            with connection.cursor() as cursor:
+                book_ids = _resolve_ids_bulk(
+                    cursor, book_id_cache, RESOLVE_BOOK_IDS_SQL,
+                    [title for title, _ in pairs])
+                student_ids = _resolve_ids_bulk(
+                    cursor, student_id_cache, RESOLVE_STUDENT_IDS_SQL,
+                    [name for _, name in pairs])
+
+                wanted = {
+                    (book_ids[title], student_ids[name])
+                    for title, name in pairs
+                    if title in book_ids and name in student_ids
+                }
+                open_borrows = {}
+                if wanted:
+                    rows = get_backend().execute_values(cursor, """
+                        SELECT br.borrow_id, br.book_id, br.student_id, br.return_date, b.category
+                        FROM Borrows br
+                        JOIN (VALUES %s) AS v(book_id, student_id)
+                          ON br.book_id = v.book_id::uuid AND br.student_id = v.student_id::uuid
+                        JOIN Books b ON b.book_id = br.book_id
+                        WHERE br.actual_return_date IS NULL
+                        ORDER BY br.book_id, br.student_id, br.borrow_date
+                        FOR UPDATE OF br
+                    """, list(wanted), page_size=len(wanted), fetch=True)
+                    for borrow_id, book_id, student_id, return_date, category in rows:
+                        open_borrows.setdefault((str(book_id), str(student_id)), []).append((borrow_id, return_date, category))
+
+                results = []
+                returned = []
+                restock = {}
+                for title, name in pairs:
+                    book_id = book_ids.get(title)
+                    student_id = student_ids.get(name)
+                    if not book_id:
+                        results.append((False, "Book not found."))
+                    elif not student_id:
+                        results.append((False, "Student not found."))
+                    elif not open_borrows.get((book_id, student_id)):
+                        results.append((False, "No active borrow record found."))
+                    else:
+                        borrow_id, return_date, category = open_borrows[(book_id, student_id)].pop(0)
+                        fine = calculate_fine(return_date, today, category)
+                        returned.append((borrow_id, fine))
+                        restock[book_id] = restock.get(book_id, 0) + 1
+                        results.append((True, f"Book returned successfully! Fine: {fine}."))
+
+                if returned:
+                    get_backend().execute_values(cursor, """
+                        UPDATE Borrows br
+                        SET actual_return_date = v.returned_on, fine = v.fine
+                        FROM (VALUES %s) AS v(borrow_id, fine, returned_on)
+                        WHERE br.borrow_id = v.borrow_id::uuid
+                    """, [(borrow_id, fine, today) for borrow_id, fine in returned],
+                        template="(%s, %s, %s::date)", page_size=len(returned))
+                    get_backend().execute_values(cursor, """
+                        UPDATE Books b
+                        SET copies_available = b.copies_available + v.returned
+                        FROM (VALUES %s) AS v(book_id, returned)
+                        WHERE b.book_id = v.book_id::uuid
+                    """, list(restock.items()), page_size=len(restock))
+
+                return _finish_bulk(connection, results, all_or_nothing)
+    except DatabaseError as e:
+        print(f"Error returning books: {e}")
+        return [(False, f"An error occurred: {e}")] * len(pairs)
+
+def calculate_fine(return_date, actual_return_date, category=None):
+    """Calculate fine based on the return dates, using the active fine policy."""
     if actual_return_date <= return_date:
         return 0
-    delay_days = (actual_return_date - return_date).days
-    fine_per_day = 100
-    return delay_days * fine_per_day
+    return fine_policy.fine((actual_return_date - return_date).days, category)
 
 def fetch_unpaid_fines():
     """Display a list of unpaid fines."""
-    query = """
-        SELECT student_id, book_id, fine
-        FROM Borrows
-        WHERE fine > 0 AND paid = FALSE
-    """
+    query = UNPAID_FINES_QUERY
     try:
         with create_connection() as connection:
             with connection.cursor() as cursor:
                 cursor.execute(query)
                 fines = cursor.fetchall()
         return fines
-    except psycopg2.DatabaseError as e:
+    except DatabaseError as e:
         print(f"Error fetching unpaid fines: {e}")
         return []
 
+def stream_query(query, params=None, itersize=DEFAULT_ITERSIZE):
+    """Yield the rows of a query through a server-side (named) cursor.
+
+    Only `itersize` rows are held in client memory at a time and the first
+    rows arrive before the query has finished. The pooled connection stays
+    borrowed until the generator is exhausted or closed. A database error
+    raises DatabaseError out of the iteration rather than ending it early,
+    so a failed stream is never mistaken for a complete one.
+    """
+    with create_connection() as connection:
+        with get_backend().stream_cursor(connection, itersize) as cursor:
+            cursor.execute(query, params)
+            for row in cursor:
+                yield row
+
+def iter_books(itersize=DEFAULT_ITERSIZE):
+    """Stream the books returned by fetch_books without loading them all at once."""
+    return stream_query(BOOKS_QUERY, itersize=itersize)
+
+def iter_students(itersize=DEFAULT_ITERSIZE):
+    """Stream the students returned by fetch_students without loading them all at once."""
+    return stream_query(STUDENTS_QUERY, itersize=itersize)
+
+def iter_unpaid_fines(itersize=DEFAULT_ITERSIZE):
+    """Stream the unpaid fines returned by fetch_unpaid_fines."""
+    return stream_query(UNPAID_FINES_QUERY, itersize=itersize)
+
+def iter_filtered_books(query, params=None, itersize=DEFAULT_ITERSIZE):
+    """Stream the rows of a book query, like fetch_filtered_books."""
+    return stream_query(query, params, itersize=itersize)
+
 def pay_fine(student_name, book_title):
     """Pay fine and update the fine payment status."""
-    query_book = "SELECT book_id FROM Books WHERE title = %s"
-    params_book = (book_title,)
     try:
+        book_id = resolve_book_id(book_title)
+        if not book_id:
+            return False, "Book not found."
+        student_id = resolve_student_id(student_name)
+        if not student_id:
+            return False, "Student not found."
+
         with create_connection() as connection:
             with connection.cursor() as cursor:
-                cursor.execute(query_book, params_book)
-                book_result = cursor.fetchone()
-                if not book_result:
-                    return False, "Book not found."
-                book_id = book_result[0]
-
-                query_student = "SELECT student_id FROM Students WHERE name = %s"
-                params_student = (student_name,)
-                cursor.execute(query_student, params_student)
-                student_result = cursor.fetchone()
-                if not student_result:
-                    return False, "Student not found."
-                student_id = student_result[0]
-
                 query_update_fine = """
                     UPDATE Borrows
                     SET paid = TRUE
-                    WHERE student_id = %s AND book_id = %s AND paid = FALSE
+                    WHERE student_id = %(student_id)s AND book_id = %(book_id)s AND paid = FALSE
                 """
-                params_update_fine = (student_id, book_id)
+                params_update_fine = {"student_id": student_id, "book_id": book_id}
 
-                cursor.execute(query_update_fine, params_update_fine)
+                get_backend().execute_named(cursor, "pay_fine", query_update_fine, params_update_fine)
                 connection.commit()
 
                 return True, "Fine paid successfully."
-    except psycopg2.DatabaseError as e:
+    except DatabaseError as e:
         print(f"Error paying fine: {e}")
         return False, f"An error occurred: {e}"
 
@@ -0,0 +1,135 @@
+import itertools
+import traceback
+
+from PyQt5.QtWidgets import QProgressBar
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class TaskSignals(QObject):
+    result = pyqtSignal(int, object)
+    error = pyqtSignal(int, str)
+    finished = pyqtSignal(int)
+
+
+class DbTask(QRunnable):
+    """Runs one blocking database call on a QThreadPool thread."""
+
+    def __init__(self, task_id, fn, args, kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.task_id = task_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            if not self.cancelled:
+                result = self.fn(*self.args, **self.kwargs)
+                if not self.cancelled:
+                    self.signals.result.emit(self.task_id, result)
+        except Exception as e:
+            traceback.print_exc()
+            if not self.cancelled:
+                self.signals.error.emit(self.task_id, str(e))
+        finally:
+            self.signals.finished.emit(self.task_id)
+
+
+class DbRunner(QObject):
+    """Dispatches database calls to a thread pool and delivers results on the GUI thread.
+
+    run() returns immediately; on_result/on_error are called on the GUI thread
+    when the call completes. Tasks submitted with the same `key` replace each
+    other: starting a new "search" cancels the previous one, whose result is
+    then dropped. A query that is already executing cannot be interrupted, so
+    cancellation only guarantees its result never reaches the UI.
+    """
+
+    busy_changed = pyqtSignal(bool)
+    error = pyqtSignal(str)
+
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self._ids = itertools.count(1)
+        self._tasks = {}
+        self._callbacks = {}
+        self._keys = {}
+
+    def run(self, fn, *args, on_result=None, on_error=None, key=None, **kwargs):
+        if key is not None:
+            self.cancel(key)
+        task_id = next(self._ids)
+        task = DbTask(task_id, fn, args, kwargs)
+        task.signals.result.connect(self._on_result)
+        task.signals.error.connect(self._on_error)
+        task.signals.finished.connect(self._on_finished)
+        self._tasks[task_id] = task
+        self._callbacks[task_id] = (on_result, on_error)
+        if key is not None:
+            self._keys[key] = task_id
+        was_busy = self.is_busy()
+        self.pool.start(task)
+        if not was_busy:
+            self.busy_changed.emit(True)
+        return task_id
+
+    def cancel(self, key):
+        """Cancel the pending task registered under key, if any."""
+        task_id = self._keys.pop(key, None)
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        task.cancelled = True
+        self._callbacks.pop(task_id, None)
+        if self.pool.tryTake(task):
+            self._on_finished(task_id)
+        elif not self.is_busy():
+            self.busy_changed.emit(False)
+
+    def cancel_all(self):
+        for key in list(self._keys):
+            self.cancel(key)
+        for task in self._tasks.values():
+            task.cancelled = True
+        self._callbacks.clear()
+
+    def is_busy(self):
+        return any(not task.cancelled for task in self._tasks.values())
+
+    def _on_result(self, task_id, result):
+        on_result, _ = self._callbacks.get(task_id, (None, None))
+        if on_result is not None:
+            on_result(result)
+
+    def _on_error(self, task_id, message):
+        _, on_error = self._callbacks.get(task_id, (None, None))
+        if on_error is not None:
+            on_error(message)
+        elif task_id in self._callbacks:
+            self.error.emit(message)
+
+    def _on_finished(self, task_id):
+        if self._tasks.pop(task_id, None) is None:
+            return
+        self._callbacks.pop(task_id, None)
+        for key, key_task_id in list(self._keys.items()):
+            if key_task_id == task_id:
+                del self._keys[key]
+        if not self.is_busy():
+            self.busy_changed.emit(False)
+
+
+class BusyIndicator(QProgressBar):
+    """Indeterminate progress bar that is visible while a DbRunner has work in flight."""
+
+    def __init__(self, runner, parent=None):
+        super().__init__(parent)
+        self.setRange(0, 0)
+        self.setTextVisible(False)
+        self.setMaximumHeight(6)
+        self.hide()
+        runner.busy_changed.connect(self.setVisible)
@@ -0,0 +1,138 @@
+import argparse
+import datetime
+import io
+import time
+
+import numpy as np
+
+from db_pool import get_connection
+import db_utils
+
+# Fines are written with library.bulk_load on (migration 7), so listeners get
+# this one notification when the accrual commits instead of one per loan.
+RELOAD_NOTIFY_SQL = """SELECT pg_notify('library_changes', '{"table": "borrows", "op": "RELOAD"}')"""
+
+class FinePolicy(db_utils.FinePolicy):
+    """db_utils.FinePolicy with a vectorised rate lookup for compute_fines."""
+
+    @classmethod
+    def from_policy(cls, policy):
+        return cls(policy.rate_per_day, policy.category_rates, policy.grace_days, policy.max_fine)
+
+    def rates_for(self, categories):
+        """Map an array of category names to an array of daily rates."""
+        categories = np.asarray(categories, dtype=object)
+        if categories.size == 0:
+            return np.zeros(0)
+        unique, inverse = np.unique(categories.astype(str), return_inverse=True)
+        unique_rates = np.array([self.category_rates.get(name, self.rate_per_day) for name in unique], dtype=np.float64)
+        return unique_rates[inverse]
+
+
+def compute_fines(due_dates, as_of, categories=None, policy=None):
+    """Compute the fine for every loan at once.
+
+    due_dates is a sequence (or datetime64[D] array) of due dates, as_of the
+    date fines are computed for, and categories the book category per loan.
+    Returns a float64 array aligned with due_dates.
+    """
+    policy = policy or FinePolicy.from_policy(db_utils.fine_policy)
+    due = np.asarray(due_dates, dtype="datetime64[D]")
+    days_late = (np.datetime64(as_of, "D") - due).astype(np.int64) - policy.grace_days
+    np.clip(days_late, 0, None, out=days_late)
+    if categories is None or not policy.category_rates:
+        fines = days_late * float(policy.rate_per_day)
+    else:
+        fines = days_late * policy.rates_for(categories)
+    if policy.max_fine is not None:
+        np.minimum(fines, policy.max_fine, out=fines)
+    return np.round(fines, 2)
+
+
+def accrue_fines(as_of=None, policy=None, chunk_size=200_000):
+    """Recompute fines of all overdue loans that are still out and write them in bulk.
+
+    Overdue loans are streamed through a server-side cursor in chunks; each
+    chunk is computed with compute_fines and COPYed into a temporary table,
+    and one UPDATE ... FROM applies the changed fines at the end. Everything
+    runs in one transaction, with the per-row change notifications replaced
+    by a single RELOAD. Returns (loans_scanned, loans_updated).
+    """
+    as_of = as_of or datetime.date.today()
+    policy = policy or FinePolicy.from_policy(db_utils.fine_policy)
+    cutoff = as_of - datetime.timedelta(days=policy.grace_days)
+    scanned = 0
+
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            # The pool's statement_timeout is meant for interactive queries, not this scan.
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("SET LOCAL library.bulk_load = 'on'")
+            cursor.execute("""
+                CREATE TEMP TABLE fine_accrual (borrow_id uuid PRIMARY KEY, fine numeric)
+                ON COMMIT DROP
+            """)
+
+        with connection.cursor(name="overdue_loans") as overdue:
+            overdue.itersize = chunk_size
+            overdue.execute("""
+                SELECT br.borrow_id, br.return_date, b.category
+                FROM Borrows br
+                JOIN Books b ON b.book_id = br.book_id
+                WHERE br.actual_return_date IS NULL AND br.return_date < %s
+            """, (cutoff,))
+            while True:
+                rows = overdue.fetchmany(chunk_size)
+                if not rows:
+                    break
+                borrow_ids, due_dates, categories = zip(*rows)
+                fines = compute_fines(due_dates, as_of, categories, policy)
+                buffer = io.StringIO("".join(f"{borrow_id}\t{fine:.2f}\n" for borrow_id, fine in zip(borrow_ids, fines)))
+                with connection.cursor() as cursor:
+                    cursor.copy_expert("COPY fine_accrual (borrow_id, fine) FROM STDIN", buffer)
+                scanned += len(rows)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE fine_accrual")
+            cursor.execute("""
+                UPDATE Borrows br
+                SET fine = f.fine
+                FROM fine_accrual f
+                WHERE br.borrow_id = f.borrow_id AND br.fine IS DISTINCT FROM f.fine
+            """)
+            updated = cursor.rowcount
+            if updated:
+                # Delivered when the transaction commits.
+                cursor.execute(RELOAD_NOTIFY_SQL)
+        connection.commit()
+
+    return scanned, updated
+
+
+def parse_category_rate(value):
+    category, _, rate = value.partition("=")
+    if not category or not rate:
+        raise argparse.ArgumentTypeError(f"Expected CATEGORY=RATE, got {value!r}")
+    return category, float(rate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nightly fine accrual for overdue loans that are still out.")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=None, help="date to compute fines for (YYYY-MM-DD)")
+    # Defaults come from the LIBRARY_FINE_* policy that return_book also applies.
+    defaults = db_utils.fine_policy
+    parser.add_argument("--rate", type=float, default=defaults.rate_per_day, help="default fine per overdue day")
+    parser.add_argument("--category-rate", type=parse_category_rate, action="append", default=[], help="CATEGORY=RATE override, repeatable")
+    parser.add_argument("--grace-days", type=int, default=defaults.grace_days, help="overdue days that are not fined")
+    parser.add_argument("--max-fine", type=float, default=defaults.max_fine, help="cap on a single loan's fine")
+    parser.add_argument("--chunk-size", type=int, default=200_000, help="loans per streamed chunk")
+    args = parser.parse_args(argv)
+
+    policy = FinePolicy(args.rate, {**defaults.category_rates, **dict(args.category_rate)}, args.grace_days, args.max_fine)
+    started = time.perf_counter()
+    scanned, updated = accrue_fines(args.as_of, policy, args.chunk_size)
+    print(f"Scanned {scanned:,} overdue loans, updated {updated:,} fines in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
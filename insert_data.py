@@ -1,68 +1,176 @@
-import psycopg2
+from db_pool import get_connection
 from faker import Faker
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import io
+import os
+import sys
+import time
 import uuid
 import random
 
-# ایجاد اتصال به دیتابیس
-def create_connection():
-    return psycopg2.connect(
-        dbname="library_db",
-        user="postgres",  # نام کاربری خود را وارد کنید
-        password="2275483n",  # رمز عبور خود را وارد کنید
-        host="localhost",
-        port="5432"
-    )
-
 fake = Faker()
 
-def generate_students(n=100):
+DEPARTMENTS = ['Computer Science', 'Mathematics', 'Physics', 'History', 'Literature']
+CATEGORIES = ['Science', 'Fiction', 'History', 'Technology', 'Other']
+
+STUDENT_COLUMNS = ("student_id", "name", "email", "phone", "department")
+BOOK_COLUMNS = ("book_id", "title", "author", "isbn", "copies_available", "category")
+
+def generate_students(n=100, faker=None, rng=None):
+    faker = faker or fake
+    rng = rng or random
     students = []
     for _ in range(n):
         students.append((
-            str(uuid.uuid4()),
-            fake.name(),
-            fake.email(),
-            fake.phone_number()[:15],  # محدود کردن طول به 15 کاراکتر
-            random.choice(['Computer Science', 'Mathematics', 'Physics', 'History', 'Literature'])
+            str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            faker.name(),
+            faker.email(),
+            faker.phone_number()[:15],  # محدود کردن طول به 15 کاراکتر
+            rng.choice(DEPARTMENTS)
         ))
     return students
 
-def generate_books(n=50):
-    categories = ['Science', 'Fiction', 'History', 'Technology', 'Other']
+def generate_books(n=50, faker=None, rng=None, isbn_start=None):
+    faker = faker or fake
+    rng = rng or random
     books = []
-    for _ in range(n):
+    for i in range(n):
         books.append((
-            str(uuid.uuid4()),
-            fake.sentence(nb_words=3),
-            fake.name(),
-            fake.isbn13(),
-            random.randint(0, 5),  # تعداد نسخه‌های موجود بین 0 تا 5
-            random.choice(categories)
+            str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            faker.sentence(nb_words=3),
+            faker.name(),
+            faker.isbn13(separator="") if isbn_start is None else sequential_isbn13(isbn_start + i),
+            rng.randint(0, 5),  # تعداد نسخه‌های موجود بین 0 تا 5
+            rng.choice(CATEGORIES)
         ))
     return books
 
-def insert_data():
-    connection = create_connection()
-    cursor = connection.cursor()
-
-    # درج داده‌های دانشجو
-    students = generate_students()
-    cursor.executemany("""
-        INSERT INTO Students (student_id, name, email, phone, department)
-        VALUES (%s, %s, %s, %s, %s)
-    """, students)
-
-    # درج داده‌های کتاب
-    books = generate_books()
-    cursor.executemany("""
-        INSERT INTO Books (book_id, title, author, isbn, copies_available, category)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, books)
+def sequential_isbn13(number):
+    """Build a valid, unique ISBN-13 from a row number (faker's random ISBNs collide at scale)."""
+    digits = f"978{number:09d}"
+    checksum = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return f"{digits}{checksum}"
 
+def next_isbn_number(connection):
+    """First sequential_isbn13 number above every 978 ISBN already in Books, so reruns never collide."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT max(substr(isbn, 4, 9)::bigint) FROM Books WHERE isbn ~ '^978[0-9]{10}$'")
+        highest = cursor.fetchone()[0]
     connection.commit()
-    cursor.close()
-    connection.close()
+    return 0 if highest is None else highest + 1
+
+def generate_chunk_csv(kind, start, count, seed, isbn_start=0):
+    """Generate one chunk of rows in a worker process and return it as CSV text for COPY."""
+    chunk_seed = seed * 1_000_003 + start
+    faker = Faker()
+    faker.seed_instance(chunk_seed)
+    rng = random.Random(chunk_seed)
+    if kind == "students":
+        rows = generate_students(count, faker, rng)
+    else:
+        rows = generate_books(count, faker, rng, isbn_start=isbn_start + start)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def copy_chunk(connection, table, columns, csv_text):
+    """Stream a CSV chunk into a table with COPY FROM STDIN, in its own transaction.
+
+    Like catalog_io.load_chunk, the COPY runs without the pool's
+    statement_timeout and with library.bulk_load on (migration 7), so
+    listeners get one RELOAD notification per chunk instead of one per row.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        cursor.execute("SET LOCAL library.bulk_load = 'on'")
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            io.StringIO(csv_text)
+        )
+        cursor.execute(
+            "SELECT pg_notify('library_changes', json_build_object('table', lower(%s), 'op', 'RELOAD')::text)",
+            (table,),
+        )
+    connection.commit()
+
+def bulk_load(kind, total, seed=42, chunk_size=50_000, workers=None, isbn_start=None):
+    """Generate `total` rows in a process pool and COPY them chunk by chunk.
+
+    At most two chunks per worker are in flight at any time, so memory stays
+    flat regardless of `total`. Books get sequential ISBNs from isbn_start
+    (by default just above the highest one already loaded).
+    """
+    table, columns = ("Students", STUDENT_COLUMNS) if kind == "students" else ("Books", BOOK_COLUMNS)
+    chunks = iter(range(0, total, chunk_size))
+    loaded = 0
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor, get_connection() as connection:
+        if kind == "books" and isbn_start is None:
+            isbn_start = next_isbn_number(connection)
+        max_in_flight = workers * 2
+        in_flight = []
+
+        def submit_next():
+            start = next(chunks, None)
+            if start is not None:
+                count = min(chunk_size, total - start)
+                in_flight.append((count, executor.submit(generate_chunk_csv, kind, start, count, seed, isbn_start or 0)))
+
+        for _ in range(max_in_flight):
+            submit_next()
+        while in_flight:
+            count, future = in_flight.pop(0)
+            copy_chunk(connection, table, columns, future.result())
+            submit_next()
+            loaded += count
+            elapsed = time.perf_counter() - started
+            print(f"{table}: {loaded:,}/{total:,} rows ({loaded / elapsed:,.0f} rows/sec)", file=sys.stderr)
+    return loaded
+
+def insert_data():
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            # درج داده‌های دانشجو
+            students = generate_students()
+            cursor.executemany("""
+                INSERT INTO Students (student_id, name, email, phone, department)
+                VALUES (%s, %s, %s, %s, %s)
+            """, students)
+
+            # درج داده‌های کتاب
+            books = generate_books()
+            cursor.executemany("""
+                INSERT INTO Books (book_id, title, author, isbn, copies_available, category)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, books)
+
+        connection.commit()
     print("Sample data inserted successfully!")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Populate the library database with fake data.")
+    parser.add_argument("--bulk", action="store_true", help="generate in a process pool and load with COPY")
+    parser.add_argument("--students", type=int, default=100, help="number of students (bulk mode)")
+    parser.add_argument("--books", type=int, default=50, help="number of books (bulk mode)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for reproducible data (bulk mode)")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="rows per COPY chunk (bulk mode)")
+    parser.add_argument("--workers", type=int, default=None, help="generator processes (default: CPU count)")
+    parser.add_argument("--isbn-start", type=int, default=None,
+                        help="first sequential ISBN number (default: above the highest in Books)")
+    args = parser.parse_args(argv)
+
+    if not args.bulk:
+        insert_data()
+        return
+
+    started = time.perf_counter()
+    loaded = bulk_load("students", args.students, args.seed, args.chunk_size, args.workers)
+    loaded += bulk_load("books", args.books, args.seed, args.chunk_size, args.workers, args.isbn_start)
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {loaded:,} rows in {elapsed:.1f}s ({loaded / elapsed:,.0f} rows/sec).")
+
 if __name__ == "__main__":
-    insert_data()
+    main()
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with a per-entry time-to-live and hit/miss counters."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or now - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_value(self, value):
+        """Drop every key that maps to value (e.g. all titles cached for a renamed book)."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == value]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class VersionedCache(LRUCache):
+    """LRUCache whose entries belong to namespaces with a version counter.
+
+    bump(namespace) invalidates every entry of that namespace at once by
+    moving its version on and dropping the namespace's entries, so old
+    generations (whole catalogs, in db_utils) are not kept until they fall
+    out of the LRU. get_or_load() is a read-through lookup.
+    """
+
+    def __init__(self, maxsize=64, ttl=60):
+        super().__init__(maxsize, ttl)
+        self._versions = {}
+        self.invalidations = 0
+
+    def version(self, namespace):
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            self.invalidations += 1
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def peek(self, namespace, key):
+        """Return the current cached value for (namespace, key), or None without loading it."""
+        return self.get((namespace, self.version(namespace), key))
+
+    def get_or_load(self, namespace, key, loader):
+        """Return the cached value for (namespace, key), calling loader() on a miss."""
+        version = self.version(namespace)
+        value = self.get((namespace, version, key))
+        if value is None:
+            value = loader()
+            # A write that bumped the version while loader() ran may not be in value.
+            if self.version(namespace) == version:
+                self.put((namespace, version, key), value)
+        return value
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["versions"] = dict(self._versions)
+            stats["invalidations"] = self.invalidations
+        return stats
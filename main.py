@@ -2,17 +2,27 @@ import sys
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton, QListWidget, QMessageBox, QInputDialog, QTableWidget, QTableWidgetItem, QHBoxLayout, QLabel
 )
-from PyQt5.QtCore import QThread, pyqtSignal
-from db_connection import create_connection  
-import time
+from db_pool import get_connection
+from db_utils import fetch_books_page, book_index, insert_book, invalidate_books, collation_key
+from change_feed import ChangeListener
+from db_worker import DbRunner, BusyIndicator
 
-class UpdateThread(QThread):
-    update_signal = pyqtSignal()
+def query_books(available_only=False):
+    """خواندن لیست کتاب‌ها (book_id, title, author) از کش کاتالوگ"""
+    return [
+        (book_id, title, author)
+        for book_id, title, author, _, _ in book_index().filter(in_stock=True if available_only else None)
+    ]
 
-    def run(self):
-        while True:
-            time.sleep(5)  # هر ۵ ثانیه یک‌بار به‌روزرسانی انجام می‌شود
-            self.update_signal.emit()
+def insert_book_row(title, author):
+    insert_book(title, author, None, 1, 'Other')
+
+def delete_book_row(book_id):
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM Books WHERE book_id = %s", (book_id,))
+        connection.commit()
+    invalidate_books()
 
 class PaginatedBookView(QWidget):
     def __init__(self):
@@ -23,6 +33,21 @@ class PaginatedBookView(QWidget):
         # تعداد کتاب‌ها در هر صفحه
         self.items_per_page = 10
         self.current_page = 1
+        self.page_token = None
+        self.next_token = None
+        self.prev_token = None
+        self.total_books = None
+        self.rows = []
+        # مقایسه عنوان‌ها به همان ترتیب ORDER BY دیتابیس (تا دریافت collation، ترتیب ساده str)
+        self.collate = str
+
+        self.runner = DbRunner(self)
+        self.busy_indicator = BusyIndicator(self.runner, self)
+        self.runner.run(
+            collation_key,
+            on_result=lambda collate: setattr(self, "collate", collate or str),
+            on_error=lambda message: print(f"Error reading the database collation: {message}"),
+        )
 
         # جدول نمایش کتاب‌ها
         self.table = QTableWidget(0, 3)
@@ -44,50 +69,103 @@ class PaginatedBookView(QWidget):
 
         # چیدمان اصلی
         layout = QVBoxLayout()
+        layout.addWidget(self.busy_indicator)
         layout.addWidget(self.table)
         layout.addLayout(button_layout)
 
         self.setLayout(layout)
         self.load_data()
 
-        # راه‌اندازی Thread برای به‌روزرسانی لحظه‌ای
-        self.update_thread = UpdateThread()
-        self.update_thread.update_signal.connect(self.load_data)
-        self.update_thread.start()
+        # دریافت تغییرات از دیتابیس (LISTEN/NOTIFY) به جای پرس‌وجوی دوره‌ای
+        self.change_listener = ChangeListener()
+        self.change_listener.changes_received.connect(self.on_changes)
+        self.change_listener.start()
+
+    def closeEvent(self, event):
+        self.change_listener.stop()
+        self.change_listener.wait()
+        self.runner.cancel_all()
+        super().closeEvent(event)
 
     def load_data(self):
         """بارگذاری داده‌های صفحه فعلی از دیتابیس"""
-        connection = create_connection()
-        if connection:
-            cursor = connection.cursor()
-            offset = (self.current_page - 1) * self.items_per_page
-            cursor.execute("""
-                SELECT book_id, title, author
-                FROM Books
-                LIMIT %s OFFSET %s
-            """, (self.items_per_page, offset))
-            books = cursor.fetchall()
-            self.table.setRowCount(0)
-
-            for row, book in enumerate(books):
-                self.table.insertRow(row)
-                for col, data in enumerate(book):
-                    self.table.setItem(row, col, QTableWidgetItem(str(data)))
-
-            cursor.close()
-            connection.close()
-
-            self.page_label.setText(f"Page: {self.current_page}")
+        self.runner.run(
+            fetch_books_page, self.page_token, self.items_per_page, with_total=self.total_books is None,
+            on_result=self.show_page, on_error=lambda message: print(f"Error: {message}"), key="page",
+        )
+
+    def show_page(self, page):
+        if page["total"] is not None:
+            self.total_books = page["total"]
+        self.next_token = page["next_token"]
+        self.prev_token = page["prev_token"]
+        self.rows = page["rows"]
+
+        self.table.setRowCount(0)
+        for row, book in enumerate(page["rows"]):
+            self.table.insertRow(row)
+            for col, data in enumerate(book[:3]):
+                self.table.setItem(row, col, QTableWidgetItem(str(data)))
+
+        self.update_page_label()
+
+    def update_page_label(self):
+        total_pages = max(1, -(-self.total_books // self.items_per_page)) if self.total_books is not None else "?"
+        self.page_label.setText(f"Page: {self.current_page} / {total_pages}")
+        self.prev_button.setEnabled(self.prev_token is not None)
+        self.next_button.setEnabled(self.next_token is not None)
+
+    def on_changes(self, changes):
+        """بارگذاری مجدد فقط وقتی تغییری روی صفحه فعلی اثر دارد"""
+        book_changes = [change for change in changes if change.get("table") == "books"]
+        if not book_changes:
+            return
+        # تغییرات کلاینت‌های دیگر هم کش کاتالوگ را باطل می‌کنند
+        invalidate_books()
+        if any(change.get("op") == "RELOAD" for change in book_changes):
+            # بارگذاری انبوه: تعداد کل نامعلوم است و صفحه دوباره خوانده می‌شود
+            self.total_books = None
+            self.load_data()
+            return
+        if self.total_books is not None:
+            for change in book_changes:
+                if change.get("op") == "INSERT":
+                    self.total_books += 1
+                elif change.get("op") == "DELETE":
+                    self.total_books -= 1
+        if any(self.affects_page(change) for change in book_changes):
+            self.load_data()
+        else:
+            self.update_page_label()
+
+    def affects_page(self, change):
+        """آیا تغییر روی ردیف‌های صفحه فعلی یا بازه عنوان‌های آن اثر دارد؟"""
+        if change.get("op") not in ("INSERT", "UPDATE", "DELETE"):
+            # اعلان ناشناخته: صفحه دوباره خوانده می‌شود
+            return True
+        visible_ids = {str(book[0]) for book in self.rows}
+        if change.get("book_id") in visible_ids:
+            return True
+        if len(self.rows) < self.items_per_page:
+            return True
+        key = change.get("key")
+        if key is None:
+            return False
+        collate = self.collate
+        return collate(self.rows[0][1]) <= collate(key) <= collate(self.rows[-1][1])
 
     def next_page(self):
         """رفتن به صفحه بعدی"""
-        self.current_page += 1
-        self.load_data()
+        if self.next_token:
+            self.page_token = self.next_token
+            self.current_page += 1
+            self.load_data()
 
     def prev_page(self):
         """رفتن به صفحه قبلی"""
-        if self.current_page > 1:
-            self.current_page -= 1
+        if self.prev_token:
+            self.page_token = self.prev_token
+            self.current_page = max(1, self.current_page - 1)
             self.load_data()
 
 class BookManager(QWidget):
@@ -121,6 +199,10 @@ class BookManager(QWidget):
         layout.addWidget(self.filter_button)
         layout.addWidget(self.paginated_view_button)
 
+        self.runner = DbRunner(self)
+        self.runner.error.connect(lambda message: QMessageBox.critical(self, "Database Error", message))
+        layout.addWidget(BusyIndicator(self.runner, self))
+
         self.setLayout(layout)
         self.load_books()
 
@@ -129,19 +211,16 @@ class BookManager(QWidget):
         
     def load_books(self):
         """بارگذاری لیست کتاب‌ها از دیتابیس"""
-        try:
-            connection = create_connection()
-            cursor = connection.cursor()
-            cursor.execute("SELECT book_id, title, author FROM Books")
-            books = cursor.fetchall()
-            self.book_list.clear()
-            for book in books:
-                self.book_list.addItem(f"{book[0]} - {book[1]} by {book[2]}")
-        except Exception as e:
-            QMessageBox.critical(self, "Database Error", str(e))
-        finally:
-            cursor.close()
-            connection.close()
+        self.runner.run(query_books, on_result=self.show_books, key="books")
+
+    def show_books(self, books):
+        self.book_list.clear()
+        for book in books:
+            self.book_list.addItem(f"{book[0]} - {book[1]} by {book[2]}")
+
+    def after_change(self, message):
+        QMessageBox.information(self, "Success", message)
+        self.load_books()
 
     def add_book(self):
         """افزودن کتاب جدید"""
@@ -156,53 +235,18 @@ class BookManager(QWidget):
                 QMessageBox.warning(self, "Error", "Author name is too long. Maximum length is 15 characters.")
                 return
             
-            try:
-                connection = create_connection()
-                cursor = connection.cursor()
-                cursor.execute("INSERT INTO Books (title, author, copies_available, category) VALUES (%s, %s, %s, %s)", 
-                               (title, author, 1, 'Other'))
-                connection.commit()
-                QMessageBox.information(self, "Success", "Book Added Successfully!")
-                self.load_books()
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", str(e))
-            finally:
-                cursor.close()
-                connection.close()
+            self.runner.run(insert_book_row, title, author, on_result=lambda _: self.after_change("Book Added Successfully!"))
 
     def delete_book(self):
         """حذف کتاب انتخاب‌شده"""
         selected_item = self.book_list.currentItem()
         if selected_item:
             book_id = selected_item.text().split(" - ")[0]
-            try:
-                connection = create_connection()
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM Books WHERE book_id = %s", (book_id,))
-                connection.commit()
-                QMessageBox.information(self, "Success", "Book Deleted Successfully!")
-                self.load_books()
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", str(e))
-            finally:
-                cursor.close()
-                connection.close()
+            self.runner.run(delete_book_row, book_id, on_result=lambda _: self.after_change("Book Deleted Successfully!"))
 
     def filter_books(self):
         """فیلتر کردن کتاب‌های موجود"""
-        try:
-            connection = create_connection()
-            cursor = connection.cursor()
-            cursor.execute("SELECT book_id, title, author FROM Books WHERE copies_available > 0")
-            books = cursor.fetchall()
-            self.book_list.clear()
-            for book in books:
-                self.book_list.addItem(f"{book[0]} - {book[1]} by {book[2]}")
-        except Exception as e:
-            QMessageBox.critical(self, "Database Error", str(e))
-        finally:
-            cursor.close()
-            connection.close()
+        self.runner.run(query_books, True, on_result=self.show_books, key="books")
 
     def open_paginated_view(self):
         """باز کردن نمای صفحه‌بندی کتاب‌ها"""
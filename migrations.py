@@ -0,0 +1,602 @@
+import argparse
+import collections
+import hashlib
+import re
+import sys
+
+import psycopg2
+
+from db_pool import get_connection
+
+Migration = collections.namedtuple("Migration", "version name sql")
+
+# Arbitrary key for pg_advisory_xact_lock so two processes never apply the
+# same migration at once.
+MIGRATION_LOCK_ID = 7_204_116
+
+MIGRATIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version integer PRIMARY KEY,
+    name varchar NOT NULL,
+    checksum char(64) NOT NULL,
+    applied_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+# Applied migrations are recorded by checksum and must never be edited;
+# change the schema by appending a new version.
+MIGRATIONS = (
+    Migration(1, "core tables", """
+CREATE TABLE IF NOT EXISTS Books (
+    book_id uuid PRIMARY KEY,
+    title varchar NOT NULL,
+    author varchar,
+    isbn varchar UNIQUE,
+    copies_available integer NOT NULL DEFAULT 0 CHECK (copies_available >= 0),
+    category varchar
+);
+CREATE TABLE IF NOT EXISTS Students (
+    student_id uuid PRIMARY KEY,
+    name varchar NOT NULL,
+    email varchar,
+    phone varchar,
+    department varchar
+);
+CREATE TABLE IF NOT EXISTS Borrows (
+    borrow_id uuid PRIMARY KEY,
+    book_id uuid NOT NULL REFERENCES Books (book_id) ON DELETE CASCADE,
+    student_id uuid NOT NULL REFERENCES Students (student_id) ON DELETE CASCADE,
+    borrow_date date NOT NULL,
+    return_date date NOT NULL,
+    actual_return_date date,
+    fine numeric NOT NULL DEFAULT 0 CHECK (fine >= 0),
+    paid boolean NOT NULL DEFAULT FALSE,
+    CHECK (return_date >= borrow_date),
+    CHECK (actual_return_date IS NULL OR actual_return_date >= borrow_date)
+);
+"""),
+    # Loans/Fines are still written by db_utils.insert_loan and cleared by n.py.
+    Migration(2, "legacy loan tables", """
+CREATE TABLE IF NOT EXISTS Loans (
+    loan_id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    book_id uuid NOT NULL REFERENCES Books (book_id) ON DELETE CASCADE,
+    student_id uuid NOT NULL REFERENCES Students (student_id) ON DELETE CASCADE,
+    date_borrowed date NOT NULL,
+    due_date date NOT NULL,
+    return_date date
+);
+CREATE TABLE IF NOT EXISTS Fines (
+    fine_id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    loan_id uuid NOT NULL REFERENCES Loans (loan_id) ON DELETE CASCADE,
+    amount numeric NOT NULL DEFAULT 0,
+    paid boolean NOT NULL DEFAULT FALSE
+);
+"""),
+    # One index per hot lookup: title/name resolution and keyset paging,
+    # the open-borrow probe in return_book, the unpaid probe in pay_fine,
+    # the unpaid-fines report, the overdue scan in fine_engine and the
+    # category filter.
+    Migration(3, "hot path indexes", """
+CREATE INDEX IF NOT EXISTS books_title_idx ON Books (title, book_id);
+CREATE INDEX IF NOT EXISTS books_category_idx ON Books (category);
+CREATE INDEX IF NOT EXISTS students_name_idx ON Students (name, student_id);
+CREATE INDEX IF NOT EXISTS borrows_open_idx ON Borrows (book_id, student_id, borrow_date)
+    WHERE actual_return_date IS NULL;
+CREATE INDEX IF NOT EXISTS borrows_unpaid_idx ON Borrows (student_id, book_id)
+    WHERE paid = FALSE;
+CREATE INDEX IF NOT EXISTS borrows_unpaid_fines_idx ON Borrows (student_id)
+    WHERE fine > 0 AND paid = FALSE;
+CREATE INDEX IF NOT EXISTS borrows_overdue_idx ON Borrows (return_date)
+    WHERE actual_return_date IS NULL;
+CREATE INDEX IF NOT EXISTS loans_book_student_idx ON Loans (book_id, student_id);
+CREATE INDEX IF NOT EXISTS fines_loan_idx ON Fines (loan_id);
+"""),
+    # Trigram GIN indexes over the same expressions search.py queries, so
+    # both the fuzzy (<%) and the substring (ILIKE) predicates are index scans.
+    # The expressions are copied here (not imported) so this migration's text
+    # and checksum never change with search.py.
+    Migration(4, "search indexes", """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS students_search_trgm_idx ON Students USING GIN ((name || ' ' || coalesce(email, '') || ' ' || coalesce(department, '')) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS books_search_trgm_idx ON Books USING GIN ((title || ' ' || coalesce(author, '') || ' ' || coalesce(isbn, '')) gin_trgm_ops);
+"""),
+    # Every row change on the watched tables sends one notification carrying
+    # the table, operation, the ids the row references and its sort key
+    # (title/name) so change_feed listeners can tell whether a visible page
+    # is affected.
+    Migration(5, "change feed triggers", """
+CREATE OR REPLACE FUNCTION library_notify_change() RETURNS trigger AS $$
+DECLARE
+    rec jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('library_changes', json_build_object(
+        'table', lower(TG_TABLE_NAME),
+        'op', TG_OP,
+        'book_id', rec->>'book_id',
+        'student_id', rec->>'student_id',
+        'borrow_id', rec->>'borrow_id',
+        'key', COALESCE(rec->>'title', rec->>'name')
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS books_notify_change ON Books;
+CREATE TRIGGER books_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON Books
+    FOR EACH ROW EXECUTE FUNCTION library_notify_change();
+
+DROP TRIGGER IF EXISTS students_notify_change ON Students;
+CREATE TRIGGER students_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON Students
+    FOR EACH ROW EXECUTE FUNCTION library_notify_change();
+
+DROP TRIGGER IF EXISTS borrows_notify_change ON Borrows;
+CREATE TRIGGER borrows_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON Borrows
+    FOR EACH ROW EXECUTE FUNCTION library_notify_change();
+"""),
+    # Summary tables behind reports.py, kept current by a row trigger on
+    # Borrows so every writer (lend/return, bulk, fine_engine, pay_fine)
+    # updates them in the same transaction. Each trigger call only touches
+    # the summary rows whose key or contribution actually changed.
+    Migration(6, "circulation reports", """
+CREATE TABLE IF NOT EXISTS report_book_loans (
+    book_id uuid PRIMARY KEY REFERENCES Books (book_id) ON DELETE CASCADE,
+    category varchar NOT NULL DEFAULT '',
+    loan_count integer NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS report_book_loans_rank_idx ON report_book_loans (category, loan_count DESC);
+
+CREATE TABLE IF NOT EXISTS report_open_loans (
+    student_id uuid NOT NULL REFERENCES Students (student_id) ON DELETE CASCADE,
+    due_date date NOT NULL,
+    open_count integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, due_date)
+);
+CREATE INDEX IF NOT EXISTS report_open_loans_due_idx ON report_open_loans (due_date);
+
+CREATE TABLE IF NOT EXISTS report_student_fines (
+    student_id uuid PRIMARY KEY REFERENCES Students (student_id) ON DELETE CASCADE,
+    unpaid_total numeric NOT NULL DEFAULT 0,
+    unpaid_count integer NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS report_student_fines_total_idx ON report_student_fines (unpaid_total DESC)
+    WHERE unpaid_total > 0;
+
+CREATE TABLE IF NOT EXISTS report_daily_circulation (
+    day date PRIMARY KEY,
+    borrowed integer NOT NULL DEFAULT 0,
+    returned integer NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS borrows_returned_idx ON Borrows (actual_return_date)
+    WHERE actual_return_date IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION library_report_borrows() RETURNS trigger AS $$
+DECLARE
+    is_update boolean := TG_OP = 'UPDATE';
+    old_fine numeric := 0;
+    new_fine numeric := 0;
+BEGIN
+    IF TG_OP <> 'INSERT' AND NOT OLD.paid AND OLD.fine > 0 THEN
+        old_fine := OLD.fine;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NOT NEW.paid AND NEW.fine > 0 THEN
+        new_fine := NEW.fine;
+    END IF;
+
+    -- Loans per book.
+    IF NOT is_update OR OLD.book_id IS DISTINCT FROM NEW.book_id THEN
+        IF TG_OP <> 'INSERT' THEN
+            UPDATE report_book_loans SET loan_count = loan_count - 1 WHERE book_id = OLD.book_id;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO report_book_loans (book_id, category, loan_count)
+            SELECT book_id, COALESCE(category, ''), 1 FROM Books WHERE book_id = NEW.book_id
+            ON CONFLICT (book_id) DO UPDATE SET loan_count = report_book_loans.loan_count + 1;
+        END IF;
+    END IF;
+
+    -- Open loans per student and due date.
+    IF NOT is_update
+       OR (OLD.student_id, OLD.return_date, OLD.actual_return_date IS NULL)
+          IS DISTINCT FROM (NEW.student_id, NEW.return_date, NEW.actual_return_date IS NULL) THEN
+        IF TG_OP <> 'INSERT' AND OLD.actual_return_date IS NULL THEN
+            UPDATE report_open_loans SET open_count = open_count - 1
+            WHERE student_id = OLD.student_id AND due_date = OLD.return_date;
+            DELETE FROM report_open_loans
+            WHERE student_id = OLD.student_id AND due_date = OLD.return_date AND open_count <= 0;
+        END IF;
+        IF TG_OP <> 'DELETE' AND NEW.actual_return_date IS NULL THEN
+            INSERT INTO report_open_loans (student_id, due_date, open_count)
+            VALUES (NEW.student_id, NEW.return_date, 1)
+            ON CONFLICT (student_id, due_date) DO UPDATE SET open_count = report_open_loans.open_count + 1;
+        END IF;
+    END IF;
+
+    -- Unpaid fines per student.
+    IF NOT is_update OR OLD.student_id IS DISTINCT FROM NEW.student_id OR old_fine <> new_fine THEN
+        IF old_fine > 0 THEN
+            UPDATE report_student_fines
+            SET unpaid_total = unpaid_total - old_fine, unpaid_count = unpaid_count - 1
+            WHERE student_id = OLD.student_id;
+        END IF;
+        IF new_fine > 0 THEN
+            INSERT INTO report_student_fines (student_id, unpaid_total, unpaid_count)
+            VALUES (NEW.student_id, new_fine, 1)
+            ON CONFLICT (student_id) DO UPDATE
+            SET unpaid_total = report_student_fines.unpaid_total + new_fine,
+                unpaid_count = report_student_fines.unpaid_count + 1;
+        END IF;
+    END IF;
+
+    -- Borrowed and returned counts per day.
+    IF NOT is_update OR OLD.borrow_date IS DISTINCT FROM NEW.borrow_date THEN
+        IF TG_OP <> 'INSERT' THEN
+            UPDATE report_daily_circulation SET borrowed = borrowed - 1 WHERE day = OLD.borrow_date;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO report_daily_circulation (day, borrowed) VALUES (NEW.borrow_date, 1)
+            ON CONFLICT (day) DO UPDATE SET borrowed = report_daily_circulation.borrowed + 1;
+        END IF;
+    END IF;
+    IF NOT is_update OR OLD.actual_return_date IS DISTINCT FROM NEW.actual_return_date THEN
+        IF TG_OP <> 'INSERT' AND OLD.actual_return_date IS NOT NULL THEN
+            UPDATE report_daily_circulation SET returned = returned - 1 WHERE day = OLD.actual_return_date;
+        END IF;
+        IF TG_OP <> 'DELETE' AND NEW.actual_return_date IS NOT NULL THEN
+            INSERT INTO report_daily_circulation (day, returned) VALUES (NEW.actual_return_date, 1)
+            ON CONFLICT (day) DO UPDATE SET returned = report_daily_circulation.returned + 1;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS borrows_report_change ON Borrows;
+CREATE TRIGGER borrows_report_change
+    AFTER INSERT OR UPDATE OR DELETE ON Borrows
+    FOR EACH ROW EXECUTE FUNCTION library_report_borrows();
+
+CREATE OR REPLACE FUNCTION library_report_book_category() RETURNS trigger AS $$
+BEGIN
+    UPDATE report_book_loans SET category = COALESCE(NEW.category, '') WHERE book_id = NEW.book_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS books_report_category ON Books;
+CREATE TRIGGER books_report_category
+    AFTER UPDATE OF category ON Books
+    FOR EACH ROW WHEN (OLD.category IS DISTINCT FROM NEW.category)
+    EXECUTE FUNCTION library_report_book_category();
+
+-- Recomputes every summary table from Borrows; used for the initial
+-- backfill and by reports.rebuild_reports() if they ever drift.
+CREATE OR REPLACE FUNCTION library_report_rebuild() RETURNS void AS $$
+BEGIN
+    LOCK TABLE Borrows IN SHARE MODE;
+    TRUNCATE report_book_loans, report_open_loans, report_student_fines, report_daily_circulation;
+    INSERT INTO report_book_loans (book_id, category, loan_count)
+    SELECT b.book_id, COALESCE(b.category, ''), count(*)
+    FROM Borrows br JOIN Books b ON b.book_id = br.book_id
+    GROUP BY b.book_id;
+    INSERT INTO report_open_loans (student_id, due_date, open_count)
+    SELECT student_id, return_date, count(*)
+    FROM Borrows WHERE actual_return_date IS NULL
+    GROUP BY student_id, return_date;
+    INSERT INTO report_student_fines (student_id, unpaid_total, unpaid_count)
+    SELECT student_id, sum(fine), count(*)
+    FROM Borrows WHERE fine > 0 AND paid = FALSE
+    GROUP BY student_id;
+    INSERT INTO report_daily_circulation (day, borrowed, returned)
+    SELECT day, sum(borrowed), sum(returned)
+    FROM (
+        SELECT borrow_date AS day, 1 AS borrowed, 0 AS returned FROM Borrows
+        UNION ALL
+        SELECT actual_return_date, 0, 1 FROM Borrows WHERE actual_return_date IS NOT NULL
+    ) events
+    GROUP BY day;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT library_report_rebuild();
+"""),
+    # Bulk writers (catalog_io, fine_engine) set library.bulk_load for their
+    # transaction; their rows then skip the per-row notification and the
+    # writer sends one RELOAD notification per transaction instead.
+    Migration(7, "bulk load notifications", """
+CREATE OR REPLACE FUNCTION library_notify_change() RETURNS trigger AS $$
+DECLARE
+    rec jsonb;
+BEGIN
+    IF current_setting('library.bulk_load', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('library_changes', json_build_object(
+        'table', lower(TG_TABLE_NAME),
+        'op', TG_OP,
+        'book_id', rec->>'book_id',
+        'student_id', rec->>'student_id',
+        'borrow_id', rec->>'borrow_id',
+        'key', COALESCE(rec->>'title', rec->>'name')
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""),
+    # notifications.py pages through students with open loans in student_id
+    # order; without this each chunk rescans every open overdue loan.
+    Migration(8, "open borrows by student", """
+CREATE INDEX IF NOT EXISTS borrows_open_student_idx ON Borrows (student_id, return_date)
+    WHERE actual_return_date IS NULL;
+"""),
+    # search.py also matches whole words with to_tsvector('simple', document);
+    # these let that predicate be an index scan alongside the trigram ones.
+    Migration(9, "full-text search indexes", """
+CREATE INDEX IF NOT EXISTS students_search_tsv_idx ON Students
+    USING GIN (to_tsvector('simple', (name || ' ' || coalesce(email, '') || ' ' || coalesce(department, ''))));
+CREATE INDEX IF NOT EXISTS books_search_tsv_idx ON Books
+    USING GIN (to_tsvector('simple', (title || ' ' || coalesce(author, '') || ' ' || coalesce(isbn, ''))));
+"""),
+    # ISBNs are stored as bare digits (db_utils.compact_isbn) so catalog_io's
+    # ON CONFLICT (isbn) matches books added with hyphenated ISBNs. A row
+    # whose compact form is already taken keeps its old value.
+    Migration(10, "compact isbns", """
+SET LOCAL library.bulk_load = 'on';
+UPDATE Books b
+SET isbn = c.isbn
+FROM (
+    SELECT DISTINCT ON (compact) book_id, compact AS isbn
+    FROM (
+        SELECT book_id, upper(regexp_replace(isbn, '[[:space:]-]', '', 'g')) AS compact
+        FROM Books
+        WHERE isbn ~ '[[:space:]-]'
+    ) candidates
+    WHERE NOT EXISTS (SELECT 1 FROM Books taken WHERE taken.isbn = candidates.compact)
+    ORDER BY compact, book_id
+) c
+WHERE b.book_id = c.book_id;
+SELECT pg_notify('library_changes', '{"table": "books", "op": "RELOAD"}');
+"""),
+    # The report summaries are kept by one trigger call per statement, which
+    # folds every changed row (old versions -1, new versions +1) into one
+    # upsert per summary table, so bulk lends and fine accrual cost one
+    # statement each instead of one per row. Daily circulation is split over
+    # 16 shards picked by backend pid, so concurrent desk transactions don't
+    # queue on today's single row; readers sum the shards.
+    Migration(11, "statement-level report triggers", """
+ALTER TABLE report_daily_circulation ADD COLUMN IF NOT EXISTS shard smallint NOT NULL DEFAULT 0;
+ALTER TABLE report_daily_circulation DROP CONSTRAINT IF EXISTS report_daily_circulation_pkey;
+ALTER TABLE report_daily_circulation ADD PRIMARY KEY (day, shard);
+
+CREATE OR REPLACE FUNCTION library_report_borrows_statement() RETURNS trigger AS $$
+DECLARE
+    changes text;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        changes := 'SELECT 1 AS sign, * FROM new_rows';
+    ELSIF TG_OP = 'DELETE' THEN
+        changes := 'SELECT -1 AS sign, * FROM old_rows';
+    ELSE
+        changes := 'SELECT -1 AS sign, * FROM old_rows UNION ALL SELECT 1, * FROM new_rows';
+    END IF;
+
+    -- Loans per book.
+    EXECUTE format($sql$
+        WITH changes AS (%s), delta AS (
+            SELECT book_id, sum(sign) AS loans FROM changes
+            GROUP BY book_id HAVING sum(sign) <> 0
+        )
+        INSERT INTO report_book_loans (book_id, category, loan_count)
+        SELECT d.book_id, COALESCE(b.category, ''), d.loans
+        FROM delta d JOIN Books b ON b.book_id = d.book_id
+        ORDER BY d.book_id
+        ON CONFLICT (book_id) DO UPDATE SET loan_count = report_book_loans.loan_count + EXCLUDED.loan_count
+    $sql$, changes);
+
+    -- Open loans per student and due date.
+    EXECUTE format($sql$
+        WITH changes AS (%s), delta AS (
+            SELECT student_id, return_date, sum(sign) AS loans FROM changes
+            WHERE actual_return_date IS NULL
+            GROUP BY student_id, return_date HAVING sum(sign) <> 0
+        )
+        INSERT INTO report_open_loans (student_id, due_date, open_count)
+        SELECT student_id, return_date, loans FROM delta
+        ORDER BY student_id, return_date
+        ON CONFLICT (student_id, due_date) DO UPDATE SET open_count = report_open_loans.open_count + EXCLUDED.open_count
+    $sql$, changes);
+    EXECUTE format($sql$
+        WITH changes AS (%s)
+        DELETE FROM report_open_loans r
+        USING (SELECT DISTINCT student_id, return_date FROM changes WHERE sign < 0 AND actual_return_date IS NULL) c
+        WHERE r.student_id = c.student_id AND r.due_date = c.return_date AND r.open_count <= 0
+    $sql$, changes);
+
+    -- Unpaid fines per student.
+    EXECUTE format($sql$
+        WITH changes AS (%s), delta AS (
+            SELECT student_id, sum(sign * fine) AS total, sum(sign) AS loans FROM changes
+            WHERE NOT paid AND fine > 0
+            GROUP BY student_id HAVING sum(sign * fine) <> 0 OR sum(sign) <> 0
+        )
+        INSERT INTO report_student_fines (student_id, unpaid_total, unpaid_count)
+        SELECT student_id, total, loans FROM delta
+        ORDER BY student_id
+        ON CONFLICT (student_id) DO UPDATE
+        SET unpaid_total = report_student_fines.unpaid_total + EXCLUDED.unpaid_total,
+            unpaid_count = report_student_fines.unpaid_count + EXCLUDED.unpaid_count
+    $sql$, changes);
+
+    -- Borrowed and returned counts per day, in this backend's shard.
+    EXECUTE format($sql$
+        WITH changes AS (%s), delta AS (
+            SELECT day, sum(borrowed) AS borrowed, sum(returned) AS returned
+            FROM (
+                SELECT borrow_date AS day, sign AS borrowed, 0 AS returned FROM changes
+                UNION ALL
+                SELECT actual_return_date, 0, sign FROM changes WHERE actual_return_date IS NOT NULL
+            ) events
+            GROUP BY day HAVING sum(borrowed) <> 0 OR sum(returned) <> 0
+        )
+        INSERT INTO report_daily_circulation (day, shard, borrowed, returned)
+        SELECT day, %L, borrowed, returned FROM delta
+        ORDER BY day
+        ON CONFLICT (day, shard) DO UPDATE
+        SET borrowed = report_daily_circulation.borrowed + EXCLUDED.borrowed,
+            returned = report_daily_circulation.returned + EXCLUDED.returned
+    $sql$, changes, pg_backend_pid() % 16);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS borrows_report_change ON Borrows;
+DROP FUNCTION IF EXISTS library_report_borrows();
+
+DROP TRIGGER IF EXISTS borrows_report_insert ON Borrows;
+CREATE TRIGGER borrows_report_insert
+    AFTER INSERT ON Borrows
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION library_report_borrows_statement();
+
+DROP TRIGGER IF EXISTS borrows_report_update ON Borrows;
+CREATE TRIGGER borrows_report_update
+    AFTER UPDATE ON Borrows
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION library_report_borrows_statement();
+
+DROP TRIGGER IF EXISTS borrows_report_delete ON Borrows;
+CREATE TRIGGER borrows_report_delete
+    AFTER DELETE ON Borrows
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION library_report_borrows_statement();
+"""),
+)
+
+# Indexes check_migrations() insists on, whatever schema_migrations says.
+HOT_PATH_INDEXES = (
+    "books_title_idx", "students_name_idx", "borrows_open_idx", "borrows_unpaid_idx",
+    "students_search_trgm_idx", "books_search_trgm_idx",
+    "students_search_tsv_idx", "books_search_tsv_idx",
+)
+
+
+def checksum(sql):
+    """SHA-256 of the statement text with whitespace collapsed."""
+    return hashlib.sha256(re.sub(r"\s+", " ", sql).strip().encode("utf-8")).hexdigest()
+
+
+def applied_migrations(cursor):
+    """Return {version: (name, checksum)} for every migration recorded in the database."""
+    cursor.execute("SELECT version, name, checksum FROM schema_migrations ORDER BY version")
+    return {version: (name, digest) for version, name, digest in cursor.fetchall()}
+
+
+def migrate(target=None):
+    """Apply every pending migration up to target (all by default), each in its own transaction.
+
+    Returns the versions that were applied by this call.
+    """
+    applied = []
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(MIGRATIONS_TABLE_SQL)
+        connection.commit()
+        for migration in MIGRATIONS:
+            if target is not None and migration.version > target:
+                break
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                    if migration.version in applied_migrations(cursor):
+                        connection.rollback()
+                        continue
+                    # Index builds on a large table can outlast the pool's statement_timeout.
+                    cursor.execute("SET LOCAL statement_timeout = 0")
+                    cursor.execute(migration.sql)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                        (migration.version, migration.name, checksum(migration.sql)),
+                    )
+                connection.commit()
+            except psycopg2.DatabaseError as e:
+                connection.rollback()
+                print(f"Error applying migration {migration.version} ({migration.name}): {e}")
+                raise
+            applied.append(migration.version)
+    return applied
+
+
+def check_migrations():
+    """Compare the database against MIGRATIONS without changing anything.
+
+    Returns a dict with the pending versions, applied versions whose SQL has
+    since changed, versions the database knows but this code does not, and
+    hot-path indexes that are missing. Everything empty means up to date.
+    """
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('schema_migrations')")
+            recorded = applied_migrations(cursor) if cursor.fetchone()[0] else {}
+            cursor.execute(
+                "SELECT name FROM unnest(%s::text[]) AS name WHERE to_regclass(name) IS NULL",
+                (list(HOT_PATH_INDEXES),),
+            )
+            missing_indexes = [row[0] for row in cursor.fetchall()]
+        connection.rollback()
+    known = {migration.version for migration in MIGRATIONS}
+    return {
+        "pending": [m.version for m in MIGRATIONS if m.version not in recorded],
+        "changed": [m.version for m in MIGRATIONS
+                    if m.version in recorded and recorded[m.version][1] != checksum(m.sql)],
+        "unknown": sorted(set(recorded) - known),
+        "missing_indexes": missing_indexes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply or check the library database schema migrations.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subcommands.add_parser("migrate", help="apply pending migrations")
+    migrate_parser.add_argument("--target", type=int, default=None, help="stop after this version")
+    subcommands.add_parser("check", help="exit 1 unless every migration is applied and unchanged")
+    subcommands.add_parser("status", help="list migrations and whether they are applied")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        applied = migrate(args.target)
+        print(f"Applied migrations: {', '.join(map(str, applied))}." if applied else "Database is up to date.")
+        return
+
+    report = check_migrations()
+    if args.command == "status":
+        for migration in MIGRATIONS:
+            state = "pending" if migration.version in report["pending"] else "applied"
+            if migration.version in report["changed"]:
+                state = "applied (changed since)"
+            print(f"{migration.version:>4}  {migration.name:<24} {state}")
+        for version in report["unknown"]:
+            print(f"{version:>4}  {'?':<24} applied (unknown to this code)")
+    problems = {key: value for key, value in report.items() if value}
+    if args.command == "check":
+        for key, value in problems.items():
+            print(f"{key}: {', '.join(map(str, value))}")
+        if problems:
+            sys.exit(1)
+        print("Database is up to date.")
+
+
+if __name__ == "__main__":
+    main()
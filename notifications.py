@@ -0,0 +1,270 @@
+import argparse
+import datetime
+import json
+import os
+import smtplib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from email.message import EmailMessage
+
+from db_backend import DatabaseError
+from db_utils import create_connection
+
+# One chunk is a page of students (keyset-paginated on student_id) together
+# with all of their overdue loans, so a student's notice is never split
+# across chunks and the last student_id of a finished chunk is a safe
+# resume point. borrows_open_student_idx (migration 8) lets each page start
+# at `after` instead of rescanning every open loan.
+OVERDUE_CHUNK_QUERY = """
+    WITH chunk AS (
+        SELECT DISTINCT student_id
+        FROM Borrows
+        WHERE actual_return_date IS NULL AND return_date < %(as_of)s AND student_id > %(after)s
+        ORDER BY student_id
+        LIMIT %(limit)s
+    )
+    SELECT s.student_id, s.name, s.email, b.title, br.return_date, br.fine
+    FROM chunk c
+    JOIN Students s ON s.student_id = c.student_id
+    JOIN Borrows br ON br.student_id = c.student_id
+    JOIN Books b ON b.book_id = br.book_id
+    WHERE br.actual_return_date IS NULL AND br.return_date < %(as_of)s
+    ORDER BY s.student_id, br.return_date, b.title
+"""
+
+FIRST_STUDENT_ID = "00000000-0000-0000-0000-000000000000"
+
+Notice = namedtuple("Notice", ["student_id", "name", "email", "subject", "body"])
+
+NOTICE_SUBJECT = "Overdue library books ({count})"
+NOTICE_BODY = """Dear {name},
+
+The following books were due back at the library and have not been returned yet:
+
+{lines}
+
+Please return them as soon as possible.{fine_note}
+"""
+NOTICE_LINE = "- {title} (due {due_date}, {days} days late)"
+
+
+def iter_overdue_chunks(as_of, after=FIRST_STUDENT_ID, chunk_size=1000):
+    """Yield lists of (student_id, name, email, [(title, due_date, fine), ...]) per chunk of students.
+
+    Each chunk is read with its own short query, so no connection stays
+    borrowed while notices are being sent.
+    """
+    while True:
+        params = {"as_of": as_of, "after": str(after), "limit": chunk_size}
+        with create_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(OVERDUE_CHUNK_QUERY, params)
+                rows = cursor.fetchall()
+        if not rows:
+            return
+        students = []
+        for student_id, name, email, title, due_date, fine in rows:
+            if not students or students[-1][0] != student_id:
+                students.append((student_id, name, email, []))
+            students[-1][3].append((title, due_date, fine))
+        yield students
+        if len(students) < chunk_size:
+            return
+        after = students[-1][0]
+
+
+def render_notice(student, as_of):
+    """Render one student's overdue loans as a Notice."""
+    student_id, name, email, loans = student
+    lines = "\n".join(
+        NOTICE_LINE.format(title=title, due_date=due_date, days=(as_of - due_date).days)
+        for title, due_date, _ in loans
+    )
+    fines = sum(fine or 0 for _, _, fine in loans)
+    fine_note = f"\nOutstanding fines on these loans: {fines}." if fines else ""
+    return Notice(
+        student_id, name, email,
+        NOTICE_SUBJECT.format(count=len(loans)),
+        NOTICE_BODY.format(name=name, lines=lines, fine_note=fine_note),
+    )
+
+
+class NotificationSink:
+    """Where rendered notices go. send_batch may be called from several threads at once."""
+
+    def send_batch(self, notices):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SmtpSink(NotificationSink):
+    """Send notices as e-mail; the default host/port match a local debugging SMTP server.
+
+    Each sending thread keeps its own SMTP session, and a batch goes out
+    over that one session.
+    """
+
+    def __init__(self, host="localhost", port=1025, sender="library@localhost"):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = smtplib.SMTP(self.host, self.port)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def send_batch(self, notices):
+        session = self._session()
+        for notice in notices:
+            if not notice.email:
+                continue
+            message = EmailMessage()
+            message["From"] = self.sender
+            message["To"] = notice.email
+            message["Subject"] = notice.subject
+            message.set_content(notice.body)
+            session.send_message(message)
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            try:
+                session.quit()
+            except smtplib.SMTPException:
+                pass
+
+
+class FileSink(NotificationSink):
+    """Append notices to a JSON-lines file."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def send_batch(self, notices):
+        text = "".join(json.dumps(notice._asdict(), ensure_ascii=False, default=str) + "\n" for notice in notices)
+        with self._lock:
+            self._file.write(text)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class QueueSink(NotificationSink):
+    """Put each batch (a list of Notice) on a queue, e.g. a queue.Queue read by another worker."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def send_batch(self, notices):
+        self.queue.put(list(notices))
+
+
+def load_checkpoint(path, as_of):
+    """Return (after, sent) saved for as_of, or the start of the run if there is none."""
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("as_of") == as_of.isoformat():
+            return state["after"], state["sent"]
+    return FIRST_STUDENT_ID, 0
+
+
+def save_checkpoint(path, as_of, after, sent):
+    if not path:
+        return
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump({"as_of": as_of.isoformat(), "after": str(after), "sent": sent}, f)
+    os.replace(temporary, path)
+
+
+def send_overdue_notices(sink, as_of=None, chunk_size=1000, batch_size=100, concurrency=4, checkpoint=None):
+    """Notify every student with overdue loans, one notice per student.
+
+    Students are read chunk_size at a time and their notices handed to
+    sink.send_batch in batches of batch_size, with at most `concurrency`
+    batches in flight; the next chunk is read while the current one is being
+    sent. After a chunk is fully sent its last student_id is written to the
+    checkpoint file, and a later run for the same as_of date resumes after
+    it. If a batch fails the run stops without advancing the checkpoint, so
+    a rerun may resend part of that chunk but never skips anyone.
+    Returns {"students", "batches", "failed", "resumed_after"}.
+    """
+    as_of = as_of or datetime.date.today()
+    after, sent = load_checkpoint(checkpoint, as_of)
+    stats = {"students": sent, "batches": 0, "failed": 0, "resumed_after": None if sent == 0 else after}
+
+    def flush(pending):
+        futures, count, last = pending
+        wait(futures)
+        errors = [future.exception() for future in futures if future.exception()]
+        if errors:
+            stats["failed"] += len(errors)
+            print(f"Error sending overdue notices: {errors[0]}")
+            return False
+        stats["students"] += count
+        stats["batches"] += len(futures)
+        save_checkpoint(checkpoint, as_of, last, stats["students"])
+        return True
+
+    pending = None
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for students in iter_overdue_chunks(as_of, after, chunk_size):
+                notices = [render_notice(student, as_of) for student in students]
+                futures = [
+                    executor.submit(sink.send_batch, notices[start:start + batch_size])
+                    for start in range(0, len(notices), batch_size)
+                ]
+                if pending and not flush(pending):
+                    wait(futures)
+                    pending = None
+                    break
+                pending = (futures, len(notices), students[-1][0])
+            if pending:
+                flush(pending)
+    except DatabaseError as e:
+        print(f"Error reading overdue loans: {e}")
+        if pending:
+            flush(pending)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send overdue-book notices to students.")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=None, help="date loans are overdue on (YYYY-MM-DD)")
+    parser.add_argument("--sink", choices=["smtp", "file"], default="file")
+    parser.add_argument("--output", default="overdue_notices.jsonl", help="file for --sink file")
+    parser.add_argument("--smtp-host", default="localhost")
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="students read per query")
+    parser.add_argument("--batch-size", type=int, default=100, help="notices per send_batch call")
+    parser.add_argument("--concurrency", type=int, default=4, help="batches sent at the same time")
+    parser.add_argument("--checkpoint", default=None, help="file to resume from and record progress in")
+    args = parser.parse_args(argv)
+
+    sink = SmtpSink(args.smtp_host, args.smtp_port) if args.sink == "smtp" else FileSink(args.output)
+    try:
+        stats = send_overdue_notices(sink, args.as_of, args.chunk_size, args.batch_size, args.concurrency, args.checkpoint)
+    finally:
+        sink.close()
+    print(f"Notified {stats['students']} students in {stats['batches']} batches ({stats['failed']} failed batches).")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+import re
+import threading
+import time
+import weakref
+
+import psycopg2.errors
+
+from query_trace import QueryTracer, _caller
+
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+
+# SQL types of the parameter names used by the db_utils hot statements; a
+# statement registered without explicit types takes its types from here.
+PARAM_TYPES = {
+    "book_id": "uuid",
+    "student_id": "uuid",
+    "borrow_id": "uuid",
+    "borrow_date": "date",
+    "return_date": "date",
+    "today": "date",
+    "fine_per_day": "numeric",
+    "grace_days": "integer",
+    "max_fine": "numeric",
+    "category_rates": "jsonb",
+    "title": "varchar",
+    "name": "varchar",
+}
+
+
+class PreparedStatement:
+    """A psycopg2-style statement with %(name)s parameters, rewritten for PREPARE/EXECUTE."""
+
+    def __init__(self, name, sql, types):
+        self.name = name
+        self.sql = sql
+        self.params = []
+
+        def number(match):
+            param = match.group(1)
+            if param not in self.params:
+                self.params.append(param)
+            return f"${self.params.index(param) + 1}"
+
+        body = _NAMED_PARAM.sub(number, sql).replace("%%", "%")
+        missing = [param for param in self.params if param not in types]
+        if missing:
+            raise ValueError(f"No type given for parameters {missing} of prepared statement {name!r}")
+        type_list = ", ".join(types[param] for param in self.params)
+        self.prepare_sql = f"PREPARE {name} ({type_list}) AS {body}" if self.params else f"PREPARE {name} AS {body}"
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(self.params))})" if self.params else f"EXECUTE {name}"
+
+    def args(self, params):
+        return [params[param] for param in self.params]
+
+
+class StatementRegistry:
+    """Prepares registered statements once per connection and runs them by name.
+
+    Which statements each connection has prepared is tracked per connection
+    object (weakly, so discarded pooled connections drop out). Timings go to
+    a private QueryTracer keyed by statement name, next to a count of how
+    many times each statement had to be prepared.
+    """
+
+    def __init__(self):
+        self._statements = {}
+        self._prepared = weakref.WeakKeyDictionary()
+        self._prepares = {}
+        self._lock = threading.Lock()
+        # Slow calls are already logged by the query_trace cursor that runs them.
+        self.tracer = QueryTracer(slow_ms=float("inf"))
+
+    def register(self, name, sql, types=None):
+        """Register sql under name; types maps each %(param)s to its SQL type (default PARAM_TYPES)."""
+        statement = PreparedStatement(name, sql, types or PARAM_TYPES)
+        with self._lock:
+            self._statements[name] = statement
+        return statement
+
+    def __contains__(self, name):
+        return name in self._statements
+
+    def execute(self, cursor, name, sql, params):
+        """Run the named statement on cursor, preparing it first if this connection has not.
+
+        sql is registered under name on first use.
+        """
+        statement = self._statements.get(name) or self.register(name, sql)
+        connection = cursor.connection
+        with self._lock:
+            prepared = self._prepared.setdefault(connection, set())
+        caller = _caller()
+        if name not in prepared:
+            cursor.execute(statement.prepare_sql)
+            prepared.add(name)
+            with self._lock:
+                self._prepares[name] = self._prepares.get(name, 0) + 1
+        started = time.perf_counter()
+        try:
+            cursor.execute(statement.execute_sql, statement.args(params))
+        except Exception as e:
+            if isinstance(e, psycopg2.errors.InvalidSqlStatementName):
+                # Deallocated behind our back (DISCARD ALL, a pooler); prepare again next time.
+                prepared.discard(name)
+            self.tracer.record(name, (time.perf_counter() - started) * 1000, 0, caller, failed=True)
+            raise
+        self.tracer.record(name, (time.perf_counter() - started) * 1000, cursor.rowcount, caller)
+        return cursor
+
+    def stats(self):
+        """Return per-statement calls, prepares and latency (see query_trace.StatementStats)."""
+        snapshot = self.tracer.snapshot()
+        with self._lock:
+            prepares = dict(self._prepares)
+            connections = len(self._prepared)
+        statements = {item.pop("sql"): item for item in snapshot["statements"]}
+        for name in self._statements:
+            statements.setdefault(name, {"calls": 0})["prepares"] = prepares.get(name, 0)
+        return {"connections": connections, "statements": statements}
+
+    def reset(self):
+        self.tracer.reset()
+        with self._lock:
+            self._prepares.clear()
+
+
+registry = StatementRegistry()
+
+
+def prepared_statement_stats():
+    """Return the shared registry's per-statement counters."""
+    return registry.stats()
@@ -0,0 +1,227 @@
+import bisect
+import json
+import logging
+import os
+import re
+import signal
+import sys
+import threading
+import time
+
+try:
+    import psycopg2.extensions
+except ImportError:  # SQLite-only installs
+    psycopg2 = None
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended.
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Frames from these modules are skipped when looking for the calling function.
+_INTERNAL_MODULES = ("query_trace", "db_pool", "db_backend", "prepared", "contextlib", "psycopg2")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+# A placeholder, optionally cast (execute_values templates such as %s::uuid).
+_VALUE = r"\?(?:::\w+(?:\[\])?)?"
+_TUPLE = rf"\({_VALUE}(?:\s*,\s*{_VALUE})*\)"
+_REPEATED_TUPLES = re.compile(rf"{_TUPLE}(?:\s*,\s*{_TUPLE})+")
+_REPEATED_VALUES = re.compile(rf"{_VALUE}(?:\s*,\s*{_VALUE})+")
+_WHITESPACE = re.compile(r"\s+")
+
+slow_query_logger = logging.getLogger("library.slow_queries")
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals and placeholders become ?, lists collapse."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _REPEATED_TUPLES.sub("(...)", sql)
+    sql = _REPEATED_VALUES.sub("...", sql)
+    return sql
+
+
+def _caller():
+    """Return module.function of the first frame outside the database plumbing."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_INTERNAL_MODULES):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class StatementStats:
+    __slots__ = ("calls", "errors", "rows", "total_ms", "max_ms", "buckets", "callers")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.callers = {}
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "histogram": dict(zip([f"<={bound}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"], self.buckets)),
+            "callers": dict(self.callers),
+        }
+
+
+class QueryTracer:
+    """Collects per-statement latency histograms and writes the slow-query log."""
+
+    def __init__(self, slow_ms=200, enabled=True):
+        self.slow_ms = slow_ms
+        self.enabled = enabled
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, sql, duration_ms, rows, caller, failed=False):
+        statement = normalize_sql(sql)
+        with self._lock:
+            stats = self._stats.get(statement)
+            if stats is None:
+                stats = self._stats[statement] = StatementStats()
+            stats.calls += 1
+            stats.errors += failed
+            stats.rows += max(rows, 0)
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.buckets[bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+            stats.callers[caller] = stats.callers.get(caller, 0) + 1
+        if duration_ms >= self.slow_ms:
+            slow_query_logger.warning("%.1f ms rows=%d caller=%s sql=%s", duration_ms, rows, caller, statement)
+
+    def snapshot(self):
+        """Return the collected metrics as a JSON-serialisable dict, slowest statements first."""
+        with self._lock:
+            statements = [dict(sql=sql, **stats.as_dict()) for sql, stats in self._stats.items()]
+        statements.sort(key=lambda item: item["total_ms"], reverse=True)
+        return {
+            "since": self.started,
+            "taken_at": time.time(),
+            "slow_ms": self.slow_ms,
+            "statements": statements,
+        }
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.time()
+
+
+def _env_float(name, default):
+    """Read a number setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+def _configure_from_env():
+    tracer = QueryTracer(
+        slow_ms=_env_float("LIBRARY_SLOW_QUERY_MS", 200),
+        enabled=os.environ.get("LIBRARY_QUERY_TRACE", "1") != "0",
+    )
+    log_path = os.environ.get("LIBRARY_SLOW_QUERY_LOG")
+    if log_path:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.WARNING)
+    return tracer
+
+
+tracer = _configure_from_env()
+
+
+def traced_call(cursor, method, sql, *args):
+    """Run method(sql, *args) and record it with the module tracer; rows come from cursor.rowcount."""
+    if not tracer.enabled:
+        return method(sql, *args)
+    caller = _caller()
+    started = time.perf_counter()
+    try:
+        result = method(sql, *args)
+    except Exception:
+        tracer.record(sql, (time.perf_counter() - started) * 1000, 0, caller, failed=True)
+        raise
+    tracer.record(sql, (time.perf_counter() - started) * 1000, cursor.rowcount, caller)
+    return result
+
+
+def _row_count(result):
+    """Rows behind an asyncpg result: a list of records, a status such as "UPDATE 3", or one value."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, str):
+        count = result.rsplit(" ", 1)[-1]
+        return int(count) if count.isdigit() else 0
+    return 0 if result is None else 1
+
+
+async def traced_async(method, sql, *args):
+    """Await method(sql, *args) (e.g. an asyncpg pool's fetch) and record it with the module tracer."""
+    if not tracer.enabled:
+        return await method(sql, *args)
+    caller = _caller()
+    started = time.perf_counter()
+    try:
+        result = await method(sql, *args)
+    except Exception:
+        tracer.record(sql, (time.perf_counter() - started) * 1000, 0, caller, failed=True)
+        raise
+    tracer.record(sql, (time.perf_counter() - started) * 1000, _row_count(result), caller)
+    return result
+
+
+if psycopg2 is not None:
+    class TracingCursor(psycopg2.extensions.cursor):
+        """Cursor that reports every execute/executemany/copy to the module tracer."""
+
+        def execute(self, query, vars=None):
+            return traced_call(self, super().execute, query, vars)
+
+        def executemany(self, query, vars_list):
+            return traced_call(self, super().executemany, query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            return traced_call(self, super().copy_expert, sql, file, size)
+
+
+def metrics_snapshot():
+    """Return the current query metrics (see QueryTracer.snapshot)."""
+    return tracer.snapshot()
+
+
+def install_dump_signal(path, signum=getattr(signal, "SIGUSR1", None)):
+    """Dump a metrics snapshot to path whenever the process receives signum (POSIX only)."""
+    if signum is None:
+        return False
+    signal.signal(signum, lambda *_: tracer.dump(path))
+    return True
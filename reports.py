@@ -0,0 +1,115 @@
+import datetime
+
+import psycopg2
+
+from db_pool import get_connection
+
+# All reports read the summary tables that migration 6 keeps current from a
+# trigger on Borrows, so their cost depends on the size of the answer rather
+# than on how much loan history has accumulated.
+
+TOP_BORROWED_QUERY = """
+    SELECT c.category, b.title, b.author, r.loan_count
+    FROM (SELECT DISTINCT category FROM report_book_loans) c
+    CROSS JOIN LATERAL (
+        SELECT book_id, loan_count
+        FROM report_book_loans
+        WHERE category = c.category AND loan_count > 0
+        ORDER BY loan_count DESC
+        LIMIT %(limit)s
+    ) r
+    JOIN Books b ON b.book_id = r.book_id
+    ORDER BY c.category, r.loan_count DESC, b.title
+"""
+
+OVERDUE_STUDENTS_QUERY = """
+    SELECT s.student_id, s.name, s.email, o.overdue_books, o.oldest_due_date
+    FROM (
+        SELECT student_id, sum(open_count) AS overdue_books, min(due_date) AS oldest_due_date
+        FROM report_open_loans
+        WHERE due_date < %(as_of)s
+        GROUP BY student_id
+    ) o
+    JOIN Students s ON s.student_id = o.student_id
+    ORDER BY o.oldest_due_date, s.name
+"""
+
+UNPAID_FINES_BY_STUDENT_QUERY = """
+    SELECT s.student_id, s.name, s.email, f.unpaid_total, f.unpaid_count
+    FROM report_student_fines f
+    JOIN Students s ON s.student_id = f.student_id
+    WHERE f.unpaid_total > 0
+    ORDER BY f.unpaid_total DESC
+    LIMIT %(limit)s
+"""
+
+# Each day's counts are spread over shards (migration 11).
+DAILY_CIRCULATION_QUERY = """
+    SELECT day, sum(borrowed), sum(returned)
+    FROM report_daily_circulation
+    WHERE day >= %(since)s
+    GROUP BY day
+    ORDER BY day DESC
+"""
+
+RECENT_RETURNS_QUERY = """
+    SELECT b.title, b.author, br.borrow_date, br.actual_return_date
+    FROM Borrows br
+    JOIN Books b ON b.book_id = br.book_id
+    WHERE br.actual_return_date IS NOT NULL AND br.actual_return_date >= %(since)s
+    ORDER BY br.actual_return_date DESC
+    LIMIT %(limit)s
+"""
+
+
+def _fetch_report(name, query, params):
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+    except psycopg2.DatabaseError as e:
+        print(f"Error fetching {name} report: {e}")
+        return []
+
+
+def top_borrowed_by_category(limit=5):
+    """Return (category, title, author, loan_count) for the most borrowed books in each category."""
+    return _fetch_report("top borrowed", TOP_BORROWED_QUERY, {"limit": limit})
+
+
+def overdue_students(as_of=None):
+    """Return (student_id, name, email, overdue_books, oldest_due_date) for students with overdue loans."""
+    return _fetch_report("overdue students", OVERDUE_STUDENTS_QUERY,
+                         {"as_of": as_of or datetime.date.today()})
+
+
+def unpaid_fines_by_student(limit=100):
+    """Return (student_id, name, email, unpaid_total, unpaid_count), largest balance first."""
+    return _fetch_report("unpaid fines", UNPAID_FINES_BY_STUDENT_QUERY, {"limit": limit})
+
+
+def daily_circulation(days=30):
+    """Return (day, borrowed, returned) for each of the last `days` days with activity, newest first."""
+    since = datetime.date.today() - datetime.timedelta(days=days)
+    return _fetch_report("daily circulation", DAILY_CIRCULATION_QUERY, {"since": since})
+
+
+def recent_returns(days=30, limit=500):
+    """Return (title, author, borrow_date, actual_return_date) for returns in the last `days` days."""
+    since = datetime.date.today() - datetime.timedelta(days=days)
+    return _fetch_report("recent returns", RECENT_RETURNS_QUERY, {"since": since, "limit": limit})
+
+
+def rebuild_reports():
+    """Recompute every summary table from Borrows (normally never needed)."""
+    with get_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("SELECT library_report_rebuild()")
+        connection.commit()
+
+
+if __name__ == "__main__":
+    rebuild_reports()
+    print("Circulation reports rebuilt.")
@@ -0,0 +1,224 @@
+import sys
+import uuid
+from array import array
+from collections.abc import Sequence
+
+# Column kinds:
+#   "uuid" - 16 bytes per row in one bytearray, read back as str
+#   "text" - UTF-8 bytes of every value in one bytearray plus an offset array
+#   "int"  - array('q')
+#   "enum" - array('I') of codes into a list of distinct values, each stored
+#            once (categories, departments)
+KINDS = ("uuid", "text", "int", "enum")
+
+
+class _Column:
+    __slots__ = ("name", "kind", "data", "offsets", "values", "codes", "nulls")
+
+    def __init__(self, name, kind):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown column kind {kind!r} for {name!r}")
+        self.name = name
+        self.kind = kind
+        self.nulls = set()
+        self.data = self.offsets = self.values = self.codes = None
+        if kind == "uuid":
+            self.data = bytearray()
+        elif kind == "text":
+            self.data = bytearray()
+            self.offsets = array("Q", [0])
+        elif kind == "int":
+            self.data = array("q")
+        else:
+            self.data = array("I")
+            self.values = []
+            self.codes = {}
+
+    def append(self, position, value):
+        if value is None:
+            self.nulls.add(position)
+        kind = self.kind
+        if kind == "uuid":
+            self.data += uuid.UUID(str(value)).bytes if value is not None else bytes(16)
+        elif kind == "text":
+            if value is not None:
+                self.data += str(value).encode("utf-8")
+            self.offsets.append(len(self.data))
+        elif kind == "int":
+            self.data.append(0 if value is None else int(value))
+        else:
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(sys.intern(value) if isinstance(value, str) else value)
+            self.data.append(code)
+
+    def get(self, position):
+        if position in self.nulls:
+            return None
+        kind = self.kind
+        if kind == "uuid":
+            return str(uuid.UUID(bytes=bytes(self.data[position * 16:position * 16 + 16])))
+        if kind == "text":
+            return self.data[self.offsets[position]:self.offsets[position + 1]].decode("utf-8")
+        if kind == "int":
+            return self.data[position]
+        return self.values[self.data[position]]
+
+    def footprint(self):
+        size = sys.getsizeof(self.data) + sys.getsizeof(self.nulls)
+        if self.offsets is not None:
+            size += sys.getsizeof(self.offsets)
+        if self.values is not None:
+            size += sys.getsizeof(self.values) + sys.getsizeof(self.codes)
+            size += sum(sys.getsizeof(value) for value in self.values)
+        return size
+
+
+class RowView:
+    """A read-only, tuple-like view of one row of a ColumnStore.
+
+    Holds only the store and the row number; values are decoded from the
+    columns when read. Supports indexing (and slicing, which returns a
+    tuple), iteration, len, equality and hashing like the tuple it stands for.
+    """
+
+    __slots__ = ("_store", "_position")
+
+    def __init__(self, store, position):
+        self._store = store
+        self._position = position
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        return self._store._columns[index].get(self._position)
+
+    def __len__(self):
+        return len(self._store._columns)
+
+    def __iter__(self):
+        position = self._position
+        return (column.get(position) for column in self._store._columns)
+
+    def __eq__(self, other):
+        return tuple(self) == (tuple(other) if isinstance(other, (RowView, tuple)) else other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+
+def record_class(name, columns):
+    """Build a RowView subclass that also exposes each column as an attribute."""
+    def accessor(index):
+        return property(lambda self: self._store._columns[index].get(self._position))
+    namespace = {"__slots__": ()}
+    for index, column in enumerate(columns):
+        namespace[column] = accessor(index)
+    return type(name, (RowView,), namespace)
+
+
+class ColumnView(Sequence):
+    """Read-only rows over the columns of a ColumnStore.
+
+    Indexing or iterating yields record views, so code written for lists of
+    row tuples keeps working. It has no append/extend: the rows it covers
+    are fixed when it is made, even if the store it came from grows.
+    """
+
+    def __init__(self, columns, length, record):
+        self._columns = list(columns)
+        self._length = length
+        self.record = record
+
+    @property
+    def names(self):
+        return tuple(column.name for column in self._columns)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self.record(self, index) for index in range(*position.indices(self._length))]
+        if position < 0:
+            position += self._length
+        if not 0 <= position < self._length:
+            raise IndexError("row index out of range")
+        return self.record(self, position)
+
+    def __iter__(self):
+        record = self.record
+        return (record(self, position) for position in range(self._length))
+
+    def value(self, name, position):
+        return self._column(name).get(position)
+
+    def ints(self, name):
+        """The array('q') behind an "int" column (nulls read as 0)."""
+        return self._column(name, "int").data
+
+    def enum(self, name):
+        """(codes, values) behind an "enum" column: values[codes[position]] is the row's value."""
+        column = self._column(name, "enum")
+        return column.data, column.values
+
+    def texts(self, name):
+        """Decode every value of a column, in row order."""
+        column = self._column(name)
+        return (column.get(position) for position in range(self._length))
+
+    def select(self, *names):
+        """A read-only view over only the named columns, sharing their storage."""
+        return ColumnView([self._column(name) for name in names], self._length,
+                          record_class(self.record.__name__, names))
+
+    def _column(self, name, kind=None):
+        for column in self._columns:
+            if column.name == name:
+                if kind and column.kind != kind:
+                    raise TypeError(f"Column {name!r} is {column.kind}, not {kind}")
+                return column
+        raise KeyError(name)
+
+    def memory_footprint(self):
+        """Return {"rows", "bytes", "bytes_per_row", "columns": {name: bytes}} for the column storage."""
+        columns = {column.name: column.footprint() for column in self._columns}
+        total = sum(columns.values())
+        return {
+            "rows": self._length,
+            "bytes": total,
+            "bytes_per_row": total / self._length if self._length else 0.0,
+            "columns": columns,
+        }
+
+
+class ColumnStore(ColumnView):
+    """Rows kept column by column in compact arrays instead of tuples of Python objects.
+
+    columns is a sequence of (name, kind) pairs (see KINDS). Rows are added
+    with append/extend; hand out view() or select() rather than the store
+    itself so readers cannot add rows to shared columns.
+    """
+
+    def __init__(self, columns, rows=(), record_name="Record"):
+        columns = [_Column(name, kind) for name, kind in columns]
+        super().__init__(columns, 0, record_class(record_name, [column.name for column in columns]))
+        self.extend(rows)
+
+    def append(self, row):
+        position = self._length
+        for column, value in zip(self._columns, row):
+            column.append(position, value)
+        self._length += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def view(self):
+        """A read-only view of every column and the rows added so far."""
+        return ColumnView(self._columns, self._length, self.record)
@@ -0,0 +1,110 @@
+import difflib
+import re
+
+import psycopg2
+
+from db_pool import get_connection
+
+# The search indexes (migrations.py) are built on these exact expressions;
+# changing one needs a new migration that indexes the new text.
+STUDENT_DOCUMENT = "(name || ' ' || coalesce(email, '') || ' ' || coalesce(department, ''))"
+BOOK_DOCUMENT = "(title || ' ' || coalesce(author, '') || ' ' || coalesce(isbn, ''))"
+
+# Substring hits rank above fuzzy ones; within each group rows are ordered by
+# trigram word similarity, with a bonus for whole-word full-text matches.
+# Each of the three predicates has its own GIN index (migrations 4 and 9).
+_SEARCH_SQL = """
+    SELECT {columns},
+           (CASE WHEN {document} ILIKE %(like)s THEN 1 ELSE 0 END)
+           + word_similarity(%(q)s, {document})
+           + ts_rank(to_tsvector('simple', {document}), plainto_tsquery('simple', %(q)s)) AS rank
+    FROM {table}
+    WHERE %(q)s <%% {document} OR {document} ILIKE %(like)s
+       OR to_tsvector('simple', {document}) @@ plainto_tsquery('simple', %(q)s)
+    ORDER BY rank DESC, {order}
+    LIMIT %(limit)s
+"""
+
+STUDENT_COLUMNS = ("student_id", "name", "email", "phone", "department")
+BOOK_COLUMNS = ("book_id", "title", "author", "copies_available", "category", "isbn")
+
+
+def install_search_indexes():
+    """Create pg_trgm and the search indexes on Students and Books (migrations 4 and 9)."""
+    import migrations
+    migrations.migrate()
+
+
+def _escape_like(text):
+    return re.sub(r"([\\%_])", r"\\\1", text)
+
+
+def highlight(text, query, start="<b>", stop="</b>"):
+    """Wrap the parts of text that match query (exactly or approximately) in start/stop markers."""
+    if text is None or not query:
+        return text
+    terms = [term.lower() for term in query.split() if term]
+    pieces = []
+    for word in re.split(r"(\W+)", str(text)):
+        lowered = word.lower()
+        match = None
+        for term in terms:
+            position = lowered.find(term)
+            if position >= 0:
+                match = (position, position + len(term))
+                break
+            if len(word) > 2 and difflib.SequenceMatcher(None, lowered, term).ratio() >= 0.75:
+                match = (0, len(word))
+                break
+        if match:
+            word = word[:match[0]] + start + word[match[0]:match[1]] + stop + word[match[1]:]
+        pieces.append(word)
+    return "".join(pieces)
+
+
+def _search(table, columns, document, order, query, limit, highlight_columns):
+    query = (query or "").strip()
+    if not query:
+        return []
+    sql = _SEARCH_SQL.format(columns=", ".join(columns), document=document, table=table, order=order)
+    params = {"q": query, "like": f"%{_escape_like(query)}%", "limit": limit}
+    try:
+        with get_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+    except psycopg2.DatabaseError as e:
+        print(f"Error searching {table}: {e}")
+        return []
+    if highlight_columns:
+        indexes = [columns.index(column) for column in highlight_columns]
+        rows = [
+            tuple(highlight(value, query) if i in indexes else value for i, value in enumerate(row))
+            for row in rows
+        ]
+    return rows
+
+
+def search_students(query, limit=20, highlight_matches=False):
+    """Ranked, typo-tolerant search over student name, email and department.
+
+    Returns (student_id, name, email, phone, department, rank) tuples, best
+    first; with highlight_matches the matched text is wrapped in <b> tags.
+    """
+    return _search("Students", STUDENT_COLUMNS, STUDENT_DOCUMENT, "name, student_id", query, limit,
+                   ("name", "email", "department") if highlight_matches else ())
+
+
+def search_books(query, limit=20, highlight_matches=False):
+    """Ranked, typo-tolerant search over book title, author and ISBN.
+
+    Returns (book_id, title, author, copies_available, category, isbn, rank)
+    tuples, best first; with highlight_matches the matched text is wrapped in <b> tags.
+    """
+    return _search("Books", BOOK_COLUMNS, BOOK_DOCUMENT, "title, book_id", query, limit,
+                   ("title", "author", "isbn") if highlight_matches else ())
+
+
+if __name__ == "__main__":
+    install_search_indexes()
+    print("Search indexes created.")
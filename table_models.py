@@ -0,0 +1,353 @@
+import bisect
+
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent, QObject, QTimer, pyqtSignal
+
+
+class LazyTableModel(QAbstractTableModel):
+    """Table model that pulls rows in chunks from a keyset page function.
+
+    fetch_page(page_token, page_size) must return a dict with "rows" and
+    "next_token", like db_utils.fetch_books_page. `columns` maps each data
+    column to an index in the row tuple; `action_columns` maps extra column
+    numbers to the button label drawn there by ButtonDelegate. With a
+    db_worker.DbRunner, chunks are fetched off the GUI thread.
+
+    Rows are identified by row[key_column]; sort_columns lists the row
+    indexes that make up the keyset order (e.g. [1, 0] for title, book_id)
+    so apply_changes() can put new or renamed rows in place. Text in those
+    columns is compared through collate (set_collate(), e.g. with
+    db_utils.collation_key()) so the model orders rows the way the page
+    query's ORDER BY does; None compares plain str, which matches SQLite and
+    PostgreSQL's "C" collation.
+
+    With fetch_page None the model only shows rows given to set_rows() and
+    never fetches; editable=False makes every cell read-only.
+    """
+
+    def __init__(self, fetch_page, headers, columns, action_columns=None, chunk_size=200, parent=None, runner=None,
+                 key_column=0, sort_columns=None, editable=True, collate=None):
+        super().__init__(parent)
+        self.fetch_page = fetch_page
+        self.headers = list(headers)
+        self.columns = list(columns)
+        self.action_columns = dict(action_columns or {})
+        self.chunk_size = chunk_size
+        self._rows = []
+        self._next_token = None
+        self._exhausted = fetch_page is None
+        self.editable = editable
+        self.runner = runner
+        self._loading = False
+        self._generation = 0
+        self.key_column = key_column
+        self.sort_columns = list(sort_columns or [])
+        self.collate = collate or str
+        # key -> row number; entries from _stale on are out of date until _refresh().
+        self._positions = {}
+        self._stale = None
+        self._sorted = True
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and section < len(self.headers):
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        column = index.column()
+        if column in self.action_columns:
+            return self.action_columns[column]
+        if column >= len(self.columns):
+            return None
+        value = self._rows[index.row()][self.columns[column]]
+        return "" if value is None else str(value)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if self.editable and index.column() < len(self.columns) and index.column() not in self.action_columns:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        """Keep in-place edits in the loaded row so the Edit action can save them."""
+        if role != Qt.EditRole or not (self.flags(index) & Qt.ItemIsEditable):
+            return False
+        row = list(self._rows[index.row()])
+        row[self.columns[index.column()]] = value
+        self._rows[index.row()] = tuple(row)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted or self._loading:
+            return
+        if self.runner is None:
+            try:
+                page = self.fetch_page(self._next_token, self.chunk_size)
+            except Exception as e:
+                print(f"Error fetching rows: {e}")
+                self._exhausted = True
+                return
+            self._append_page(page)
+            return
+
+        self._loading = True
+        generation = self._generation
+        self.runner.run(
+            self.fetch_page, self._next_token, self.chunk_size,
+            on_result=lambda page: self._on_page(generation, page),
+            on_error=lambda message: self._on_page_error(generation, message),
+        )
+
+    def _on_page(self, generation, page):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self._append_page(page)
+
+    def _on_page_error(self, generation, message):
+        if generation != self._generation:
+            return
+        print(f"Error fetching rows: {message}")
+        self._loading = False
+        self._exhausted = True
+
+    def _append_page(self, page):
+        # A row inserted by apply_changes() may come round again in a later chunk.
+        rows = [row for row in page["rows"] if self._key(row) not in self._positions]
+        self._next_token = page["next_token"]
+        self._exhausted = self._next_token is None
+        if rows:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            self._rows.extend(rows)
+            self._mark_stale(start)
+            self._refresh()
+            self.endInsertRows()
+
+    def reload(self):
+        """Drop the loaded rows and fetch the first chunk again."""
+        self.beginResetModel()
+        self._generation += 1
+        self._rows = []
+        self._positions = {}
+        self._stale = None
+        self._sorted = True
+        self._next_token = None
+        self._exhausted = self.fetch_page is None
+        self._loading = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def set_rows(self, rows):
+        """Show a fixed list of rows (e.g. search results) without lazy fetching."""
+        self.beginResetModel()
+        self._generation += 1
+        self._loading = False
+        self._rows = list(rows)
+        self._positions = {}
+        self._stale = 0
+        self._sorted = False
+        self._next_token = None
+        self._exhausted = True
+        self.endResetModel()
+
+    def row_data(self, row):
+        """Return the full row tuple behind a table row."""
+        return self._rows[row]
+
+    def find_keys(self, column, value):
+        """Return the keys of the loaded rows whose row[column] equals value."""
+        return [self._key(row) for row in self._rows if row[column] == value]
+
+    def apply_changes(self, keys, rows):
+        """Bring the rows for `keys` up to date without resetting the model.
+
+        rows holds the current version of every key that still exists; keys
+        missing from it were deleted. Only those rows are updated, moved,
+        inserted or removed, so the selection, scroll position and every
+        other row stay as they are. A new row is only inserted when it falls
+        inside the loaded range (fetchMore brings in the rest) and never
+        into fixed results shown with set_rows().
+
+        Row numbers are refreshed once per call rather than after every
+        change: loaded rows are visited from the bottom up, and in an
+        ordered model each is found again by binary search, since moves
+        above it may have shifted it.
+        """
+        fresh = {self._key(row): row for row in rows}
+        keys = set(map(str, keys))
+        self._refresh()
+        loaded = sorted(
+            ((position, key) for key in keys
+             if (position := self._positions.get(key)) is not None),
+            reverse=True,
+        )
+        current = {key: self._rows[position] for position, key in loaded}
+        for position, key in loaded:
+            if self._ordered():
+                position = self._locate(current[key], position)
+            row = fresh.get(key)
+            if row is None:
+                self._remove_row(position)
+            else:
+                self._update_row(position, row)
+        for key in keys - current.keys():
+            if key in fresh:
+                self._insert_row(fresh[key])
+
+    def _key(self, row):
+        return str(row[self.key_column])
+
+    def _sort_key(self, row):
+        return tuple("" if row[column] is None else self.collate(str(row[column])) for column in self.sort_columns)
+
+    def set_collate(self, collate):
+        """Compare sort-column text through collate from now on (None: plain str)."""
+        self.collate = collate or str
+
+    def _mark_stale(self, position):
+        if self._stale is None or position < self._stale:
+            self._stale = position
+
+    def _refresh(self):
+        """Bring the row numbers in _positions up to date (one pass from the first stale row)."""
+        if self._stale is None:
+            return
+        for position in range(self._stale, len(self._rows)):
+            self._positions[self._key(self._rows[position])] = position
+        self._stale = None
+
+    def _locate(self, row, hint):
+        """Row number of a loaded row whose row number may have shifted since `hint`."""
+        key = self._key(row)
+        if hint < len(self._rows) and self._key(self._rows[hint]) == key:
+            return hint
+        position = bisect.bisect_left(self._rows, self._sort_key(row), key=self._sort_key)
+        while position < len(self._rows) and self._sort_key(self._rows[position]) == self._sort_key(row):
+            if self._key(self._rows[position]) == key:
+                return position
+            position += 1
+        return next(position for position, other in enumerate(self._rows) if self._key(other) == key)
+
+    def _ordered(self):
+        return self._sorted and bool(self.sort_columns)
+
+    def _target(self, row):
+        """Row number a new row belongs at, or None if it lies beyond the loaded rows."""
+        target = bisect.bisect_left(self._rows, self._sort_key(row), key=self._sort_key)
+        if target == len(self._rows) and not self._exhausted:
+            return None
+        return target
+
+    def _insert_row(self, row):
+        if not self._ordered():
+            return
+        target = self._target(row)
+        if target is None:
+            return
+        self.beginInsertRows(QModelIndex(), target, target)
+        self._rows.insert(target, row)
+        self._positions[self._key(row)] = target
+        self._mark_stale(target)
+        self.endInsertRows()
+
+    def _remove_row(self, position):
+        self.beginRemoveRows(QModelIndex(), position, position)
+        del self._positions[self._key(self._rows[position])]
+        del self._rows[position]
+        self._mark_stale(position)
+        self.endRemoveRows()
+
+    def _update_row(self, position, row):
+        if self._ordered() and self._sort_key(row) != self._sort_key(self._rows[position]):
+            target = self._target(row)
+            if target is None:
+                self._remove_row(position)
+                return
+            if target not in (position, position + 1):
+                self.beginMoveRows(QModelIndex(), position, position, QModelIndex(), target)
+                previous = position
+                del self._rows[previous]
+                position = target - 1 if target > previous else target
+                self._rows.insert(position, row)
+                self._mark_stale(min(position, previous))
+                self.endMoveRows()
+        self._rows[position] = row
+        self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.headers) - 1))
+
+
+class ChangeCoalescer(QObject):
+    """Collects changed row keys and flushes them at most once per interval.
+
+    A burst of add() calls (e.g. five books added in a row, or a batch of
+    change notifications) becomes one `changed` emission with every key;
+    request_reload() turns the next flush into a single `reload_requested`.
+    """
+
+    changed = pyqtSignal(set)
+    reload_requested = pyqtSignal()
+
+    def __init__(self, interval_ms=150, parent=None):
+        super().__init__(parent)
+        self._keys = set()
+        self._reload = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._flush)
+
+    def add(self, keys):
+        self._keys.update(str(key) for key in keys if key is not None)
+        self._schedule()
+
+    def request_reload(self):
+        self._reload = True
+        self._schedule()
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        keys, reload = self._keys, self._reload
+        self._keys, self._reload = set(), False
+        if reload:
+            self.reload_requested.emit()
+        elif keys:
+            self.changed.emit(keys)
+
+
+class ButtonDelegate(QStyledItemDelegate):
+    """Paints a push button in a cell and emits `clicked` with its index, without creating widgets."""
+
+    clicked = pyqtSignal(QModelIndex)
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.text = str(index.data() or "")
+        button.state = QStyle.State_Enabled | QStyle.State_Raised
+        QApplication.style().drawControl(QStyle.CE_PushButton, button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and option.rect.contains(event.pos()):
+            self.clicked.emit(index)
+            return True
+        return event.type() in (QEvent.MouseButtonPress, QEvent.MouseButtonDblClick)
+
+    def createEditor(self, parent, option, index):
+        return None